@@ -8,54 +8,51 @@ from livekit.agents import (
     WorkerOptions,
     cli,
     llm,
+    utils,
 )
 from livekit.agents.pipeline import VoicePipelineAgent
 from livekit.plugins import openai, deepgram, silero
 
 from livekit import rtc
 from livekit.agents.llm import ChatMessage, ChatImage
+from frame_sampler import EncodedFrame, FrameSampler, FramePreprocessor
+from context_manager import ChatContextManager, has_image
+from frontend_publisher import FrontendPublisher
+from tool_http import ToolHTTP
+from search_index import MappedIndex
+from tts_cache import CachedTTS
+from agent_metrics import TurnMetrics, timed_tool
+from speculative import SPECULATIVE_LLM, SpeculativeSTT, Speculator
+from worker_load import JobLoad, TrackedLLM, WORKER_LOAD_THRESHOLD, load_fnc, request_fnc
+from session_store import SESSION_STORE, SessionRecorder, SessionStore, load_session
 
 import json
 import asyncio
-import aiohttp
-from typing import Annotated
+import time
+import httpx
+from openai import AsyncOpenAI
+from typing import Annotated, Callable, Optional
 import os
 
 load_dotenv(dotenv_path=".env.local")
 logger = logging.getLogger("voice-agent")
 
-## video
-async def get_video_track(room: rtc.Room):
-    """Find and return the first available remote video track in the room."""
-    for participant_id, participant in room.remote_participants.items():
-        for track_id, track_publication in participant.track_publications.items():
-            if track_publication.track and isinstance(
-                track_publication.track, rtc.RemoteVideoTrack
-            ):
-                logger.info(
-                    f"Found video track {track_publication.track.sid} "
-                    f"from participant {participant_id}"
-                )
-                return track_publication.track
-    raise ValueError("No remote video track found in the room")
-
-
-async def send_text_to_frontend(ctx: JobContext, text: str):
-    # Create your message with a type (topic) and content.
-
-    print("Sending text to frontend! in send_text_to_frontend")
-    message = {
-        "type": "whiteboard_update",
-        "content": text,
-    }
-    data_str = json.dumps(message)
-    data_bytes = data_str.encode("utf-8")
-
-    await ctx.room.local_participant.publish_data(
-        payload=data_bytes,
-        reliable=True,
-        topic="whiteboard_update"  # optional topic if needed
-    )
+# Snapshot of the document server's search index, and how many passages search_text returns
+SEARCH_SNAPSHOT = os.getenv("SEARCH_SNAPSHOT", os.path.join("index", "snapshot.bin"))
+SEARCH_TEXT_TOP_K = int(os.getenv("SEARCH_TEXT_TOP_K", "4"))
+
+LLM_MODEL = "gpt-4o-mini"
+# The voice openai.TTS() used before it was configurable; also part of the phrase cache key
+TTS_MODEL = os.getenv("TTS_MODEL", "tts-1")
+TTS_VOICE = os.getenv("TTS_VOICE", "alloy")
+GREETING_TEXT = "Hey, what would you like to learn today?"
+SYSTEM_PROMPT = (
+    "You are a voice assistant created by LiveKit that can both see (either a canvas or video) and hear. This is you're workspace"
+    "You should use SHORT and concise responses unless student asks to explain, avoiding unpronounceable punctuation. "
+    "When you see an image in our conversation, naturally incorporate what you see "
+    "into your response. Keep visual descriptions brief but informative."
+    "You are the best teacher. You can teach about anything. adapt to the student's learning style. Be able to break problems down."
+)
 
 # async def get_screen_share_track(room: rtc.Room):
 #     """Find and return the first available remote screen share video track."""
@@ -74,24 +71,6 @@ async def send_text_to_frontend(ctx: JobContext, text: str):
 #     raise ValueError("No remote screen share track found in the room")
 
 
-async def get_latest_image(room: rtc.Room):
-    print("get_latest_image!!")
-    """Capture and return a single frame from the video track."""
-    video_stream = None
-    try:
-        video_track = await get_video_track(room)
-        video_stream = rtc.VideoStream(video_track)
-        async for event in video_stream:
-            logger.debug("Captured latest video frame")
-            return event.frame
-    except Exception as e:
-        logger.error(f"Failed to get latest image: {e}")
-        return None
-    finally:
-        if video_stream:
-            await video_stream.aclose()
-
-# video end
 
 # async def send_text_to_whiteboard(ctx: JobContext, text: str):
 #     """Send AI-generated text to whiteboard via LiveKit DataChannel."""
@@ -106,9 +85,108 @@ async def get_latest_image(room: rtc.Room):
 
 def prewarm(proc: JobProcess):
     proc.userdata["vad"] = silero.VAD.load()
+    # Shared by all tool calls in this process; the session opens on first request
+    proc.userdata["http"] = ToolHTTP()
+    # Memory-mapped lazily on the first search and remapped whenever the document server rewrites it
+    proc.userdata["doc_index"] = MappedIndex(SEARCH_SNAPSHOT)
+
+    # Pipeline components are built here, before a job is assigned to this process,
+    # so a room's first turn doesn't pay for constructing them
+    proc.userdata["stt"] = deepgram.STT()
+    # LLM and TTS share one connection pool, so warming it up covers both
+    openai_client = AsyncOpenAI(
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            timeout=httpx.Timeout(connect=15.0, read=5.0, write=5.0, pool=5.0),
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=50, keepalive_expiry=120),
+        ),
+    )
+    proc.userdata["openai_client"] = openai_client
+    proc.userdata["llm"] = openai.LLM(model=LLM_MODEL, client=openai_client)
+    # separate instance so summary calls don't show up in the pipeline's LLM metrics
+    proc.userdata["summary_llm"] = openai.LLM(model=LLM_MODEL, client=openai_client)
+    # Repeated short phrases are played from memory or disk instead of being synthesized again;
+    # the greeting is loaded (or synthesized once) here so it plays instantly on join
+    tts_cache = CachedTTS(
+        openai.TTS(model=TTS_MODEL, voice=TTS_VOICE, client=openai_client),
+        voice=f"openai/{TTS_MODEL}/{TTS_VOICE}",
+    )
+    tts_cache.preload([GREETING_TEXT], lambda: openai.TTS(model=TTS_MODEL, voice=TTS_VOICE))
+    proc.userdata["tts"] = tts_cache
+    proc.userdata["initial_ctx"] = llm.ChatContext().append(role="system", text=SYSTEM_PROMPT)
 
 
-async def entrypoint(ctx: JobContext):
+async def warm_connections(proc: JobProcess):
+    """Open the OpenAI connections the first turn will use while the room is still connecting."""
+    started = time.perf_counter()
+    try:
+        await proc.userdata["openai_client"].models.retrieve(LLM_MODEL)
+    except Exception as e:
+        logger.warning(f"OpenAI connection warm-up failed: {e}")
+        return
+    logger.info(f"Warmed OpenAI connection in {time.perf_counter() - started:.2f}s")
+
+
+def make_prepare_turn(
+    frame_sampler: FrameSampler,
+    frame_preprocessor: FramePreprocessor,
+    context_manager: ChatContextManager,
+    turn_metrics: TurnMetrics,
+):
+    async def prepare_turn(chat_ctx: llm.ChatContext) -> Callable[[VoicePipelineAgent], None]:
+        """
+        Attach the current video frame to a per-turn copy of the context and trim it.
+        Only chat_ctx is changed; the returned function records the frame as sent,
+        keeps it in the session's history and bounds that history.
+        """
+        image_message = None
+
+        def attach_frame(encoded: EncodedFrame):
+            nonlocal image_message
+            image_message = ChatMessage(role="user", content=[ChatImage(image=encoded.url)])
+            chat_ctx.messages.append(image_message)
+            logger.debug("Added latest frame to conversation context")
+
+        with turn_metrics.span("frame_capture"):
+            latest_image = frame_sampler.latest()
+            encoded = await asyncio.to_thread(frame_preprocessor.encode, latest_image) if latest_image else None
+        if encoded:
+            attach_frame(encoded)
+
+        with turn_metrics.span("context_trim"):
+            context_manager.trim(chat_ctx)
+
+        if latest_image and not encoded and not any(has_image(m) for m in chat_ctx.messages):
+            # The frame is unchanged, but the last one sent has since been trimmed away
+            with turn_metrics.span("frame_capture"):
+                encoded = await asyncio.to_thread(frame_preprocessor.encode, latest_image, True)
+            attach_frame(encoded)
+            with turn_metrics.span("context_trim"):
+                context_manager.trim(chat_ctx)
+
+        def commit(assistant: VoicePipelineAgent):
+            # chat_ctx is a per-turn copy; bound the session's own history too so it doesn't grow forever
+            with turn_metrics.span("context_trim"):
+                context_manager.compact(assistant.chat_ctx)
+            if latest_image:
+                frame_preprocessor.record(encoded)
+            if image_message is not None:
+                # kept in the history so unchanged frames can be skipped on later turns
+                assistant.chat_ctx.messages.append(image_message)
+
+        return commit
+
+    return prepare_turn
+
+
+def make_before_llm_cb(
+    frame_sampler: FrameSampler,
+    frame_preprocessor: FramePreprocessor,
+    context_manager: ChatContextManager,
+    turn_metrics: TurnMetrics,
+):
+    prepare_turn = make_prepare_turn(frame_sampler, frame_preprocessor, context_manager, turn_metrics)
 
     async def before_llm_cb(assistant: VoicePipelineAgent, chat_ctx: llm.ChatContext):
         """
@@ -116,33 +194,58 @@ async def entrypoint(ctx: JobContext):
         Captures the current video frame and adds it to the conversation context.
         """
 
-        # truncate msg to latest 15 msgs to prevent ooms :)
-        if len(chat_ctx.messages) > 15:
-            chat_ctx.messages = chat_ctx.messages[-15:]
+        with turn_metrics.span("before_llm_cb"):
+            # evicted turns go into the summary before this turn's context is trimmed
+            with turn_metrics.span("context_trim"):
+                context_manager.compact(assistant.chat_ctx)
+            commit = await prepare_turn(chat_ctx)
+            commit(assistant)
 
+    return before_llm_cb
+
+
+async def entrypoint(ctx: JobContext):
+    warm_task = asyncio.create_task(warm_connections(ctx.proc))
+    ctx.add_shutdown_callback(lambda: utils.aio.gracefully_cancel(warm_task))
+    # Started once the room is connected; keeps the latest camera/canvas frame ready for each turn
+    frame_sampler = FrameSampler(ctx.room)
+    # Downscales frames for the LLM and drops ones that haven't changed since the last turn
+    frame_preprocessor = FramePreprocessor()
+    # Frame CPU and in-flight LLM requests, reported to the worker for load balancing
+    job_load = JobLoad(ctx.job.id, frame_preprocessor)
+    job_load.start()
+    ctx.add_shutdown_callback(lambda: job_load.aclose())
+    # Keeps the conversation inside a token budget, folding old turns into a rolling summary
+    context_manager = ChatContextManager(summary_llm=TrackedLLM(ctx.proc.userdata["summary_llm"], job_load))
+    # Coalesces whiteboard updates and sends them without blocking the caller
+    frontend = FrontendPublisher(ctx.room)
+    # Per-turn stage timings, appended to agent_metrics.jsonl
+    turn_metrics = TurnMetrics(ctx.room.name)
+    ctx.add_shutdown_callback(lambda: turn_metrics.aclose())
+
+    # Chat turns, summary and notes are saved after every turn; a room moved here from another worker resumes from them
+    session_store = SessionStore() if SESSION_STORE else None
+    snapshot_task = asyncio.create_task(load_session(session_store, ctx.job.room.name)) if session_store else None
+
+    before_llm_cb = make_before_llm_cb(frame_sampler, frame_preprocessor, context_manager, turn_metrics)
+    stt = ctx.proc.userdata["stt"]
+    speculator = None
+    if SPECULATIVE_LLM:
+        # Starts the reply on stable interim transcripts and keeps it if the final transcript matches
+        prepare_turn = make_prepare_turn(frame_sampler, frame_preprocessor, context_manager, turn_metrics)
+        speculator = Speculator(before_llm_cb, prepare_turn, turn_metrics)
+        ctx.add_shutdown_callback(lambda: speculator.aclose())
+        stt = SpeculativeSTT(stt, speculator)
+        before_llm_cb = speculator.before_llm_cb
 
-        latest_image = await get_latest_image(ctx.room)
-        if latest_image:
-            image_content = [ChatImage(image=latest_image)]
-            chat_ctx.messages.append(ChatMessage(role="user", content=image_content))
-            logger.debug("Added latest frame to conversation context")
-            print("chat_ctx", chat_ctx)
-
-
-    initial_ctx = llm.ChatContext().append(
-    role="system",
-    text=(
-        "You are a voice assistant created by LiveKit that can both see (either a canvas or video) and hear. This is you're workspace"
-        "You should use SHORT and concise responses unless student asks to explain, avoiding unpronounceable punctuation. "
-        "When you see an image in our conversation, naturally incorporate what you see "
-        "into your response. Keep visual descriptions brief but informative."
-        "You are the best teacher. You can teach about anything. adapt to the student's learning style. Be able to break problems down."
-    ),
-)
 
     logger.info(f"connecting to room {ctx.room.name}")
     # await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
     await ctx.connect(auto_subscribe=AutoSubscribe.SUBSCRIBE_ALL)
+    frame_sampler.start()
+    ctx.add_shutdown_callback(lambda: frame_sampler.aclose())
+    frontend.start()
+    ctx.add_shutdown_callback(lambda: frontend.aclose())
 
     # Wait for the first participant to connect
     participant = await ctx.wait_for_participant()
@@ -152,19 +255,58 @@ async def entrypoint(ctx: JobContext):
     # Other great providers exist like Cartesia and ElevenLabs
     # Learn more and pick the best one for your app:
     # https://docs.livekit.io/agents/plugins
-    fnc_ctx = AssistantFnc(ctx=ctx)
+    http = ctx.proc.userdata["http"]
+    ctx.add_shutdown_callback(lambda: http.aclose())
+    session = None
+    if session_store is not None:
+        session = SessionRecorder(session_store, ctx.job.room.name, context_manager)
+
+        # The snapshot is only needed to resume after a drain, restart or crash; it goes once the student leaves
+        def on_participant_changed(p: rtc.RemoteParticipant, left: bool):
+            if p.identity == participant.identity:
+                session.ended = left
+
+        ctx.room.on("participant_disconnected", lambda p: on_participant_changed(p, True))
+        ctx.room.on("participant_connected", lambda p: on_participant_changed(p, False))
+
+        async def close_session(reason: str):
+            # a drain sends no reason; "room disconnected" means the room has closed
+            await session.aclose(ended=session.ended or reason == "room disconnected")
+            session_store.close()
+
+        ctx.add_shutdown_callback(close_session)
+    fnc_ctx = AssistantFnc(
+        ctx=ctx,
+        frontend=frontend,
+        http=http,
+        doc_index=ctx.proc.userdata["doc_index"],
+        metrics=turn_metrics,
+        session=session,
+    )
+
+    chat_ctx = ctx.proc.userdata["initial_ctx"].copy()
+    snapshot = await snapshot_task if snapshot_task is not None else None
+    if snapshot is not None:
+        restored = session.restore(snapshot, chat_ctx, fnc_ctx)
+        logger.info(f"resuming room {ctx.job.room.name} with {restored} messages from an earlier session")
 
 
     assistant = VoicePipelineAgent(
         vad=ctx.proc.userdata["vad"],
-        stt=deepgram.STT(),
-        llm=openai.LLM(model="gpt-4o-mini"),
-        tts=openai.TTS(),
-        chat_ctx=initial_ctx,
+        stt=stt,
+        llm=TrackedLLM(ctx.proc.userdata["llm"], job_load),
+        tts=ctx.proc.userdata["tts"],
+        chat_ctx=chat_ctx,
         before_llm_cb=before_llm_cb,
         fnc_ctx=fnc_ctx,
     )
 
+    turn_metrics.attach(assistant)
+    if speculator is not None:
+        speculator.attach(assistant)
+    if session is not None:
+        session.attach(assistant)
+        session.start()
     assistant.start(ctx.room, participant)
 
     # @assistant.on("agent_speech_committed")
@@ -194,10 +336,17 @@ async def entrypoint(ctx: JobContext):
 
     
     
-    greeting_text = "Hey, what would you like to learn today?"
-
-    await assistant.say(greeting_text, allow_interruptions=True),
-    await send_text_to_frontend(ctx, greeting_text)
+    if snapshot is not None:
+        # The conversation carries on; the frontend just gets the whiteboard it had again
+        if session.whiteboard:
+            frontend.send_whiteboard(session.whiteboard)
+        return
+
+    # Played from the phrase cache loaded in prewarm
+    frontend.send_whiteboard(GREETING_TEXT)
+    if session is not None:
+        session.set_whiteboard(GREETING_TEXT)
+    await assistant.say(GREETING_TEXT, allow_interruptions=True)
 
     # # Hook into the assistant's chat pipeline to send responses in real time
     # @assistant.on("agent_started_speaking")
@@ -220,13 +369,30 @@ async def entrypoint(ctx: JobContext):
 
 # first define a class that inherits from llm.FunctionContext
 class AssistantFnc(llm.FunctionContext):
-    def __init__(self, ctx: JobContext):
+    def __init__(
+        self,
+        ctx: JobContext,
+        frontend: FrontendPublisher,
+        http: ToolHTTP,
+        doc_index: MappedIndex,
+        metrics: TurnMetrics,
+        session: Optional[SessionRecorder] = None,
+    ):
         self.ctx = ctx
+        self.frontend = frontend
+        # pooled session and response cache for tools that call HTTP APIs
+        self.http = http
+        self.doc_index = doc_index
+        # tool durations, recorded by @timed_tool
+        self.metrics = metrics
+        # notes are kept in the session snapshot
+        self.session = session
         super().__init__()
 
     # the llm.ai_callable decorator marks this function as a tool available to the LLM
     # by default, it'll use the docstring as the function's description
     @llm.ai_callable()
+    @timed_tool
     async def take_notes(
         self,
         notes: Annotated[
@@ -239,65 +405,35 @@ class AssistantFnc(llm.FunctionContext):
         """
         logger.info(f"Taking notes: {notes}")
         notes = "Notes: " + notes
-        # Trigger sending the notes to the frontend.
-        await send_text_to_frontend(self.ctx, notes)
+        # Queued for the frontend; delivery happens in the background.
+        self.frontend.send_whiteboard(notes)
+        if self.session is not None:
+            self.session.add_note(notes)
         # Optionally, return a confirmation message to be included in the LLM's response.
         return f"Notes taken: {notes}"
     
 
-    # @llm.ai_callable()
-    # async def search_text(
-    #     self,
-    #     query: Annotated[
-    #         str, llm.TypeInfo(description="Semantically search what the user uploaded")
-    #     ]
-    # ):
-    #     """
-    #     Search for relevant files based on the given query.
-
-    #     This endpoint sends a GET request to the local search service and returns a structured JSON response.
-        
-    #     Expected response format:
-    #     {
-    #     "query": "What is the capital of France?",
-    #     "answer": "Paris",
-    #     "relevantFiles": [
-    #         {
-    #         "filename": "file1.txt",
-    #         "matchReason": "Contains the word 'Paris'",
-    #         "score": 0.8
-    #         },
-    #         {
-    #         "filename": "file2.pdf",
-    #         "matchReason": "Contains the phrase 'capital city of France'",
-    #         "score": 0.6
-    #         }
-    #     ]
-    #     }
-    #     """
-    #     logger.info(f"Calling search on query: {query}")
-    #     url = "http://127.0.0.1:5000/search"  # URL of your local search endpoint
-
-    #     # Create a client session to perform the HTTP GET request with the query parameter
-    #     async with aiohttp.ClientSession() as session:
-    #         async with session.get(url, params={"query": query}) as response:
-    #             if response.status == 200:
-    #                 # Assuming the search service returns JSON in the desired format
-    #                 result = await response.json()
-    #                 logger.info("Search successful")
-    #                 if "answer" in result:
-    #                     logger.log(f"Recorded the following answer {result["answer"]}")
-    #                     return result["answer"]
-    #                 else:
-    #                     return ""
-    #             else:
-    #                 error_text = await response.text()
-    #                 logger.error(f"Search request failed with status {response.status}: {error_text}")
-    #                 # Optionally, you can raise an error here or return a structured error response
-    #                 return {"error": f"Search request failed: {error_text}"}
-            
-        
     @llm.ai_callable()
+    @timed_tool
+    async def search_text(
+        self,
+        query: Annotated[
+            str, llm.TypeInfo(description="What to look for in the documents the student uploaded")
+        ]
+    ):
+        """
+        Search the documents the student uploaded and return the most relevant passages,
+        with the file name and page they come from.
+        """
+        logger.info(f"Calling search on query: {query}")
+        # In-process BM25 over the memory-mapped index snapshot; no HTTP hop or second model call
+        hits = await asyncio.to_thread(self.doc_index.search, query, SEARCH_TEXT_TOP_K)
+        if not hits:
+            return "No matching passages found in the uploaded documents."
+        return "\n\n".join(f"[{hit.filename}, page {hit.page}]\n{hit.text}" for hit in hits)
+
+    @llm.ai_callable()
+    @timed_tool
     async def get_weather(
         self,
         # by using the Annotated type, arg description and type are available to the LLM
@@ -309,20 +445,22 @@ class AssistantFnc(llm.FunctionContext):
         logger.info(f"getting weather for {location}")
         url = f"https://wttr.in/{location}?format=%C+%t"
         logger.info(f"fetching weather data from {url}")
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    weather_data = await response.text()
-                    # response from the function call is returned to the LLM
-                    # as a tool response. The LLM's response will include this data
-                    return f"The weather in {location} is {weather_data}."
-                else:
-                    raise f"Failed to get weather data, status code: {response.status}"
+        # Conditions change slowly, so repeated questions within 10 minutes are answered from cache
+        response = await self.http.get(url, timeout=5, ttl=600)
+        # response from the function call is returned to the LLM
+        # as a tool response. The LLM's response will include this data
+        return f"The weather in {location} is {response.text()}."
 
 if __name__ == "__main__":
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
             prewarm_fnc=prewarm,
+            # Rooms are declined at WORKER_MAX_SESSIONS or when frame CPU, LLM requests or CPU run high
+            load_fnc=load_fnc,
+            load_threshold=WORKER_LOAD_THRESHOLD,
+            request_fnc=request_fnc,
+            # prewarm synthesizes the greeting, which needs more than the default 10s on a slow network
+            initialize_process_timeout=30.0,
         ),
     )
@@ -0,0 +1,329 @@
+"""
+Per-turn latency spans for the voice agent.
+
+Every job process appends one JSON line per finished turn (and per tool call)
+to AGENT_METRICS_FILE. Stage durations are in seconds, measured from the end
+of the user's speech where noted:
+
+    end_of_utterance   VAD end of speech -> decision to reply (livekit EOU metric)
+    stt_final          VAD end of speech -> final transcript (livekit EOU metric)
+    before_llm_cb      whole callback, with frame_capture and context_trim inside it
+    llm_ttft           first LLM token, for the turn's first LLM call
+    tts_ttfb           first synthesized audio, for the turn's first sentence
+    response_latency   VAD end of speech -> agent starts speaking
+    playout            agent starts speaking -> agent stops speaking
+    speculation_saved  head start of a speculative LLM request that was used (SPECULATIVE_LLM=1)
+
+Speculative before_llm_cb calls are left out of the turn; only the request
+that answers it is timed.
+
+Because each job runs in its own process, the file is the place they meet.
+Aggregate it with:
+
+    python agent_metrics.py summary          # p50/p90/p99 per stage
+    python agent_metrics.py serve [port]     # Prometheus text format on /metrics
+"""
+import bisect
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+logger = logging.getLogger("voice-agent")
+
+AGENT_METRICS_FILE = os.getenv("AGENT_METRICS_FILE", "agent_metrics.jsonl")
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0)
+# Values kept per stage for percentiles; a long-running `serve` samples beyond this
+SAMPLE_SIZE = 10000
+
+# Set in tasks whose work doesn't belong to the current turn, such as speculative before_llm_cb calls
+_untimed = contextvars.ContextVar("untimed", default=False)
+
+
+class TurnMetrics:
+    """
+    Collects the stage timings of each conversational turn of one VoicePipelineAgent.
+
+    Hook it up with `attach(assistant)`, wrap parts of before_llm_cb in
+    `span(name)`, and decorate tools with `timed_tool`.
+    """
+
+    def __init__(self, room: str, path: Optional[str] = AGENT_METRICS_FILE):
+        self.room = room
+        self.path = path
+        self.turns = 0
+        self._turn: Optional[dict] = None
+        self._speech_end = 0.0
+        self._speaking_since: Optional[float] = None
+
+    def attach(self, assistant):
+        assistant.on("user_stopped_speaking", self._on_user_stopped_speaking)
+        assistant.on("agent_started_speaking", self._on_agent_started_speaking)
+        assistant.on("agent_stopped_speaking", self._on_agent_stopped_speaking)
+        assistant.on("metrics_collected", self._on_metrics_collected)
+
+    async def aclose(self):
+        self._finish_turn()
+
+    @staticmethod
+    def exclude_current_task():
+        """Leave what the calling task (and the tasks it starts) records out of the turn."""
+        _untimed.set(True)
+
+    @contextlib.contextmanager
+    def span(self, stage: str):
+        """Time a block; repeated spans of the same stage within a turn add up."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started, accumulate=True)
+
+    def record(self, stage: str, seconds: float, accumulate: bool = False):
+        """Set a stage duration on the current turn; unless accumulating, the first value recorded wins."""
+        if self._turn is None or _untimed.get():
+            return
+        stages = self._turn["stages"]
+        if accumulate:
+            stages[stage] = round(stages.get(stage, 0.0) + seconds, 6)
+        else:
+            stages.setdefault(stage, round(seconds, 6))
+
+    def record_tool(self, tool: str, seconds: float, ok: bool):
+        self._write({"type": "tool", "room": self.room, "ts": time.time(), "tool": tool, "seconds": round(seconds, 6), "ok": ok})
+
+    def record_speculation(self, outcome: str, saved_seconds: float, wasted_tokens: int):
+        """A speculative LLM request that was committed (saving latency) or cancelled (wasting tokens)."""
+        if outcome == "committed":
+            self.record("speculation_saved", saved_seconds)
+        self._write({
+            "type": "speculation", "room": self.room, "ts": time.time(), "outcome": outcome,
+            "savedSeconds": round(saved_seconds, 6), "wastedTokens": wasted_tokens,
+        })
+
+    def _on_user_stopped_speaking(self):
+        # the user may speak again before the agent answers; the turn starts at their last pause
+        if self._turn is not None and "response_latency" in self._turn["stages"]:
+            self._finish_turn()
+        if self._turn is None:
+            self.turns += 1
+            self._turn = {"type": "turn", "room": self.room, "turn": self.turns, "ts": time.time(), "stages": {}}
+        self._speech_end = time.perf_counter()
+
+    def _on_agent_started_speaking(self):
+        self._speaking_since = time.perf_counter()
+        self.record("response_latency", self._speaking_since - self._speech_end)
+
+    def _on_agent_stopped_speaking(self):
+        if self._speaking_since is not None:
+            self.record("playout", time.perf_counter() - self._speaking_since)
+            self._speaking_since = None
+        self._finish_turn()
+
+    def _on_metrics_collected(self, metrics):
+        # matched by attribute so this module doesn't depend on the livekit metrics classes
+        if hasattr(metrics, "end_of_utterance_delay"):
+            self.record("end_of_utterance", metrics.end_of_utterance_delay)
+            self.record("stt_final", metrics.transcription_delay)
+        elif hasattr(metrics, "ttft") and metrics.ttft >= 0:
+            self.record("llm_ttft", metrics.ttft)
+        elif hasattr(metrics, "ttfb") and metrics.ttfb >= 0:
+            self.record("tts_ttfb", metrics.ttfb)
+
+    def _finish_turn(self):
+        turn, self._turn = self._turn, None
+        if turn is not None and turn["stages"]:
+            self._write(turn)
+
+    def _write(self, record: dict):
+        if not self.path:
+            return
+        try:
+            # one short append per line, so concurrent job processes don't interleave
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write agent metrics: {e}")
+
+
+def timed_tool(fn):
+    """Record a tool's duration on `self.metrics` (a TurnMetrics) when it has one. Goes under @llm.ai_callable()."""
+
+    @functools.wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        metrics: Optional[TurnMetrics] = getattr(self, "metrics", None)
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = await fn(self, *args, **kwargs)
+            ok = True
+            return result
+        finally:
+            if metrics is not None:
+                seconds = time.perf_counter() - started
+                metrics.record_tool(fn.__name__, seconds, ok)
+                metrics.record(f"tool:{fn.__name__}", seconds, accumulate=True)
+
+    return wrapper
+
+
+# ================== Aggregation ==================
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Reservoir:
+    """A uniform random sample of at most `size` of the values observed, for percentiles in bounded memory."""
+
+    def __init__(self, size: int = SAMPLE_SIZE):
+        self.size = size
+        self.values: list[float] = []
+        self.count = 0
+
+    def observe(self, value: float):
+        self.count += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            slot = random.randrange(self.count)
+            if slot < self.size:
+                self.values[slot] = value
+
+
+class MetricsFile:
+    """Histograms of every stage and tool in a metrics file, updated incrementally as it grows."""
+
+    def __init__(self, path: str = AGENT_METRICS_FILE):
+        self.path = path
+        self.stages: dict[str, Histogram] = {}
+        self.tools: dict[tuple[str, bool], Histogram] = {}
+        self.samples: dict[str, Reservoir] = {}
+        self.speculations = {"committed": 0, "cancelled": 0}
+        self.speculation_saved_seconds = 0.0
+        self.speculation_wasted_tokens = 0
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def update(self):
+        with self._lock:
+            try:
+                with open(self.path, "rb") as f:
+                    f.seek(self._offset)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break  # partially written; read it next time
+                        self._offset += len(line)
+                        self._add(json.loads(line))
+            except FileNotFoundError:
+                pass
+
+    def _add(self, record: dict):
+        if record.get("type") == "turn":
+            for stage, seconds in record["stages"].items():
+                self.stages.setdefault(stage, Histogram()).observe(seconds)
+                self.samples.setdefault(stage, Reservoir()).observe(seconds)
+        elif record.get("type") == "tool":
+            self.tools.setdefault((record["tool"], record["ok"]), Histogram()).observe(record["seconds"])
+        elif record.get("type") == "speculation":
+            self.speculations[record["outcome"]] = self.speculations.get(record["outcome"], 0) + 1
+            self.speculation_saved_seconds += record["savedSeconds"]
+            self.speculation_wasted_tokens += record["wastedTokens"]
+
+    def prometheus(self) -> str:
+        with self._lock:
+            lines = []
+            series = [
+                ("voice_agent_turn_stage_seconds", "Duration of each stage of a conversational turn",
+                 [(f'stage="{stage}"', h) for stage, h in sorted(self.stages.items())]),
+                ("voice_agent_tool_call_seconds", "Duration of tool calls made by the LLM",
+                 [(f'tool="{tool}",ok="{str(ok).lower()}"', h) for (tool, ok), h in sorted(self.tools.items())]),
+            ]
+            for name, help_text, histograms in series:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for labels, h in histograms:
+                    cumulative = 0
+                    for bound, count in zip(list(h.buckets) + ["+Inf"], h.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f"{name}_sum{{{labels}}} {h.sum}")
+                    lines.append(f"{name}_count{{{labels}}} {h.count}")
+            counters = [
+                ("voice_agent_speculations_total", "Speculative LLM requests by outcome",
+                 [(f'{{outcome="{outcome}"}}', count) for outcome, count in sorted(self.speculations.items())]),
+                ("voice_agent_speculation_saved_seconds_total", "Response latency saved by committed speculative requests",
+                 [("", self.speculation_saved_seconds)]),
+                ("voice_agent_speculation_wasted_tokens_total", "Tokens spent on cancelled speculative requests",
+                 [("", self.speculation_wasted_tokens)]),
+            ]
+            for name, help_text, samples in counters:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                lines += [f"{name}{labels} {value}" for labels, value in samples]
+            return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        def pct(values, q):
+            return values[min(len(values) - 1, int(q * len(values)))]
+
+        rows = [f"{'stage':<24}{'count':>8}{'p50':>10}{'p90':>10}{'p99':>10}"]
+        for stage, sample in sorted(self.samples.items()):
+            values = sorted(sample.values)
+            rows.append(
+                f"{stage:<24}{sample.count:>8}"
+                + "".join(f"{pct(values, q) * 1000:>8.0f}ms" for q in (0.5, 0.9, 0.99))
+            )
+        if sum(self.speculations.values()):
+            rows.append(
+                f"speculation: {self.speculations['committed']} committed, {self.speculations['cancelled']} cancelled, "
+                f"{self.speculation_saved_seconds:.2f}s saved, ~{self.speculation_wasted_tokens} tokens wasted"
+            )
+        return "\n".join(rows)
+
+
+def serve(port: int, path: str = AGENT_METRICS_FILE):
+    metrics_file = MetricsFile(path)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            metrics_file.update()
+            body = metrics_file.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    print(f"Serving metrics from {path} on http://0.0.0.0:{port}/metrics")
+    ThreadingHTTPServer(("0.0.0.0", port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "summary"
+    if command == "serve":
+        serve(int(sys.argv[2]) if len(sys.argv) > 2 else 9464)
+    else:
+        metrics_file = MetricsFile()
+        metrics_file.update()
+        print(metrics_file.summary())
@@ -0,0 +1,378 @@
+"""
+Async (ASGI) serving mode for the document endpoints in flaskApp.py.
+
+Serves the same routes from one event loop so that searches waiting on OpenAI
+don't each hold a thread. Model calls share one pooled AsyncOpenAI client and
+are bounded by a semaphore; database, index and disk work reuses the helpers
+in flaskApp.py and runs in worker threads inside a Flask app context.
+
+Run with:
+    hypercorn asgiApp:app
+or
+    python asgiApp.py
+"""
+import asyncio
+import io
+import os
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from quart import Quart, Response, jsonify, request, send_file
+from quart_cors import cors
+
+import flaskApp
+from flaskApp import (
+    File,
+    IngestJob,
+    QueryResponse,
+    UploadSessionError,
+    cached_file,
+    create_upload_session,
+    db,
+    delete_upload_session,
+    finalize_upload_session,
+    get_upload_session,
+    list_files_page,
+    local_file_matches,
+    lookup_file,
+    page_count,
+    page_preview,
+    page_text,
+    rank_chunks,
+    register_upload,
+    search_cache,
+    search_cache_key,
+    search_cache_stats,
+    previews_available,
+    search_messages,
+    sse,
+    store_upload,
+    upload_session_dict,
+    write_upload_chunk,
+)
+
+flask_app = flaskApp.app
+
+app = Quart(__name__)
+app = cors(app, allow_origin="http://localhost:3000")
+
+MAX_CONCURRENT_SEARCHES = int(os.getenv("ASGI_MAX_CONCURRENT_SEARCHES", "64"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("ASGI_OPENAI_MAX_CONNECTIONS", "100"))
+
+aclient = AsyncOpenAI(
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+            keepalive_expiry=60,
+        )
+    )
+)
+search_slots = asyncio.Semaphore(MAX_CONCURRENT_SEARCHES)
+
+
+async def in_app_context(fn, *args):
+    """Run a blocking flaskApp helper in a worker thread with the Flask app context pushed."""
+    def call():
+        with flask_app.app_context():
+            return fn(*args)
+    return await asyncio.to_thread(call)
+
+
+def cached_answer_or_hits(query: str, endpoint: str):
+    """The cache key and cached answer for a query, and on a miss the chunks to answer it from. Blocks."""
+    # the key reads the index generation, which may reload the index from disk
+    cache_key = search_cache_key(query, endpoint)
+    cached = search_cache.get(cache_key)
+    hits = [] if cached is not None else rank_chunks(query, flask_app.config['SEARCH_TOP_K'])
+    return cache_key, cached, hits
+
+
+@app.before_serving
+async def startup():
+    flaskApp.start_ingest_workers()
+
+
+@app.after_serving
+async def shutdown():
+    await aclient.close()
+
+
+@app.route('/upload', methods=['POST'])
+async def upload_file():
+    files = await request.files
+    if 'file' not in files:
+        return jsonify({"error": "No file provided"}), 400
+
+    file = files['file']
+    if file.filename == '':
+        return jsonify({"error": "Empty filename"}), 400
+
+    def save():
+        content_hash, filepath = store_upload(file.stream, file.filename)
+        job, deduplicated = register_upload(file.filename, content_hash, filepath)
+        return content_hash, deduplicated, job.to_dict()
+
+    content_hash, deduplicated, job = await in_app_context(save)
+    flaskApp.ingest_wakeup.set()
+
+    return jsonify({
+        "message": "File uploaded successfully",
+        "filename": file.filename,
+        "contentHash": content_hash,
+        "deduplicated": deduplicated,
+        "jobId": job["jobId"],
+        "status": job["status"],
+    }), 202
+
+
+@app.route('/upload/<int:job_id>/status', methods=['GET'])
+async def upload_status(job_id):
+    def lookup():
+        job = db.session.get(IngestJob, job_id)
+        return job.to_dict() if job is not None else None
+
+    job = await in_app_context(lookup)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@app.errorhandler(UploadSessionError)
+async def upload_session_error(e):
+    return jsonify({"error": str(e)}), e.status
+
+
+@app.route('/upload/sessions', methods=['POST'])
+async def create_upload():
+    data = await request.get_json() or {}
+
+    def create():
+        session = create_upload_session(
+            data.get("filename"), data.get("size"), data.get("sha256"), data.get("chunkSize")
+        )
+        return upload_session_dict(session)
+
+    return jsonify(await in_app_context(create)), 201
+
+
+@app.route('/upload/sessions/<upload_id>', methods=['GET'])
+async def get_upload(upload_id):
+    return jsonify(await in_app_context(lambda: upload_session_dict(get_upload_session(upload_id))))
+
+
+@app.route('/upload/sessions/<upload_id>', methods=['PUT'])
+async def put_upload_chunk(upload_id):
+    offset = request.headers.get("Upload-Offset", type=int)
+    checksum = request.headers.get("Upload-Checksum")
+    if offset is None or not checksum:
+        return jsonify({"error": "Upload-Offset and Upload-Checksum are required"}), 400
+    # Chunks are at most UPLOAD_MAX_CHUNK_SIZE, so buffering one keeps memory bounded
+    body = await request.get_data()
+
+    def write():
+        session = get_upload_session(upload_id)
+        write_upload_chunk(session, offset, io.BytesIO(body), len(body), checksum)
+        return upload_session_dict(session)
+
+    return jsonify(await in_app_context(write))
+
+
+@app.route('/upload/sessions/<upload_id>', methods=['DELETE'])
+async def delete_upload(upload_id):
+    await in_app_context(lambda: delete_upload_session(get_upload_session(upload_id)))
+    return "", 204
+
+
+@app.route('/upload/sessions/<upload_id>/finalize', methods=['POST'])
+async def finalize_upload(upload_id):
+    def finalize():
+        session = get_upload_session(upload_id)
+        filename = session.filename
+        content_hash, job, deduplicated = finalize_upload_session(session)
+        return filename, content_hash, deduplicated, job.to_dict()
+
+    filename, content_hash, deduplicated, job = await in_app_context(finalize)
+    flaskApp.ingest_wakeup.set()
+
+    return jsonify({
+        "message": "File uploaded successfully",
+        "filename": filename,
+        "contentHash": content_hash,
+        "deduplicated": deduplicated,
+        "jobId": job["jobId"],
+        "status": job["status"],
+    }), 202
+
+
+@app.route('/uploads/<filename>', methods=['GET'])
+async def get_file(filename):
+    entry = await lookup(filename)
+    if entry is None:
+        return jsonify({"error": "File not found"}), 404
+
+    filepath, content_hash, uploaded_at = entry
+    response = await send_file(
+        filepath,
+        attachment_filename=filename,
+        add_etags=False,
+        last_modified=uploaded_at,
+        cache_timeout=flask_app.config['UPLOAD_MAX_AGE'],
+    )
+    response.set_etag(content_hash)
+    await response.make_conditional(request, accept_ranges=True, complete_length=response.content_length)
+    return response
+
+
+async def lookup(filename: str):
+    # Cache hits skip the hop to a worker thread
+    entry = cached_file(filename)
+    if entry is None:
+        entry = await in_app_context(lookup_file, filename)
+    return entry
+
+
+@app.route('/uploads/<filename>/pages', methods=['GET'])
+async def get_pages(filename):
+    entry = await lookup(filename)
+    if entry is None:
+        return jsonify({"error": "File not found"}), 404
+    filepath, content_hash, _ = entry
+    return jsonify({
+        "filename": filename,
+        "pageCount": await in_app_context(page_count, content_hash, filepath),
+        "previews": previews_available() and filepath.lower().endswith('.pdf'),
+    })
+
+
+@app.route('/uploads/<filename>/pages/<int:page_no>/text', methods=['GET'])
+async def get_page_text(filename, page_no):
+    entry = await lookup(filename)
+    if entry is None:
+        return jsonify({"error": "File not found"}), 404
+    filepath, content_hash, uploaded_at = entry
+    text = await in_app_context(page_text, content_hash, filepath, page_no)
+    if text is None:
+        return jsonify({"error": "Page not found"}), 404
+
+    response = Response(text, mimetype="text/plain")
+    response.set_etag(f"{content_hash}-{page_no}")
+    response.last_modified = uploaded_at
+    response.cache_control.max_age = flask_app.config['UPLOAD_MAX_AGE']
+    await response.make_conditional(request)
+    return response
+
+
+@app.route('/uploads/<filename>/pages/<int:page_no>/preview', methods=['GET'])
+async def get_page_preview(filename, page_no):
+    entry = await lookup(filename)
+    if entry is None:
+        return jsonify({"error": "File not found"}), 404
+    filepath, content_hash, uploaded_at = entry
+    path = await in_app_context(page_preview, content_hash, filepath, page_no)
+    if path is None:
+        return jsonify({"error": "Preview not available"}), 404
+
+    response = await send_file(
+        os.path.abspath(path),
+        mimetype="image/jpeg",
+        add_etags=False,
+        last_modified=uploaded_at,
+        cache_timeout=flask_app.config['UPLOAD_MAX_AGE'],
+    )
+    response.set_etag(f"{content_hash}-{page_no}-{flask_app.config['PREVIEW_WIDTH']}")
+    await response.make_conditional(request)
+    return response
+
+
+@app.route('/search', methods=['POST'])
+async def search():
+    data = await request.get_json()
+    query = data.get("query")
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+
+    cache_key, cached, hits = await in_app_context(cached_answer_or_hits, query, "search")
+    if cached is not None:
+        return jsonify(cached.dict())
+
+    async with search_slots:
+        completion = await aclient.beta.chat.completions.parse(
+            model="gpt-4o-mini",
+            messages=search_messages(query, hits),
+            response_format=QueryResponse,
+        )
+
+    structured_response = completion.choices[0].message.parsed
+    search_cache.set(cache_key, structured_response)
+    return jsonify(structured_response.dict())
+
+
+@app.route('/search/stream', methods=['POST'])
+async def search_stream():
+    data = await request.get_json()
+    query = data.get("query")
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+
+    cache_key, cached, hits = await in_app_context(cached_answer_or_hits, query, "stream")
+
+    async def generate():
+        if cached is not None:
+            yield sse("files", [m.dict() for m in cached.relevantFiles])
+            yield sse("token", {"text": cached.answer})
+            yield sse("done", cached.dict())
+            return
+
+        relevant_files = local_file_matches(hits)
+        yield sse("files", [m.dict() for m in relevant_files])
+
+        answer = []
+        try:
+            async with search_slots:
+                stream = await aclient.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=search_messages(query, hits, stream=True),
+                    stream=True,
+                )
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        answer.append(delta)
+                        yield sse("token", {"text": delta})
+        except Exception as e:
+            yield sse("error", {"error": str(e)})
+            return
+
+        response = QueryResponse(query=query, answer="".join(answer), relevantFiles=relevant_files)
+        search_cache.set(cache_key, response)
+        yield sse("done", response.dict())
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route('/search/stats', methods=['GET'])
+async def search_stats():
+    return jsonify(search_cache_stats())
+
+
+@app.route('/files', methods=['GET'])
+async def list_files():
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    try:
+        return jsonify(await in_app_context(list_files_page, request.args.get("cursor"), limit))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+if __name__ == '__main__':
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [os.getenv("ASGI_BIND", "127.0.0.1:5000")]
+    asyncio.run(serve(app, config))
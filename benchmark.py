@@ -0,0 +1,611 @@
+"""
+Offline benchmarks for the document server and the voice agent.
+
+Nothing here talks to LiveKit, Deepgram or OpenAI: OpenAI is replaced by a
+local mock server with configurable latency, STT and TTS by in-process fakes.
+
+    python benchmark.py docs  [--files 50 --pages 10 --searches 200 --concurrency 8 --asgi]
+    python benchmark.py agent [--sessions 4 --turns 50 --llm-latency 0.3 --tts-latency 0.2]
+    python benchmark.py mock-openai --port 8900 --latency 0.2
+
+`docs` generates a PDF/TXT corpus, runs flaskApp.py (or asgiApp.py) in a
+subprocess against a fresh database and drives /upload and /search.
+`agent` runs concurrent scripted sessions through the turn path entrypoint
+sets up: a streaming STT (faked), the same before_llm_cb and context manager,
+the LLM plugin and the phrase-cached TTS, with synthetic video frames. It
+drives these directly rather than through entrypoint and a LiveKit room.
+Both report throughput, p50/p99 latency and peak RSS. Temporary corpora,
+databases and caches are removed afterwards.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from aiohttp import web
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+VOCABULARY = (
+    "photosynthesis chlorophyll mitochondria enzyme protein cell membrane nucleus osmosis diffusion "
+    "derivative integral limit vector matrix eigenvalue polynomial theorem proof lemma "
+    "velocity acceleration momentum energy force gravity friction wave frequency amplitude "
+    "revolution empire treaty parliament economy trade colony constitution reform migration"
+).split()
+
+TRANSCRIPTS = [
+    "Can you explain how photosynthesis works?",
+    "What does the derivative of x squared mean?",
+    "I don't get this step, can you break it down?",
+    "Okay, what should I write in my notes?",
+    "Can you look at my drawing and tell me if it's right?",
+    "Why is momentum conserved here?",
+    "Thanks, that makes sense.",
+    "Can you give me a practice question?",
+]
+
+REPLIES = [
+    "Sure, let's do that. Photosynthesis turns light energy into chemical energy stored in glucose.",
+    "Good question. The derivative tells you how fast the function changes at each point.",
+    "Of course. First we isolate the variable, then we divide both sides by two.",
+    "Great job. Your drawing shows the forces correctly, but the arrow for friction points the wrong way.",
+    "Sure, let's do that. Here is one: what is the integral of two x from zero to three?",
+]
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(name: str, latencies: list[float], wall: float) -> dict:
+    return {
+        "name": name,
+        "count": len(latencies),
+        "throughput": len(latencies) / wall if wall > 0 else 0.0,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+    }
+
+
+def print_report(title: str, rows: list[dict], peak_rss_kb: int):
+    print(f"\n{title}")
+    print(f"{'':<22}{'count':>8}{'per sec':>10}{'p50':>10}{'p99':>10}")
+    for row in rows:
+        latency = "".join(
+            f"{row[q] * 1000:>8.0f}ms" if row[q] is not None else f"{'-':>10}" for q in ("p50", "p99")
+        )
+        print(f"{row['name']:<22}{row['count']:>8}{row['throughput']:>10.1f}{latency}")
+    print(f"peak RSS: {peak_rss_kb / 1024:.1f} MiB")
+
+
+def peak_rss_of(pid: int) -> int:
+    """Peak resident set size in KiB of a running process (Linux)."""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+# ================== Mock OpenAI server ==================
+
+def instance_from_schema(schema: dict, defs: dict):
+    """A minimal value satisfying a (pydantic-generated) JSON schema."""
+    if "$ref" in schema:
+        return instance_from_schema(defs[schema["$ref"].rsplit("/", 1)[-1]], defs)
+    if "anyOf" in schema:
+        return instance_from_schema(schema["anyOf"][0], defs)
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: instance_from_schema(prop, defs) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [instance_from_schema(schema["items"], defs)] if "items" in schema else []
+    if kind == "number":
+        return 0.5
+    if kind == "integer":
+        return 1
+    if kind == "boolean":
+        return False
+    return "mock"
+
+
+def make_mock_openai(latency: float, token_delay: float, embedding_dim: int = 64) -> web.Application:
+    """aiohttp app answering the OpenAI endpoints this project uses, after `latency` seconds."""
+    rng = random.Random(0)
+
+    async def chat_completions(request: web.Request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        model = body.get("model", "mock")
+        created = int(time.time())
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"]["schema"]
+            content = json.dumps(instance_from_schema(schema, schema.get("$defs", {})))
+        else:
+            content = rng.choice(REPLIES)
+        usage = {"prompt_tokens": 100, "completion_tokens": len(content.split()), "total_tokens": 100 + len(content.split())}
+
+        if not body.get("stream"):
+            return web.json_response({
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{
+                    "index": 0, "finish_reason": "stop", "logprobs": None,
+                    "message": {"role": "assistant", "content": content, "refusal": None},
+                }],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(choices, **extra):
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created,
+                     "model": model, "choices": choices, **extra}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+        for n, word in enumerate(content.split(" ")):
+            delta = {"content": word if n == 0 else " " + word}
+            if n == 0:
+                delta["role"] = "assistant"
+            await send([{"index": 0, "delta": delta, "finish_reason": None}])
+            await asyncio.sleep(token_delay)
+        await send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send([], usage=usage)
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def embeddings(request: web.Request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for i, text in enumerate(inputs):
+            seeded = random.Random(hashlib.sha256(str(text).encode()).digest())
+            data.append({"object": "embedding", "index": i, "embedding": [seeded.uniform(-1, 1) for _ in range(embedding_dim)]})
+        return web.json_response({
+            "object": "list", "data": data, "model": body.get("model", "mock"),
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+        })
+
+    async def model(request: web.Request):
+        return web.json_response({"id": request.match_info["model"], "object": "model", "created": 0, "owned_by": "mock"})
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/embeddings", embeddings)
+    app.router.add_get("/v1/models/{model}", model)
+    return app
+
+
+def start_mock_openai(port: int, latency: float, token_delay: float) -> str:
+    """Run the mock server on a background thread; returns its base URL."""
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(make_mock_openai(latency, token_delay))
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{port}/v1"
+
+
+# ================== Document server benchmark ==================
+
+def make_pdf(pages: list[str]) -> bytes:
+    """A minimal uncompressed PDF with one line of Helvetica text per page."""
+    n = len(pages)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(n))}] /Count {n} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        stream = f"BT /F1 10 Tf 36 756 Td ({text}) Tj ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def generate_corpus(folder: str, files: int, pages: int, words: int, pdf_ratio: float, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    paths = []
+    for i in range(files):
+        page_texts = [" ".join(rng.choice(VOCABULARY) for _ in range(words)) for _ in range(pages)]
+        if rng.random() < pdf_ratio:
+            path = os.path.join(folder, f"doc{i:05d}.pdf")
+            data = make_pdf(page_texts)
+        else:
+            path = os.path.join(folder, f"doc{i:05d}.txt")
+            data = "\n".join(page_texts).encode()
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+    return paths
+
+
+def serve_docs(args):
+    """Subprocess entry point: serve flaskApp (threaded) or asgiApp (hypercorn) on args.port."""
+    sys.path.insert(0, REPO_DIR)
+    if args.asgi:
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config
+
+        import asgiApp
+
+        config = Config()
+        config.bind = [f"127.0.0.1:{args.port}"]
+        config.loglevel = "WARNING"
+        asyncio.run(serve(asgiApp.app, config))
+    else:
+        import logging
+
+        import flaskApp
+
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        flaskApp.app.run(host="127.0.0.1", port=args.port, threaded=True, use_reloader=False)
+
+
+def bench_docs(args):
+    base_url = start_mock_openai(args.mock_port, args.openai_latency, args.token_delay)
+    workdir = tempfile.mkdtemp(prefix="docs-bench-")
+    corpus_dir = os.path.join(workdir, "corpus")
+    os.makedirs(corpus_dir)
+    paths = generate_corpus(corpus_dir, args.files, args.pages, args.words, args.pdf_ratio, args.seed)
+    print(f"Generated {len(paths)} files x {args.pages} pages in {corpus_dir}")
+
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=base_url,
+        OPENAI_API_KEY="mock",
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'files.db')}",
+    )
+    command = [sys.executable, os.path.abspath(__file__), "serve-docs", "--port", str(args.port)]
+    if args.asgi:
+        command.append("--asgi")
+    server = subprocess.Popen(command, cwd=workdir, env=env)
+    url = f"http://127.0.0.1:{args.port}"
+    rows = []
+    try:
+        with httpx.Client(base_url=url, timeout=120) as client:
+            for _ in range(300):
+                try:
+                    client.get("/files")
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.1)
+
+            def upload(path):
+                started = time.perf_counter()
+                with open(path, "rb") as f:
+                    r = client.post("/upload", files={"file": (os.path.basename(path), f)})
+                r.raise_for_status()
+                return time.perf_counter() - started, r.json()["jobId"]
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                uploads = list(pool.map(upload, paths))
+            upload_wall = time.perf_counter() - started
+            rows.append(summarize("upload", [u[0] for u in uploads], upload_wall))
+
+            pending = {job_id for _, job_id in uploads}
+            failed = 0
+            deadline = time.monotonic() + args.ingest_timeout
+            while pending:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{len(pending)} uploads still not ingested after {args.ingest_timeout:.0f}s")
+                for job_id in list(pending):
+                    status = client.get(f"/upload/{job_id}/status").json()["status"]
+                    if status in ("done", "failed"):
+                        pending.discard(job_id)
+                        failed += status == "failed"
+                time.sleep(0.05)
+            ingest_wall = time.perf_counter() - started
+            rows.append({
+                "name": "ingest (pages)", "count": len(paths) * args.pages,
+                "throughput": len(paths) * args.pages / ingest_wall, "p50": None, "p99": None,
+            })
+
+            rng = random.Random(args.seed + 1)
+            distinct = [" ".join(rng.sample(VOCABULARY, 2)) for _ in range(args.searches)]
+            queries = [
+                rng.choice(distinct[:max(1, i)]) if rng.random() < args.repeat_ratio else distinct[i]
+                for i in range(args.searches)
+            ]
+
+            def search(query):
+                t = time.perf_counter()
+                client.post("/search", json={"query": query}).raise_for_status()
+                return time.perf_counter() - t
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                latencies = list(pool.map(search, queries))
+            rows.append(summarize("search", latencies, time.perf_counter() - started))
+            cache = client.get("/search/stats").json()
+
+        peak_rss = peak_rss_of(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(f"Document server ({'asgi' if args.asgi else 'flask'}), {failed} failed ingests, "
+                 f"search cache hit rate {cache['hitRate']:.0%}", rows, peak_rss)
+    return {"rows": rows, "peakRssKb": peak_rss, "failedIngests": failed, "searchCache": cache}
+
+
+# ================== Voice agent benchmark ==================
+
+async def bench_agent_async(args):
+    # importing agent pulls in the plugins; the mock server must be configured first
+    base_url = start_mock_openai(args.mock_port, args.llm_latency, args.token_delay)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+    os.environ.setdefault("DEEPGRAM_API_KEY", "mock")
+    sys.path.insert(0, REPO_DIR)
+
+    from types import SimpleNamespace
+
+    from livekit import rtc
+    from livekit.agents import DEFAULT_API_CONNECT_OPTIONS, llm, stt, tts, utils
+    from livekit.plugins import openai
+
+    import agent
+    from agent_metrics import TurnMetrics
+    from context_manager import ChatContextManager
+    from frame_sampler import FramePreprocessor
+    from tts_cache import CachedTTS
+
+    class FakeTTS(tts.TTS):
+        """Emits silence after a fixed delay, about 60ms of audio per character."""
+
+        def __init__(self):
+            super().__init__(capabilities=tts.TTSCapabilities(streaming=False), sample_rate=24000, num_channels=1)
+
+        def synthesize(self, text, *, conn_options=None):
+            return FakeChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+    class FakeChunkedStream(tts.ChunkedStream):
+        async def _run(self):
+            await asyncio.sleep(args.tts_latency)
+            emitter = tts.SynthesizedAudioEmitter(event_ch=self._event_ch, request_id=utils.shortuuid())
+            for _ in range(max(1, len(self.input_text) * 60 // 100)):
+                emitter.push(rtc.AudioFrame(data=bytes(4800), sample_rate=24000, num_channels=1, samples_per_channel=2400))
+            emitter.flush()
+
+    class FakeSTT(stt.STT):
+        """STT that transcribes each utterance (or each flushed one, when streaming) as a random scripted line, after a delay."""
+
+        def __init__(self, seed: int):
+            super().__init__(capabilities=stt.STTCapabilities(streaming=True, interim_results=True))
+            self.rng = random.Random(seed)
+
+        def transcript(self) -> str:
+            return self.rng.choice(TRANSCRIPTS)
+
+        async def _recognize_impl(self, buffer, *, language, conn_options):
+            await asyncio.sleep(args.stt_latency)
+            return stt.SpeechEvent(
+                type=stt.SpeechEventType.FINAL_TRANSCRIPT,
+                alternatives=[stt.SpeechData(language="en", text=self.transcript())],
+            )
+
+        def stream(self, *, language=None, conn_options=DEFAULT_API_CONNECT_OPTIONS):
+            return FakeRecognizeStream(stt=self, conn_options=conn_options)
+
+    class FakeRecognizeStream(stt.RecognizeStream):
+        async def _run(self):
+            frames = 0
+            async for item in self._input_ch:
+                if not isinstance(item, self._FlushSentinel):
+                    frames += 1
+                    continue
+                if not frames:
+                    continue
+                frames = 0
+                text = self._stt.transcript()
+                words = text.split()
+                # an interim result halfway through, then the final transcript
+                await asyncio.sleep(args.stt_latency / 2)
+                self._event_ch.send_nowait(stt.SpeechEvent(
+                    type=stt.SpeechEventType.INTERIM_TRANSCRIPT,
+                    alternatives=[stt.SpeechData(language="en", text=" ".join(words[:max(1, len(words) // 2)]))],
+                ))
+                await asyncio.sleep(args.stt_latency / 2)
+                self._event_ch.send_nowait(stt.SpeechEvent(
+                    type=stt.SpeechEventType.FINAL_TRANSCRIPT,
+                    alternatives=[stt.SpeechData(language="en", text=text)],
+                ))
+
+    class SyntheticFrames:
+        """Stands in for FrameSampler: a gradient that shifts every `change_every` turns."""
+
+        def __init__(self, seed: int):
+            self.turn = 0
+            self.seed = seed
+
+        def latest(self, max_age=None):
+            shift = (self.seed + self.turn // args.frame_change_every) % 256
+            row = bytes((x + shift) % 256 for x in range(args.frame_width)) * 4
+            pixels = b"".join(row[y % 4:] + row[:y % 4] for y in range(args.frame_height))
+            return rtc.VideoFrame(args.frame_width, args.frame_height, rtc.VideoBufferType.RGBA, pixels[:args.frame_width * args.frame_height * 4])
+
+    tts_cache_dir = tempfile.mkdtemp(prefix="tts-bench-")
+    shared_llm = openai.LLM(model=agent.LLM_MODEL)
+    summary_llm = openai.LLM(model=agent.LLM_MODEL)
+    phrase_tts = CachedTTS(FakeTTS(), voice="fake", folder=tts_cache_dir)
+    stages: dict[str, list[float]] = {}
+
+    def record(stage, seconds):
+        stages.setdefault(stage, []).append(seconds)
+
+    async def first_audio(text: str):
+        started = time.perf_counter()
+        first = True
+        async for _ in phrase_tts.synthesize(text):
+            if first:
+                record("tts_ttfb", time.perf_counter() - started)
+                first = False
+
+    async def transcribe(stt_stream) -> str:
+        """Speak one second of (silent) audio and wait for its final transcript."""
+        for _ in range(10):
+            stt_stream.push_frame(rtc.AudioFrame(data=bytes(3200), sample_rate=16000, num_channels=1, samples_per_channel=1600))
+        stt_stream.flush()
+        async for ev in stt_stream:
+            if ev.type == stt.SpeechEventType.FINAL_TRANSCRIPT:
+                return ev.alternatives[0].text
+        raise RuntimeError("STT stream ended without a final transcript")
+
+    async def session(n: int):
+        frames = SyntheticFrames(seed=n)
+        metrics = TurnMetrics(f"bench-{n}", path=None)
+        before_llm_cb = agent.make_before_llm_cb(frames, FramePreprocessor(log_every=10 ** 9), ChatContextManager(summary_llm=summary_llm), metrics)
+        assistant = SimpleNamespace(chat_ctx=llm.ChatContext().append(role="system", text=agent.SYSTEM_PROMPT))
+        stt_stream = FakeSTT(seed=n).stream()
+        try:
+            for turn in range(args.turns):
+                await run_turn(turn, frames, before_llm_cb, assistant, stt_stream)
+        finally:
+            await stt_stream.aclose()
+
+    async def run_turn(turn: int, frames, before_llm_cb, assistant, stt_stream):
+        frames.turn = turn
+        speech_end = time.perf_counter()
+        text = await transcribe(stt_stream)
+        record("stt_final", time.perf_counter() - speech_end)
+        assistant.chat_ctx.append(role="user", text=text)
+
+        started = time.perf_counter()
+        chat_ctx = assistant.chat_ctx.copy()
+        await before_llm_cb(assistant, chat_ctx)
+        record("before_llm_cb", time.perf_counter() - started)
+
+        started = time.perf_counter()
+        stream = shared_llm.chat(chat_ctx=chat_ctx)
+        reply, first_token, tts_task = "", None, None
+        async for chunk in stream:
+            for choice in chunk.choices:
+                if choice.delta.content:
+                    first_token = first_token or time.perf_counter()
+                    reply += choice.delta.content
+            # like the pipeline, speak the first sentence while the rest streams
+            if tts_task is None and any(p in reply for p in ".?!"):
+                sentence = reply[:min(reply.index(p) for p in ".?!" if p in reply) + 1]
+                tts_task = asyncio.create_task(first_audio(sentence))
+        await stream.aclose()
+        record("llm_ttft", (first_token or time.perf_counter()) - started)
+        if tts_task is None:
+            tts_task = asyncio.create_task(first_audio(reply))
+        await tts_task
+        record("response_latency", time.perf_counter() - speech_end)
+        assistant.chat_ctx.append(role="assistant", text=reply)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(session(n) for n in range(args.sessions)))
+    finally:
+        shutil.rmtree(tts_cache_dir, ignore_errors=True)
+    wall = time.perf_counter() - started
+
+    rows = [summarize(stage, values, wall) for stage, values in stages.items()]
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print_report(
+        f"Voice agent: {args.sessions} sessions x {args.turns} turns, "
+        f"TTS phrase cache {phrase_tts.hits} hits / {phrase_tts.misses} misses",
+        rows, peak_rss,
+    )
+    return {"rows": rows, "peakRssKb": peak_rss, "ttsCacheHits": phrase_tts.hits, "ttsCacheMisses": phrase_tts.misses}
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--json", help="also write the results to this file")
+    common.add_argument("--mock-port", type=int, default=8900)
+    common.add_argument("--token-delay", type=float, default=0.01, help="mock OpenAI delay between streamed tokens")
+    common.add_argument("--seed", type=int, default=1)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    docs = commands.add_parser("docs", parents=[common], help="benchmark /upload and /search")
+    docs.add_argument("--files", type=int, default=50)
+    docs.add_argument("--pages", type=int, default=10)
+    docs.add_argument("--words", type=int, default=300, help="words per page")
+    docs.add_argument("--pdf-ratio", type=float, default=0.5)
+    docs.add_argument("--searches", type=int, default=200)
+    docs.add_argument("--repeat-ratio", type=float, default=0.3, help="share of searches repeating an earlier query")
+    docs.add_argument("--concurrency", type=int, default=8)
+    docs.add_argument("--openai-latency", type=float, default=0.2)
+    docs.add_argument("--ingest-timeout", type=float, default=600, help="seconds to wait for all uploads to be ingested")
+    docs.add_argument("--port", type=int, default=5050)
+    docs.add_argument("--asgi", action="store_true", help="serve asgiApp.py with hypercorn instead of flaskApp.py")
+
+    agent_parser = commands.add_parser("agent", parents=[common], help="benchmark the voice agent's turn path")
+    agent_parser.add_argument("--sessions", type=int, default=4)
+    agent_parser.add_argument("--turns", type=int, default=50)
+    agent_parser.add_argument("--stt-latency", type=float, default=0.1)
+    agent_parser.add_argument("--llm-latency", type=float, default=0.3)
+    agent_parser.add_argument("--tts-latency", type=float, default=0.2)
+    agent_parser.add_argument("--frame-width", type=int, default=1280)
+    agent_parser.add_argument("--frame-height", type=int, default=720)
+    agent_parser.add_argument("--frame-change-every", type=int, default=3, help="turns between visible frame changes")
+
+    mock = commands.add_parser("mock-openai", parents=[common], help="run only the mock OpenAI server")
+    mock.add_argument("--port", type=int, default=8900)
+    mock.add_argument("--latency", type=float, default=0.2)
+
+    serve = commands.add_parser("serve-docs", parents=[common], help=argparse.SUPPRESS)
+    serve.add_argument("--port", type=int, required=True)
+    serve.add_argument("--asgi", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "serve-docs":
+        serve_docs(args)
+        return
+    if args.command == "mock-openai":
+        web.run_app(make_mock_openai(args.latency, args.token_delay), host="127.0.0.1", port=args.port)
+        return
+
+    results = bench_docs(args) if args.command == "docs" else asyncio.run(bench_agent_async(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
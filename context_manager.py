@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from livekit.agents import llm
+from livekit.agents.llm import ChatImage, ChatMessage
+
+logger = logging.getLogger("voice-agent")
+
+# Prompt budget for the conversation history, and how many video frames it may hold
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "4000"))
+CONTEXT_MAX_IMAGES = int(os.getenv("CONTEXT_MAX_IMAGES", "2"))
+SUMMARY_MAX_CHARS = int(os.getenv("CONTEXT_SUMMARY_MAX_CHARS", "1500"))
+
+# Rough cost of one downscaled frame; text is estimated at ~4 characters per token
+IMAGE_TOKENS = 800
+MESSAGE_OVERHEAD_TOKENS = 4
+IMAGE_PLACEHOLDER = "[earlier video frame omitted]"
+SUMMARY_MESSAGE_ID = "rolling_summary"
+
+SUMMARY_PROMPT = (
+    "Condense this tutoring conversation into a short summary for the tutor to remember: "
+    "what the student is learning, what has been explained, open questions and notes taken. "
+    f"Plain text, at most {SUMMARY_MAX_CHARS} characters."
+)
+
+
+def message_text(msg: ChatMessage) -> str:
+    content = msg.content
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(c for c in content if isinstance(c, str))
+    return ""
+
+
+def estimate_tokens(msg: ChatMessage) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + len(message_text(msg)) // 4
+    if isinstance(msg.content, list):
+        tokens += IMAGE_TOKENS * sum(isinstance(c, ChatImage) for c in msg.content)
+    for call in msg.tool_calls or []:
+        tokens += len(str(call.raw_arguments)) // 4
+    return tokens
+
+
+def has_image(msg: ChatMessage) -> bool:
+    return isinstance(msg.content, list) and any(isinstance(c, ChatImage) for c in msg.content)
+
+
+class ChatContextManager:
+    """
+    Keeps a chat context inside a token budget for the whole session.
+
+    Leading system messages are pinned, only the newest `max_images` frames are
+    kept (older ones become a text placeholder), and turns that no longer fit
+    are folded into a rolling summary message placed right after the system
+    prompt. With an `llm`, the summary is condensed by the model in the
+    background; until then evicted turns are appended as short excerpts.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = CONTEXT_MAX_TOKENS,
+        max_images: int = CONTEXT_MAX_IMAGES,
+        summary_max_chars: int = SUMMARY_MAX_CHARS,
+        summary_llm: Optional[llm.LLM] = None,
+    ):
+        self.max_tokens = max_tokens
+        self.max_images = max_images
+        self.summary_max_chars = summary_max_chars
+        self.summary_llm = summary_llm
+        self.summary = ""
+        self._excerpts: list[str] = []
+        self._summary_task: Optional[asyncio.Task] = None
+
+    def compact(self, chat_ctx: llm.ChatContext) -> None:
+        """Trim the session's own history in place, folding evicted turns into the summary."""
+        evicted = self._trim(chat_ctx)
+        if evicted:
+            self._add_to_summary(evicted)
+        if self.summary or self._excerpts:
+            self._set_summary_message(chat_ctx)
+
+    def trim(self, chat_ctx: llm.ChatContext) -> None:
+        """Trim a per-turn copy of the context in place and add the current summary; evicted turns are not summarized."""
+        self._trim(chat_ctx)
+        if self.summary or self._excerpts:
+            self._set_summary_message(chat_ctx)
+
+    def _trim(self, chat_ctx: llm.ChatContext) -> list[ChatMessage]:
+        messages = chat_ctx.messages
+        split = 0
+        while split < len(messages) and messages[split].role == "system":
+            split += 1
+        pinned, history = messages[:split], messages[split:]
+
+        self._drop_old_images(history)
+
+        budget = self.max_tokens - sum(estimate_tokens(m) for m in pinned)
+        start = len(history)
+        while start > 0 and budget - estimate_tokens(history[start - 1]) >= 0:
+            start -= 1
+            budget -= estimate_tokens(history[start])
+        # never start on a tool result whose tool call was evicted
+        while start < len(history) and history[start].role == "tool":
+            start += 1
+
+        chat_ctx.messages = pinned + history[start:]
+        return history[:start]
+
+    def _drop_old_images(self, history: list[ChatMessage]):
+        seen = 0
+        for msg in reversed(history):
+            if not has_image(msg):
+                continue
+            seen += 1
+            if seen > self.max_images:
+                msg.content = [IMAGE_PLACEHOLDER if isinstance(c, ChatImage) else c for c in msg.content]
+
+    def snapshot(self) -> dict:
+        """The summary state, for a session snapshot."""
+        return {"summary": self.summary, "excerpts": list(self._excerpts)}
+
+    def restore(self, state: dict) -> None:
+        self.summary = state.get("summary", "")
+        self._excerpts = list(state.get("excerpts", []))
+
+    def summary_text(self) -> str:
+        """The condensed summary followed by the newest excerpts that fit in summary_max_chars."""
+        return "\n".join([self.summary] + self._recent_excerpts()).strip()
+
+    def _recent_excerpts(self) -> list[str]:
+        budget = self.summary_max_chars - len(self.summary)
+        recent = []
+        for line in reversed(self._excerpts):
+            budget -= len(line) + 1
+            if budget < 0:
+                break
+            recent.append(line)
+        return recent[::-1]
+
+    def _add_to_summary(self, evicted: list[ChatMessage]):
+        for msg in evicted:
+            text = message_text(msg).strip()
+            if msg.role in ("user", "assistant") and text and text != IMAGE_PLACEHOLDER:
+                excerpt = text if len(text) <= 200 else text[:200] + "..."
+                self._excerpts.append(f"{msg.role.capitalize()}: {excerpt}")
+
+        size = len(self.summary) + sum(len(line) + 1 for line in self._excerpts)
+        if size <= self.summary_max_chars:
+            return
+        if self.summary_llm is None:
+            # no model to condense with: forget the oldest excerpts
+            self._excerpts = self._recent_excerpts()
+        elif self._summary_task is None or self._summary_task.done():
+            self._summary_task = asyncio.create_task(self._condense(len(self._excerpts)))
+
+    async def _condense(self, count: int):
+        text = "\n".join([self.summary] + self._excerpts[:count]).strip()
+        chat_ctx = llm.ChatContext().append(role="system", text=SUMMARY_PROMPT).append(role="user", text=text)
+        parts = []
+        try:
+            stream = self.summary_llm.chat(chat_ctx=chat_ctx)
+            try:
+                async for chunk in stream:
+                    for choice in chunk.choices:
+                        if choice.delta.content:
+                            parts.append(choice.delta.content)
+            finally:
+                await stream.aclose()
+        except Exception as e:
+            logger.warning(f"Failed to condense conversation summary: {e}")
+            return
+        condensed = "".join(parts).strip()
+        if condensed:
+            self.summary = condensed[: self.summary_max_chars]
+            # excerpts evicted while the model was working stay for the next round
+            self._excerpts = self._excerpts[count:]
+
+    def _set_summary_message(self, chat_ctx: llm.ChatContext):
+        messages = [m for m in chat_ctx.messages if m.id != SUMMARY_MESSAGE_ID]
+        split = 0
+        while split < len(messages) and messages[split].role == "system":
+            split += 1
+        summary = ChatMessage.create(
+            text="Summary of the earlier conversation:\n" + self.summary_text(),
+            role="system",
+            id=SUMMARY_MESSAGE_ID,
+        )
+        chat_ctx.messages = messages[:split] + [summary] + messages[split:]
@@ -1,12 +1,33 @@
-from flask import Flask, request, send_from_directory, jsonify
+from flask import Flask, Response, request, send_file, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS, cross_origin
 import os
-from datetime import datetime
-import PyPDF2
+import re
+import json
+import base64
+import hashlib
+import errno
+import shutil
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
 from pydantic import BaseModel
 from openai import OpenAI
 from dotenv import load_dotenv
+from search_index import SearchIndex, InMemoryVectorStore, filenames_path_for, write_filenames
+from pdf_extract import (
+    extract_pdf,
+    iter_text_pages,
+    load_offsets,
+    preview_path,
+    previews_available,
+    read_page,
+    render_page_range,
+    render_previews,
+)
+from cache import TTLCache
 
 
 load_dotenv(dotenv_path=".env.local")
@@ -14,14 +35,81 @@ app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
 
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///files.db'
+# Uploaded content is stored once per SHA-256, along with its extracted text
+app.config['BLOB_FOLDER'] = os.path.join('uploads', 'blobs')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL", 'sqlite:///files.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Ingestion workers write to the db concurrently with requests; wait for locks instead of failing
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {"connect_args": {"timeout": 30}}
+app.config['INGEST_THREADS'] = int(os.getenv("INGEST_THREADS", "2"))
+app.config['INGEST_PROCESSES'] = int(os.getenv("INGEST_PROCESSES", str(os.cpu_count() or 1)))
+app.config['INDEX_FOLDER'] = 'index'
+# Read-only copy of the BM25 index that the voice agent memory-maps for its search_text tool
+app.config['SEARCH_SNAPSHOT'] = os.getenv("SEARCH_SNAPSHOT", os.path.join('index', 'snapshot.bin'))
+app.config['SEARCH_TOP_K'] = int(os.getenv("SEARCH_TOP_K", "8"))
+app.config['SEARCH_MAX_CONTEXT_CHARS'] = int(os.getenv("SEARCH_MAX_CONTEXT_CHARS", "12000"))
+# Set SEARCH_EMBEDDINGS=1 to fuse OpenAI embedding similarity into the BM25 ranking
+app.config['SEARCH_EMBEDDINGS'] = os.getenv("SEARCH_EMBEDDINGS", "") == "1"
+app.config['SEARCH_CACHE_SIZE'] = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+app.config['SEARCH_CACHE_TTL'] = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+# Browsers revalidate uploads with the content-hash ETag; raise to let them skip the round trip
+app.config['UPLOAD_MAX_AGE'] = int(os.getenv("UPLOAD_MAX_AGE", "0"))
+# Set USE_X_SENDFILE=1 when a fronting web server should send file bodies itself
+app.config['USE_X_SENDFILE'] = os.getenv("USE_X_SENDFILE", "") == "1"
+# Resumable uploads are written chunk by chunk into a preallocated file here until finalized
+app.config['PARTIAL_FOLDER'] = os.path.join('uploads', 'partial')
+app.config['UPLOAD_CHUNK_SIZE'] = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# 16 MiB is also the largest request body asgiApp.py accepts by default
+app.config['UPLOAD_MAX_CHUNK_SIZE'] = int(os.getenv("UPLOAD_MAX_CHUNK_SIZE", str(16 * 1024 * 1024)))
+app.config['UPLOAD_MAX_BYTES'] = int(os.getenv("UPLOAD_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Unfinished uploads untouched for this many seconds are deleted
+app.config['UPLOAD_SESSION_TTL'] = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+# JPEG previews of PDF pages, one folder per content hash (rendered only when pypdfium2 is installed)
+app.config['PREVIEW_FOLDER'] = os.path.join('uploads', 'previews')
+app.config['PREVIEW_WIDTH'] = int(os.getenv("PREVIEW_WIDTH", "320"))
 
 db = SQLAlchemy(app)
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['BLOB_FOLDER'], exist_ok=True)
+os.makedirs(app.config['PARTIAL_FOLDER'], exist_ok=True)
+os.makedirs(app.config['PREVIEW_FOLDER'], exist_ok=True)
 
 client = OpenAI()
 
+def embed_texts(texts: list[str]) -> list[list[float]]:
+    response = client.embeddings.create(model="text-embedding-3-small", input=texts)
+    return [item.embedding for item in response.data]
+
+vector_store = None
+if app.config['SEARCH_EMBEDDINGS']:
+    vector_store = InMemoryVectorStore(embed_texts, os.path.join(app.config['INDEX_FOLDER'], "vectors"))
+search_index = SearchIndex(
+    app.config['INDEX_FOLDER'], vector_store=vector_store, snapshot_path=app.config['SEARCH_SNAPSHOT']
+)
+
+# Answers are cached per (normalized query, corpus version). Anything that changes
+# which files or passages a search can see bumps the version, so stale entries are
+# simply never looked up again and age out of the LRU.
+search_cache = TTLCache(maxsize=app.config['SEARCH_CACHE_SIZE'], ttl=app.config['SEARCH_CACHE_TTL'])
+_corpus_version = 0
+_corpus_lock = threading.Lock()
+
+def bump_corpus_version():
+    global _corpus_version
+    with _corpus_lock:
+        _corpus_version += 1
+
+def search_cache_stats() -> dict:
+    stats = search_cache.stats()
+    stats["corpusVersion"] = _corpus_version
+    return stats
+
+def search_cache_key(query: str, endpoint: str) -> tuple:
+    """Cache key for an answer. /search and /search/stream produce different answers, so each has its own."""
+    normalized = re.sub(r"\s+", " ", query.lower()).strip().rstrip("?!. ")
+    # the index generation covers documents ingested by other server processes
+    return (endpoint, normalized, _corpus_version, search_index.generation)
+
 # ================== Database Models ==================
 
 class File(db.Model):
@@ -29,9 +117,328 @@ class File(db.Model):
     filename = db.Column(db.String(255), unique=True, nullable=False)
     filepath = db.Column(db.String(255), nullable=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    content_hash = db.Column(db.String(64), index=True)
+    size_bytes = db.Column(db.Integer)
+
+    # Serves /files ordering and cursor pagination
+    __table_args__ = (db.Index('ix_file_uploaded_at_id', 'uploaded_at', 'id'),)
+
+class IngestJob(db.Model):
+    """Persisted queue entry for extracting and indexing an uploaded file."""
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('file.id'), nullable=False)
+    content_hash = db.Column(db.String(64), index=True)
+    # queued -> extracting -> indexing -> done | failed
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    pages_total = db.Column(db.Integer)
+    pages_extracted = db.Column(db.Integer, nullable=False, default=0)
+    pages_failed = db.Column(db.Integer, nullable=False, default=0)
+    chunks_indexed = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "jobId": self.id,
+            "fileId": self.file_id,
+            "contentHash": self.content_hash,
+            "status": self.status,
+            "pagesTotal": self.pages_total,
+            "pagesExtracted": self.pages_extracted,
+            "pagesFailed": self.pages_failed,
+            "chunksIndexed": self.chunks_indexed,
+            "error": self.error,
+        }
+
+class UploadSession(db.Model):
+    """A resumable upload in progress. Chunks are written into `filepath`, preallocated to `size_bytes`."""
+    id = db.Column(db.String(32), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    filepath = db.Column(db.String(255), nullable=False)
+    size_bytes = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    # SHA-256 of the whole file, checked at finalize when the client sends one
+    sha256 = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    @property
+    def chunk_count(self) -> int:
+        return -(-self.size_bytes // self.chunk_size)
+
+    def chunk_length(self, index: int) -> int:
+        return min(self.chunk_size, self.size_bytes - index * self.chunk_size)
+
+class UploadChunk(db.Model):
+    """A chunk of an UploadSession that has been written and passed its checksum."""
+    upload_id = db.Column(db.String(32), db.ForeignKey('upload_session.id'), primary_key=True)
+    chunk_index = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False)
+
+# Columns added after the first release. db.create_all() never alters existing
+# tables, so they are added here for databases created by older versions.
+SCHEMA_UPGRADES = {
+    "file": {"content_hash": "VARCHAR(64)", "size_bytes": "INTEGER"},
+    "ingest_job": {"content_hash": "VARCHAR(64)"},
+}
+SCHEMA_INDEXES = {
+    "ix_file_content_hash": ("file", "content_hash"),
+    "ix_ingest_job_content_hash": ("ingest_job", "content_hash"),
+    "ix_file_uploaded_at_id": ("file", "uploaded_at, id"),
+}
+
+def upgrade_schema():
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table, columns in SCHEMA_UPGRADES.items():
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            for name, ddl in columns.items():
+                if name not in existing:
+                    conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+        for index, (table, columns) in SCHEMA_INDEXES.items():
+            conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {index} ON {table} ({columns})")
 
 with app.app_context():
     db.create_all()
+    upgrade_schema()
+
+def text_path_for(filepath: str) -> str:
+    """Path of the extracted text for an uploaded file (the file itself for .txt uploads)."""
+    if filepath.lower().endswith('.pdf'):
+        return filepath.rsplit('.', 1)[0] + ".txt"
+    return filepath
+
+def blob_path(content_hash: str, filename: str) -> str:
+    ext = os.path.splitext(filename)[1].lower()
+    return os.path.join(app.config['BLOB_FOLDER'], content_hash + ext)
+
+def preview_folder_for(content_hash: str) -> str:
+    # Keyed by width too, so changing PREVIEW_WIDTH never serves stale sizes
+    return os.path.join(app.config['PREVIEW_FOLDER'], content_hash, str(app.config['PREVIEW_WIDTH']))
+
+def hash_file(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def index_file(content_hash: str, filename: str, filepath: str) -> int:
+    """Add a blob's extracted text to the search index, keyed by its content hash."""
+    txt_filepath = text_path_for(filepath)
+    if not os.path.exists(txt_filepath):
+        return 0
+    return search_index.add_document(content_hash, filename, iter_text_pages(txt_filepath))
+
+# filename -> (absolute path, content hash, uploaded_at), so /uploads/<filename> skips the db
+file_lookup_cache = TTLCache(maxsize=1024, ttl=300)
+
+def cached_file(filename: str):
+    """
+    The cached lookup_file entry, if its blob still exists. Another server process
+    may have re-pointed the filename and released the old blob since it was cached.
+    """
+    entry = file_lookup_cache.get(filename)
+    if entry is not None and not os.path.exists(entry[0]):
+        file_lookup_cache.pop(filename)
+        return None
+    return entry
+
+def lookup_file(filename: str):
+    """Resolve an uploaded filename to (absolute path, content hash, uploaded_at), or None."""
+    entry = cached_file(filename)
+    if entry is None:
+        record = File.query.filter_by(filename=filename).first()
+        if record is None:
+            return None
+        entry = (os.path.abspath(record.filepath), record.content_hash, record.uploaded_at)
+        file_lookup_cache.set(filename, entry)
+    return entry
+
+# content hash -> per-page byte offsets of its extracted text; content never changes under a hash
+page_offsets_cache = TTLCache(maxsize=256, ttl=3600)
+
+def page_offsets(content_hash: str, filepath: str):
+    """Byte offsets of every page of a PDF's extracted text, or None before extraction has finished."""
+    offsets = page_offsets_cache.get(content_hash)
+    if offsets is None:
+        offsets = load_offsets(text_path_for(filepath))
+        if offsets is not None:
+            page_offsets_cache.set(content_hash, offsets)
+    return offsets
+
+def page_count(content_hash: str, filepath: str):
+    """Number of pages with text; plain-text uploads are one page. None while a PDF is still being extracted."""
+    if not filepath.lower().endswith('.pdf'):
+        return 1
+    offsets = page_offsets(content_hash, filepath)
+    return None if offsets is None else len(offsets)
+
+def page_text(content_hash: str, filepath: str, page_no: int):
+    """Extracted text of one page (numbered from 1), read with a single seek. None if there is no such page."""
+    try:
+        if not filepath.lower().endswith('.pdf'):
+            if page_no != 1:
+                return None
+            with open(filepath, "r", encoding="utf-8", errors="replace") as f:
+                return f.read()
+        offsets = page_offsets(content_hash, filepath)
+        if offsets is None or not 1 <= page_no <= len(offsets):
+            return None
+        return read_page(text_path_for(filepath), page_no, offsets)
+    except FileNotFoundError:
+        return None
+
+def page_preview(content_hash: str, filepath: str, page_no: int):
+    """
+    Path of a page's JPEG preview, or None if the page or a renderer is missing.
+    Files ingested before previews existed have their pages rendered on first request.
+    """
+    if not filepath.lower().endswith('.pdf'):
+        return None
+    folder = preview_folder_for(content_hash)
+    path = preview_path(folder, page_no)
+    if os.path.exists(path):
+        return path
+    count = page_count(content_hash, filepath)
+    if not previews_available() or count is None or not 1 <= page_no <= count:
+        return None
+    os.makedirs(folder, exist_ok=True)
+    render_page_range(filepath, folder, page_no - 1, page_no, app.config['PREVIEW_WIDTH'])
+    return path if os.path.exists(path) else None
+
+def store_upload(stream, filename: str) -> tuple[str, str]:
+    """
+    Stream an upload into the blob store, hashing it as it is written.
+    Identical content is only kept once. Returns (content hash, blob path).
+    """
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=app.config['BLOB_FOLDER'], suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for block in iter(lambda: stream.read(1024 * 1024), b""):
+                digest.update(block)
+                out.write(block)
+        content_hash = digest.hexdigest()
+        filepath = blob_path(content_hash, filename)
+        if os.path.exists(filepath):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return content_hash, filepath
+
+def ingest_job_for(content_hash: str):
+    """Latest job that has ingested (or is ingesting) this content, if it can be reused."""
+    job = (
+        IngestJob.query.filter(IngestJob.content_hash == content_hash, IngestJob.status != 'failed')
+        .order_by(IngestJob.id.desc())
+        .first()
+    )
+    if job is not None and job.status == 'done' and content_hash not in search_index:
+        return None
+    return job
+
+def register_upload(filename: str, content_hash: str, filepath: str):
+    """
+    Point `filename` at stored content, queueing ingestion only if that content
+    has never been ingested. Returns (job, deduplicated).
+    """
+    record = File.query.filter_by(filename=filename).first()
+    previous_hash = None
+    if record is None:
+        record = File(filename=filename, filepath=filepath, content_hash=content_hash)
+        db.session.add(record)
+    else:
+        previous_hash = record.content_hash
+        record.filepath = filepath
+        record.content_hash = content_hash
+        record.uploaded_at = datetime.utcnow()
+    record.size_bytes = os.path.getsize(filepath)
+    db.session.flush()
+
+    job = ingest_job_for(content_hash)
+    deduplicated = job is not None
+    if job is None:
+        job = IngestJob(file_id=record.id, content_hash=content_hash)
+        db.session.add(job)
+    db.session.commit()
+    file_lookup_cache.pop(filename)
+
+    if previous_hash and previous_hash != content_hash:
+        release_content(previous_hash)
+    publish_filenames()
+    bump_corpus_version()
+    return job, deduplicated
+
+_filenames_lock = threading.Lock()
+
+def publish_filenames():
+    """
+    Write the current filenames of every stored content hash next to the search snapshot,
+    so the agent's search_text cites files by the names they have now.
+    """
+    with _filenames_lock:
+        names = {}
+        for content_hash, filename in db.session.query(File.content_hash, File.filename).filter(
+            File.content_hash.isnot(None)
+        ).order_by(File.filename):
+            names.setdefault(content_hash, []).append(filename)
+        try:
+            write_filenames(filenames_path_for(app.config['SEARCH_SNAPSHOT']), names)
+        except OSError:
+            app.logger.exception("Failed to publish filenames for the search snapshot")
+
+def release_content(content_hash: str):
+    """
+    Drop a blob, its extracted text and its index entries once no file refers to it.
+    Content that is still being ingested is released when its job finishes.
+    """
+    if File.query.filter_by(content_hash=content_hash).first() is not None:
+        return
+    if IngestJob.query.filter(
+        IngestJob.content_hash == content_hash, IngestJob.status.in_(['queued', 'extracting', 'indexing'])
+    ).first() is not None:
+        return
+    search_index.remove_document(content_hash)
+    for name in os.listdir(app.config['BLOB_FOLDER']):
+        if name.startswith(content_hash + "."):
+            os.remove(os.path.join(app.config['BLOB_FOLDER'], name))
+    shutil.rmtree(os.path.join(app.config['PREVIEW_FOLDER'], content_hash), ignore_errors=True)
+    page_offsets_cache.pop(content_hash)
+
+def adopt_legacy_files():
+    """Move files uploaded before content hashing into the blob store and queue them for indexing."""
+    for record in File.query.filter(File.content_hash.is_(None)).all():
+        if not os.path.exists(record.filepath):
+            continue
+        content_hash = hash_file(record.filepath)
+        filepath = blob_path(content_hash, record.filename)
+        os.replace(record.filepath, filepath)
+        if record.filepath.lower().endswith('.pdf'):
+            legacy_txt = text_path_for(record.filepath)
+            for legacy in (legacy_txt, legacy_txt.rsplit('.', 1)[0] + ".pages.json"):
+                if os.path.exists(legacy):
+                    os.remove(legacy)
+        search_index.remove_document(record.filename)
+        record.filepath = filepath
+        record.content_hash = content_hash
+        if ingest_job_for(content_hash) is None:
+            db.session.add(IngestJob(file_id=record.id, content_hash=content_hash))
+        db.session.commit()
+
+    for record in File.query.filter(File.size_bytes.is_(None)).all():
+        if os.path.exists(record.filepath):
+            record.size_bytes = os.path.getsize(record.filepath)
+    db.session.commit()
+
+with app.app_context():
+    adopt_legacy_files()
+    publish_filenames()
 
 # Pydantic models for OpenAI structured outputs
 class FileMatch(BaseModel):
@@ -46,28 +453,6 @@ class QueryResponse(BaseModel):
 
 # ================== Helper Functions ==================
 
-def extract_text(filepath: str) -> str:
-    text = ""
-    if filepath.lower().endswith(".pdf"):
-        try:
-            with open(filepath, "rb") as f:
-                reader = PyPDF2.PdfReader(f)
-                for page in reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-        except Exception as e:
-            text = f"Error reading PDF: {str(e)}"
-    elif filepath.lower().endswith(".txt"):
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                text = f.read()
-        except Exception as e:
-            text = f"Error reading TXT file: {str(e)}"
-    else:
-        text = "Unsupported file type"
-    return text
-
 # make txt file
 def make_txt_file(filepath: str, text: str):
     try:
@@ -77,8 +462,419 @@ def make_txt_file(filepath: str, text: str):
     except Exception as e:
         print(f"Error creating file: {e}")
 
+def rank_chunks(query: str, k: int):
+    """Top-k chunks for a query, labelled with the current filename of their content."""
+    hits = search_index.search(query, k=k)
+    hashes = {hit.doc_id for hit in hits}
+    names = {f.content_hash: f.filename for f in File.query.filter(File.content_hash.in_(hashes))}
+    live = []
+    for hit in hits:
+        if hit.doc_id in names:
+            hit.filename = names[hit.doc_id]
+            live.append(hit)
+    return live
+
+def build_context(hits) -> str:
+    """Format ranked chunks for the prompt, capped at SEARCH_MAX_CONTEXT_CHARS."""
+    if not hits:
+        return "(no matching passages in the uploaded files)"
+    budget = app.config['SEARCH_MAX_CONTEXT_CHARS']
+    passages = []
+    for hit in hits:
+        passage = f"# File: {hit.filename} (page {hit.page})\n{hit.text}\n"
+        if passages and len(passage) > budget:
+            break
+        passages.append(passage[:budget])
+        budget -= len(passage)
+    return "\n".join(passages)
+
+def local_file_matches(hits) -> list[FileMatch]:
+    """Collapse ranked chunks into one FileMatch per file, scored relative to the best chunk."""
+    if not hits:
+        return []
+    top = hits[0].score or 1.0
+    matches = {}
+    for hit in hits:
+        if hit.filename not in matches:
+            snippet = hit.text[:160] + ("..." if len(hit.text) > 160 else "")
+            matches[hit.filename] = FileMatch(
+                filename=hit.filename,
+                matchReason=f"Page {hit.page}: {snippet}",
+                score=round(min(1.0, hit.score / top), 3),
+            )
+    return list(matches.values())
+
+def search_messages(query: str, hits, stream: bool = False) -> list[dict]:
+    """Chat messages for answering a query from ranked chunks. The streamed variant asks for plain text."""
+    if stream:
+        task = """Answer the query using the passages from the uploaded files below as well as your own knowledge.
+Keep the answer concise and mention which file it comes from when relevant."""
+    else:
+        task = """You are an AI assistant that helps find relevant files based on a query.
+You are provided with a query and the most relevant passages from the uploaded files.
+Your task is to identify which files are most relevant to the query, and what the answer to the query is
+based on the information in the files as well as your own knowledge. Score should be between 0 and 1."""
+    prompt = f"""
+{task}
+
+## Query:
+{query}
+
+## Passages:
+{build_context(hits)}
+    """
+    return [
+        {"role": "system", "content": "You are a document retrieval assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+def encode_cursor(record: File) -> str:
+    raw = f"{record.uploaded_at.isoformat()}|{record.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Raises ValueError for a malformed cursor."""
+    try:
+        uploaded_at, file_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(uploaded_at), int(file_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def list_files_page(cursor: str = None, limit: int = 50) -> dict:
+    """
+    One page of uploaded files, newest first, read from the File table.
+    Extraction status and page count come from the latest ingest job for each file's content.
+    """
+    query = File.query.order_by(File.uploaded_at.desc(), File.id.desc())
+    if cursor:
+        uploaded_at, file_id = decode_cursor(cursor)
+        query = query.filter(
+            db.or_(File.uploaded_at < uploaded_at, db.and_(File.uploaded_at == uploaded_at, File.id < file_id))
+        )
+    records = query.limit(limit + 1).all()
+    page, more = records[:limit], len(records) > limit
+
+    jobs = {}
+    hashes = {r.content_hash for r in page if r.content_hash}
+    if hashes:
+        for job in IngestJob.query.filter(IngestJob.content_hash.in_(hashes)).order_by(IngestJob.id):
+            jobs[job.content_hash] = job
+
+    files = []
+    for record in page:
+        job = jobs.get(record.content_hash)
+        files.append({
+            "filename": record.filename,
+            "size": record.size_bytes,
+            "pageCount": job.pages_total if job else None,
+            "status": job.status if job else None,
+            "contentHash": record.content_hash,
+            "uploadedAt": record.uploaded_at.isoformat() if record.uploaded_at else None,
+        })
+    return {"files": files, "nextCursor": encode_cursor(page[-1]) if more else None}
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# ================== Resumable Uploads ==================
+# POST /upload/sessions creates an UploadSession and preallocates its file. Each
+# PUT checks one chunk against the client's SHA-256 before writing it at its offset.
+# POST .../finalize moves the file into the blob store and queues ingestion like /upload.
+# Chunks can be sent in any order and again after a failure; GET lists the missing ones.
+# The file's SHA-256 is computed as chunks arrive, so finalize doesn't read the whole file.
+
+class UploadSessionError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+def preallocate(path: str, size: int):
+    """Create a file of `size` bytes, reserving the disk space up front where the filesystem allows."""
+    with open(path, "wb") as f:
+        if size == 0:
+            return
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except AttributeError:
+            f.truncate(size)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+            f.truncate(size)  # filesystem without fallocate support
+
+class UploadHash:
+    """Running SHA-256 over an upload's chunks, folded in file order as they arrive."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.position = 0
+        self.digest = hashlib.sha256()
+
+# Per process; a missing entry (restart, or chunks sent to another process) is rebuilt from the file
+_upload_hashes: dict[str, UploadHash] = {}
+_upload_hashes_lock = threading.Lock()
+
+def advance_upload_hash(session: UploadSession) -> UploadHash:
+    """Fold every received chunk that directly follows the hashed part into the upload's SHA-256."""
+    received = set(received_chunks(session))
+    with _upload_hashes_lock:
+        state = _upload_hashes.setdefault(session.id, UploadHash())
+    with state.lock:
+        if state.position < session.size_bytes and state.position // session.chunk_size in received:
+            with open(session.filepath, "rb") as f:
+                f.seek(state.position)
+                while state.position < session.size_bytes and state.position // session.chunk_size in received:
+                    block = f.read(session.chunk_length(state.position // session.chunk_size))
+                    if not block:
+                        break
+                    state.digest.update(block)
+                    state.position += len(block)
+    return state
+
+def forget_upload_hash(upload_id: str):
+    with _upload_hashes_lock:
+        _upload_hashes.pop(upload_id, None)
+
+def expire_upload_sessions():
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['UPLOAD_SESSION_TTL'])
+    for session in UploadSession.query.filter(UploadSession.updated_at < cutoff).all():
+        delete_upload_session(session)
+
+def delete_upload_session(session: UploadSession):
+    UploadChunk.query.filter_by(upload_id=session.id).delete()
+    db.session.delete(session)
+    db.session.commit()
+    forget_upload_hash(session.id)
+    if os.path.exists(session.filepath):
+        os.remove(session.filepath)
+
+def create_upload_session(filename: str, size, sha256: str = None, chunk_size=None) -> UploadSession:
+    if not filename:
+        raise UploadSessionError("filename is required")
+    if not isinstance(size, int) or size < 0:
+        raise UploadSessionError("size must be a non-negative integer")
+    if size > app.config['UPLOAD_MAX_BYTES']:
+        raise UploadSessionError(f"Uploads are limited to {app.config['UPLOAD_MAX_BYTES']} bytes", 413)
+    chunk_size = chunk_size or app.config['UPLOAD_CHUNK_SIZE']
+    if not isinstance(chunk_size, int) or not 64 * 1024 <= chunk_size <= app.config['UPLOAD_MAX_CHUNK_SIZE']:
+        raise UploadSessionError(f"chunkSize must be between 65536 and {app.config['UPLOAD_MAX_CHUNK_SIZE']} bytes")
+    if sha256 is not None and not re.fullmatch(r"[0-9a-fA-F]{64}", sha256):
+        raise UploadSessionError("sha256 must be a hex SHA-256 digest")
+
+    expire_upload_sessions()
+    upload_id = uuid.uuid4().hex
+    filepath = os.path.join(app.config['PARTIAL_FOLDER'], upload_id + ".part")
+    try:
+        preallocate(filepath, size)
+    except OSError as e:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        if e.errno == errno.ENOSPC:
+            raise UploadSessionError("Not enough disk space for this upload", 507)
+        raise
+    session = UploadSession(
+        id=upload_id, filename=filename, filepath=filepath, size_bytes=size, chunk_size=chunk_size,
+        sha256=sha256.lower() if sha256 else None,
+    )
+    db.session.add(session)
+    db.session.commit()
+    return session
+
+def get_upload_session(upload_id: str) -> UploadSession:
+    session = db.session.get(UploadSession, upload_id)
+    if session is None:
+        raise UploadSessionError("Upload not found", 404)
+    return session
+
+def received_chunks(session: UploadSession) -> list[int]:
+    rows = UploadChunk.query.filter_by(upload_id=session.id).order_by(UploadChunk.chunk_index).all()
+    return [row.chunk_index for row in rows]
+
+def upload_session_dict(session: UploadSession) -> dict:
+    received = received_chunks(session)
+    received_set = set(received)
+    return {
+        "uploadId": session.id,
+        "filename": session.filename,
+        "size": session.size_bytes,
+        "chunkSize": session.chunk_size,
+        "chunkCount": session.chunk_count,
+        "receivedChunks": received,
+        "missingChunks": [i for i in range(session.chunk_count) if i not in received_set],
+        "receivedBytes": sum(session.chunk_length(i) for i in received),
+    }
+
+def write_upload_chunk(session: UploadSession, offset: int, stream, length: int, checksum: str):
+    """
+    Receive one chunk into a temporary file, hashing it on the way, and copy it
+    into the session's file at `offset` only if its SHA-256 matches `checksum`.
+    A failed retry of a chunk that was already received leaves it intact, and
+    a retry with the same content is not written again.
+    """
+    if offset < 0 or offset % session.chunk_size or offset >= session.size_bytes:
+        raise UploadSessionError(f"Upload-Offset must be a multiple of {session.chunk_size} below {session.size_bytes}")
+    index = offset // session.chunk_size
+    expected = session.chunk_length(index)
+    if length != expected:
+        raise UploadSessionError(f"Chunk {index} must be {expected} bytes, got {length}")
+
+    digest = hashlib.sha256()
+    written = 0
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{session.id}.{index}.", suffix=".chunk", dir=app.config['PARTIAL_FOLDER'])
+    try:
+        with os.fdopen(fd, "w+b") as tmp:
+            while written < length:
+                block = stream.read(min(1024 * 1024, length - written))
+                if not block:
+                    break
+                digest.update(block)
+                tmp.write(block)
+                written += len(block)
+            if written != length:
+                raise UploadSessionError(f"Chunk {index} ended after {written} of {length} bytes")
+            if digest.hexdigest() != checksum.strip().lower():
+                raise UploadSessionError(f"Checksum mismatch for chunk {index}", 422)
+
+            stored = db.session.get(UploadChunk, (session.id, index))
+            if stored is None or stored.sha256 != digest.hexdigest():
+                tmp.seek(0)
+                with open(session.filepath, "r+b") as out:
+                    out.seek(offset)
+                    shutil.copyfileobj(tmp, out, 1024 * 1024)
+                    out.flush()
+                    os.fsync(out.fileno())
+                if stored is not None:
+                    # the chunk's content changed, and may already be in the running hash
+                    forget_upload_hash(session.id)
+    finally:
+        os.remove(tmp_path)
+
+    db.session.merge(UploadChunk(upload_id=session.id, chunk_index=index, sha256=digest.hexdigest()))
+    session.updated_at = datetime.utcnow()
+    db.session.commit()
+    advance_upload_hash(session)
+
+def finalize_upload_session(session: UploadSession):
+    """Move a complete upload into the blob store and queue it for ingestion. Returns (content hash, job, deduplicated)."""
+    missing = session.chunk_count - len(received_chunks(session))
+    if missing:
+        raise UploadSessionError(f"{missing} chunks have not been received", 409)
+    content_hash = advance_upload_hash(session).digest.hexdigest()
+    if session.sha256 and content_hash != session.sha256:
+        delete_upload_session(session)
+        raise UploadSessionError("The assembled file does not match sha256; start the upload again", 422)
+
+    # Claimed by deleting the row, so concurrent finalize calls can't both move the file
+    filename, partial_path = session.filename, session.filepath
+    UploadChunk.query.filter_by(upload_id=session.id).delete()
+    if not UploadSession.query.filter_by(id=session.id).delete():
+        db.session.rollback()
+        raise UploadSessionError("Upload not found", 404)
+    db.session.commit()
+    forget_upload_hash(session.id)
+
+    filepath = blob_path(content_hash, filename)
+    if os.path.exists(filepath):
+        os.remove(partial_path)
+    else:
+        os.replace(partial_path, filepath)
+    job, deduplicated = register_upload(filename, content_hash, filepath)
+    return content_hash, job, deduplicated
+
+# ================== Ingestion Workers ==================
+# Uploads are queued as IngestJob rows and processed by a few background threads.
+# PDF parsing is CPU-bound, so the threads hand it to a process pool.
+
+ingest_wakeup = threading.Event()
+_ingest_lock = threading.Lock()
+extract_pool = None
+
+def start_ingest_workers():
+    """Start the ingestion threads once per process and resume jobs interrupted by a restart."""
+    global extract_pool
+    with _ingest_lock:
+        if extract_pool is not None:
+            return
+        extract_pool = ProcessPoolExecutor(max_workers=app.config['INGEST_PROCESSES'])
+        with app.app_context():
+            IngestJob.query.filter(IngestJob.status.in_(['extracting', 'indexing'])).update(
+                {"status": 'queued'}, synchronize_session=False
+            )
+            db.session.commit()
+        for i in range(app.config['INGEST_THREADS']):
+            threading.Thread(target=_ingest_loop, name=f"ingest-{i}", daemon=True).start()
+    ingest_wakeup.set()
+
+def claim_next_job():
+    """Atomically move the oldest queued job to 'extracting' and return it."""
+    while True:
+        job = IngestJob.query.filter_by(status='queued').order_by(IngestJob.id).first()
+        if job is None:
+            return None
+        claimed = IngestJob.query.filter_by(id=job.id, status='queued').update(
+            {"status": 'extracting'}, synchronize_session=False
+        )
+        db.session.commit()
+        if claimed:
+            db.session.refresh(job)
+            return job
+
+def _ingest_loop():
+    while True:
+        with app.app_context():
+            job = claim_next_job()
+            if job is not None:
+                run_ingest_job(job)
+                continue
+        ingest_wakeup.wait(timeout=5)
+        ingest_wakeup.clear()
+
+def run_ingest_job(job: IngestJob):
+    record = File.query.filter_by(content_hash=job.content_hash).first()
+    if record is None:
+        job.status = 'failed'
+        job.error = "No file refers to this content any more"
+        db.session.commit()
+        release_content(job.content_hash)
+        return
+    try:
+        if record.filepath.lower().endswith('.pdf'):
+            def progress(pages_total, pages_done, pages_failed):
+                job.pages_total = pages_total
+                job.pages_extracted = pages_done - pages_failed
+                job.pages_failed = pages_failed
+                db.session.commit()
+
+            extract_pdf(record.filepath, text_path_for(record.filepath), pool=extract_pool, progress=progress)
+        else:
+            job.pages_total = job.pages_extracted = 1
+        job.status = 'indexing'
+        db.session.commit()
+
+        job.chunks_indexed = index_file(job.content_hash, record.filename, record.filepath)
+        if record.filepath.lower().endswith('.pdf'):
+            # Previews are a convenience; a page that fails to render is rendered again on request
+            try:
+                render_previews(
+                    record.filepath, preview_folder_for(job.content_hash), app.config['PREVIEW_WIDTH'], pool=extract_pool
+                )
+            except Exception:
+                app.logger.exception("Rendering previews failed for %s", record.filename)
+        job.status = 'done'
+        bump_corpus_version()
+    except Exception as e:
+        app.logger.exception("Ingestion failed for %s", record.filename)
+        job.status = 'failed'
+        job.error = str(e)
+    db.session.commit()
+    # the file may have been re-pointed at other content while this job ran
+    release_content(job.content_hash)
+
 # ================== API Endpoints ==================
 
+@app.before_request
+def ensure_ingest_workers():
+    start_ingest_workers()
+
 @app.route('/upload', methods=['POST'])
 @cross_origin(origins="http://localhost:3000")
 def upload_file():
@@ -89,33 +885,154 @@ def upload_file():
     if file.filename == '':
         return jsonify({"error": "Empty filename"}), 400
     
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    file.save(filepath)
+    content_hash, filepath = store_upload(file.stream, file.filename)
+
+    # Extraction and indexing happen in the background; poll /upload/<job_id>/status.
+    # Content that was already ingested reuses the earlier job instead of being parsed again.
+    job, deduplicated = register_upload(file.filename, content_hash, filepath)
+    ingest_wakeup.set()
     
-    new_file = File(filename=file.filename, filepath=filepath)
-    db.session.add(new_file)
-    db.session.commit()
+    return jsonify({
+        "message": "File uploaded successfully",
+        "filename": file.filename,
+        "contentHash": content_hash,
+        "deduplicated": deduplicated,
+        "jobId": job.id,
+        "status": job.status,
+    }), 202
 
-    # If the uploaded file is a PDF, create a text version
-    if file.filename.lower().endswith('.pdf'):
-        txt_filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename.rsplit('.', 1)[0] + ".txt")
-        extracted_text = extract_text(filepath)
+@app.route('/upload/<int:job_id>/status', methods=['GET'])
+@cross_origin(origins="http://localhost:3000")
+def upload_status(job_id):
+    job = db.session.get(IngestJob, job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
 
-        # Save extracted text to a .txt file
-        with open(txt_filepath, "w", encoding="utf-8") as txt_file:
-            txt_file.write(extracted_text)
-    
-    return jsonify({"message": "File uploaded successfully", "filename": file.filename})
+@app.errorhandler(UploadSessionError)
+def upload_session_error(e):
+    return jsonify({"error": str(e)}), e.status
+
+# Resumable upload: create a session, PUT each chunk, then finalize.
+# Input: JSON object with "filename", "size" and optionally "sha256" and "chunkSize"
+@app.route('/upload/sessions', methods=['POST'])
+@cross_origin(origins="http://localhost:3000")
+def create_upload():
+    data = request.json or {}
+    session = create_upload_session(data.get("filename"), data.get("size"), data.get("sha256"), data.get("chunkSize"))
+    return jsonify(upload_session_dict(session)), 201
+
+@app.route('/upload/sessions/<upload_id>', methods=['GET'])
+@cross_origin(origins="http://localhost:3000")
+def get_upload(upload_id):
+    return jsonify(upload_session_dict(get_upload_session(upload_id)))
+
+# Body: the raw chunk. Headers: Upload-Offset (byte offset) and Upload-Checksum (hex SHA-256 of the chunk)
+@app.route('/upload/sessions/<upload_id>', methods=['PUT'])
+@cross_origin(origins="http://localhost:3000")
+def put_upload_chunk(upload_id):
+    session = get_upload_session(upload_id)
+    offset = request.headers.get("Upload-Offset", type=int)
+    checksum = request.headers.get("Upload-Checksum")
+    if offset is None or not checksum or request.content_length is None:
+        return jsonify({"error": "Upload-Offset, Upload-Checksum and Content-Length are required"}), 400
+    write_upload_chunk(session, offset, request.stream, request.content_length, checksum)
+    return jsonify(upload_session_dict(session))
+
+@app.route('/upload/sessions/<upload_id>', methods=['DELETE'])
+@cross_origin(origins="http://localhost:3000")
+def delete_upload(upload_id):
+    delete_upload_session(get_upload_session(upload_id))
+    return "", 204
+
+@app.route('/upload/sessions/<upload_id>/finalize', methods=['POST'])
+@cross_origin(origins="http://localhost:3000")
+def finalize_upload(upload_id):
+    session = get_upload_session(upload_id)
+    filename = session.filename
+    content_hash, job, deduplicated = finalize_upload_session(session)
+    ingest_wakeup.set()
+
+    return jsonify({
+        "message": "File uploaded successfully",
+        "filename": filename,
+        "contentHash": content_hash,
+        "deduplicated": deduplicated,
+        "jobId": job.id,
+        "status": job.status,
+    }), 202
 
 @app.route('/uploads/<filename>', methods=['GET'])
 @cross_origin(origins="http://localhost:3000")
 def get_file(filename):
-    file_record = File.query.filter_by(filename=filename).first()
-    if file_record:
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-    else:
+    entry = lookup_file(filename)
+    if entry is None:
         return jsonify({"error": "File not found"}), 404
+
+    # conditional=True answers If-None-Match / If-Modified-Since with 304 and serves Range requests.
+    # Whole-file responses go through wsgi.file_wrapper, which servers such as gunicorn send with sendfile().
+    filepath, content_hash, uploaded_at = entry
+    return send_file(
+        filepath,
+        download_name=filename,
+        conditional=True,
+        etag=content_hash,
+        last_modified=uploaded_at,
+        max_age=app.config['UPLOAD_MAX_AGE'],
+    )
     
+# Page-level access, so a cited page can be shown without downloading the whole file.
+# Output: {"filename", "pageCount", "previews"}; pageCount is null while a PDF is still being extracted
+@app.route('/uploads/<filename>/pages', methods=['GET'])
+@cross_origin(origins="http://localhost:3000")
+def get_pages(filename):
+    entry = lookup_file(filename)
+    if entry is None:
+        return jsonify({"error": "File not found"}), 404
+    filepath, content_hash, _ = entry
+    return jsonify({
+        "filename": filename,
+        "pageCount": page_count(content_hash, filepath),
+        "previews": previews_available() and filepath.lower().endswith('.pdf'),
+    })
+
+@app.route('/uploads/<filename>/pages/<int:page_no>/text', methods=['GET'])
+@cross_origin(origins="http://localhost:3000")
+def get_page_text(filename, page_no):
+    entry = lookup_file(filename)
+    if entry is None:
+        return jsonify({"error": "File not found"}), 404
+    filepath, content_hash, uploaded_at = entry
+    text = page_text(content_hash, filepath, page_no)
+    if text is None:
+        return jsonify({"error": "Page not found"}), 404
+
+    response = Response(text, mimetype="text/plain")
+    response.set_etag(f"{content_hash}-{page_no}")
+    response.last_modified = uploaded_at
+    response.cache_control.max_age = app.config['UPLOAD_MAX_AGE']
+    return response.make_conditional(request)
+
+@app.route('/uploads/<filename>/pages/<int:page_no>/preview', methods=['GET'])
+@cross_origin(origins="http://localhost:3000")
+def get_page_preview(filename, page_no):
+    entry = lookup_file(filename)
+    if entry is None:
+        return jsonify({"error": "File not found"}), 404
+    filepath, content_hash, uploaded_at = entry
+    path = page_preview(content_hash, filepath, page_no)
+    if path is None:
+        return jsonify({"error": "Preview not available"}), 404
+
+    return send_file(
+        os.path.abspath(path),
+        mimetype="image/jpeg",
+        conditional=True,
+        etag=f"{content_hash}-{page_no}-{app.config['PREVIEW_WIDTH']}",
+        last_modified=uploaded_at,
+        max_age=app.config['UPLOAD_MAX_AGE'],
+    )
+
 # Endpoint: Search for relevant files
 # Input: JSON object with a "query" field
 # Output: JSON object with the structured response from OpenAI
@@ -142,45 +1059,18 @@ def search():
     if not query:
         return jsonify({"error": "Query is required"}), 400
 
-    # Retrieve all .txt files in the uploads folder
-    upload_folder = app.config['UPLOAD_FOLDER']
-    txt_files = [f for f in os.listdir(upload_folder) if f.lower().endswith('.txt')]
-
-    # Extract text from each .txt file
-    file_texts = []
-    for filename in txt_files:
-        filepath = os.path.join(upload_folder, filename)
-        try:
-            with open(filepath, "r", encoding="utf-8") as file:
-                text = file.read()
-            file_texts.append(f"# File: {filename}\n{text}\n")
-        except Exception as e:
-            file_texts.append(f"# File: {filename}\nError reading file: {str(e)}\n")
-
-    # Combine all file texts into one string
-    combined_text = "\n".join(file_texts)
-
-    # Build the prompt for OpenAI
-    prompt = f"""
-You are an AI assistant that helps find relevant files based on a query.
-You are provided with a query and a list of files with their contents.
-Your task is to identify which files are most relevant to the query, and what the answer to the query is
-based on the information in the files as well as your own knowledge. Score should be between 0 and 1.
-
-## Query:
-{query}
+    cache_key = search_cache_key(query, "search")
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached.dict())
 
-## Files:
-{combined_text}
-    """
+    # Rank chunks locally and only send the best ones to the model
+    hits = rank_chunks(query, app.config['SEARCH_TOP_K'])
 
     # Use the beta parse method to obtain a structured response via the QueryResponse model
     completion = client.beta.chat.completions.parse(
         model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a document retrieval assistant."},
-            {"role": "user", "content": prompt}
-        ],
+        messages=search_messages(query, hits),
         response_format=QueryResponse,
     )
 
@@ -188,13 +1078,77 @@ based on the information in the files as well as your own knowledge. Score shoul
     structured_response = completion.choices[0].message.parsed
 
     print("structured_response", structured_response)
+    search_cache.set(cache_key, structured_response)
     return jsonify(structured_response.dict())
 
+# Endpoint: Streaming search over Server-Sent Events
+# Input: JSON object with a "query" field (same as /search)
+# Output: text/event-stream with the events
+#   files  - locally ranked relevantFiles, sent before the model is called
+#   token  - {"text": ...} answer deltas as the model produces them
+#   done   - the complete QueryResponse
+#   error  - {"error": ...} if the model call fails
+@app.route('/search/stream', methods=['POST'])
+@cross_origin(origins="http://localhost:3000")
+def search_stream():
+    data = request.json
+    query = data.get("query")
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+
+    cache_key = search_cache_key(query, "stream")
+    cached = search_cache.get(cache_key)
+    hits = [] if cached is not None else rank_chunks(query, app.config['SEARCH_TOP_K'])
+
+    def generate():
+        if cached is not None:
+            yield sse("files", [m.dict() for m in cached.relevantFiles])
+            yield sse("token", {"text": cached.answer})
+            yield sse("done", cached.dict())
+            return
+
+        relevant_files = local_file_matches(hits)
+        yield sse("files", [m.dict() for m in relevant_files])
+
+        answer = []
+        try:
+            stream = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=search_messages(query, hits, stream=True),
+                stream=True,
+            )
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    answer.append(delta)
+                    yield sse("token", {"text": delta})
+        except Exception as e:
+            yield sse("error", {"error": str(e)})
+            return
+
+        response = QueryResponse(query=query, answer="".join(answer), relevantFiles=relevant_files)
+        search_cache.set(cache_key, response)
+        yield sse("done", response.dict())
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route('/search/stats', methods=['GET'])
+@cross_origin(origins="http://localhost:3000")
+def search_stats():
+    return jsonify(search_cache_stats())
+
 @app.route('/files', methods=['GET'])
 @cross_origin(origins="http://localhost:3000")
 def list_files():
-    files = os.listdir(app.config['UPLOAD_FOLDER'])
-    return jsonify(files)
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    try:
+        return jsonify(list_files_page(request.args.get("cursor"), limit))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,220 @@
+import asyncio
+import base64
+import io
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from livekit import rtc
+from PIL import Image
+
+logger = logging.getLogger("voice-agent")
+
+# Longest side of frames sent to the LLM, and the JPEG size budget per frame
+FRAME_MAX_SIZE = int(os.getenv("FRAME_MAX_SIZE", "768"))
+FRAME_JPEG_QUALITY = int(os.getenv("FRAME_JPEG_QUALITY", "70"))
+FRAME_MAX_BYTES = int(os.getenv("FRAME_MAX_BYTES", "100000"))
+# Frames whose 64-bit difference hash is within this many bits of the last frame sent are skipped
+FRAME_HASH_THRESHOLD = int(os.getenv("FRAME_HASH_THRESHOLD", "4"))
+
+
+class FrameSampler:
+    """
+    Keeps the most recent frame of a remote video track in the room.
+
+    The sampler subscribes to one track for the lifetime of the session and
+    follows track subscribe/unsubscribe events, so reading the current frame
+    is a plain attribute access instead of opening a VideoStream per turn.
+    """
+
+    def __init__(self, room: rtc.Room):
+        self._room = room
+        self._track: Optional[rtc.RemoteVideoTrack] = None
+        self._task: Optional[asyncio.Task] = None
+        # single-slot buffer: only the newest frame is ever kept
+        self._frame: Optional[rtc.VideoFrame] = None
+        self._frame_time = 0.0
+
+    def start(self):
+        self._room.on("track_subscribed", self._on_track_subscribed)
+        self._room.on("track_unsubscribed", self._on_track_unsubscribed)
+        self._follow_any_track()
+
+    async def aclose(self):
+        self._room.off("track_subscribed", self._on_track_subscribed)
+        self._room.off("track_unsubscribed", self._on_track_unsubscribed)
+        task = self._cancel_reader()
+        if task is not None:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def latest(self, max_age: Optional[float] = None) -> Optional[rtc.VideoFrame]:
+        """The newest frame, or None if there is none (or it is older than max_age seconds)."""
+        if max_age is not None and time.monotonic() - self._frame_time > max_age:
+            return None
+        return self._frame
+
+    def _on_track_subscribed(
+        self,
+        track: rtc.Track,
+        publication: rtc.RemoteTrackPublication,
+        participant: rtc.RemoteParticipant,
+    ):
+        if self._track is None and isinstance(track, rtc.RemoteVideoTrack):
+            self._follow(track, participant.identity)
+
+    def _on_track_unsubscribed(
+        self,
+        track: rtc.Track,
+        publication: rtc.RemoteTrackPublication,
+        participant: rtc.RemoteParticipant,
+    ):
+        if self._track is not None and track.sid == self._track.sid:
+            logger.info(f"Video track {track.sid} from {participant.identity} went away")
+            self._cancel_reader()
+            self._track = None
+            self._frame = None
+            self._follow_any_track(exclude_sid=track.sid)
+
+    def _follow_any_track(self, exclude_sid: Optional[str] = None):
+        for participant in self._room.remote_participants.values():
+            for publication in participant.track_publications.values():
+                track = publication.track
+                if isinstance(track, rtc.RemoteVideoTrack) and track.sid != exclude_sid:
+                    self._follow(track, participant.identity)
+                    return
+
+    def _follow(self, track: rtc.RemoteVideoTrack, identity: str):
+        logger.info(f"Sampling video track {track.sid} from participant {identity}")
+        self._track = track
+        self._task = asyncio.create_task(self._read(track))
+
+    def _cancel_reader(self) -> Optional[asyncio.Task]:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+        return task
+
+    async def _read(self, track: rtc.RemoteVideoTrack):
+        stream = rtc.VideoStream(track, capacity=1)
+        try:
+            async for event in stream:
+                self._frame = event.frame
+                self._frame_time = time.monotonic()
+        except Exception as e:
+            logger.error(f"Video sampling stopped for track {track.sid}: {e}")
+        finally:
+            await stream.aclose()
+
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash: compares neighbouring pixels of a 9x8 grayscale thumbnail."""
+    small = image.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] < pixels[row * 9 + col + 1])
+    return bits
+
+
+@dataclass
+class EncodedFrame:
+    """A frame prepared for the LLM but not yet recorded as sent."""
+
+    hash: int
+    url: str
+    size: int
+
+
+class FramePreprocessor:
+    """
+    Turns raw video frames into small JPEG data URLs for the LLM context and
+    skips frames that look the same as the last one sent.
+    """
+
+    def __init__(
+        self,
+        max_size: int = FRAME_MAX_SIZE,
+        quality: int = FRAME_JPEG_QUALITY,
+        max_bytes: int = FRAME_MAX_BYTES,
+        hash_threshold: int = FRAME_HASH_THRESHOLD,
+        log_every: int = 20,
+    ):
+        self.max_size = max_size
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.hash_threshold = hash_threshold
+        self.log_every = log_every
+        self._last_hash: Optional[int] = None
+        self.sent = 0
+        self.skipped = 0
+        self.bytes_sent = 0
+        # CPU time spent in prepare(), read by the worker's load reporting
+        self.cpu_seconds = 0.0
+
+    def reset(self):
+        """Forget the last frame sent, so the next frame is always attached."""
+        self._last_hash = None
+
+    def prepare(self, frame: rtc.VideoFrame) -> Optional[str]:
+        """A JPEG data URL for the frame, or None if it is unchanged since the last one sent."""
+        encoded = self.encode(frame)
+        self.record(encoded)
+        return encoded.url if encoded is not None else None
+
+    def encode(self, frame: rtc.VideoFrame, force: bool = False) -> Optional[EncodedFrame]:
+        """
+        Like prepare, but the frame only counts as sent once passed to record().
+        With force, a frame is encoded even if it is unchanged.
+        """
+        started = time.thread_time()
+        try:
+            return self._encode_frame(frame, force)
+        finally:
+            self.cpu_seconds += time.thread_time() - started
+
+    def record(self, encoded: Optional[EncodedFrame]):
+        """Count a frame from encode() as sent, so later frames are compared with it; None counts as skipped."""
+        if encoded is None:
+            self.skipped += 1
+        else:
+            self._last_hash = encoded.hash
+            self.sent += 1
+            self.bytes_sent += encoded.size
+        self._report()
+
+    def _encode_frame(self, frame: rtc.VideoFrame, force: bool) -> Optional[EncodedFrame]:
+        rgba = frame if frame.type == rtc.VideoBufferType.RGBA else frame.convert(rtc.VideoBufferType.RGBA)
+        image = Image.frombytes("RGBA", (rgba.width, rgba.height), bytes(rgba.data)).convert("RGB")
+
+        frame_hash = dhash(image)
+        if not force and self._last_hash is not None and bin(frame_hash ^ self._last_hash).count("1") <= self.hash_threshold:
+            return None
+
+        image.thumbnail((self.max_size, self.max_size))
+        data = self._encode(image)
+        return EncodedFrame(frame_hash, "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii"), len(data))
+
+    def _encode(self, image: Image.Image) -> bytes:
+        # Step the quality down until the frame fits the byte budget
+        quality = self.quality
+        while True:
+            buf = io.BytesIO()
+            image.save(buf, format="JPEG", quality=quality)
+            if buf.tell() <= self.max_bytes or quality <= 30:
+                return buf.getvalue()
+            quality -= 15
+
+    def _report(self):
+        total = self.sent + self.skipped
+        if total % self.log_every == 0:
+            logger.info(
+                f"Frame preprocessing: {self.sent} sent, {self.skipped} skipped as unchanged "
+                f"({self.skipped / total:.0%} hit rate), "
+                f"avg {self.bytes_sent / max(self.sent, 1) / 1024:.1f} KiB per frame sent"
+            )
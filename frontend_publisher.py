@@ -0,0 +1,176 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Optional
+
+from livekit import rtc
+
+logger = logging.getLogger("voice-agent")
+
+# Updates submitted within this many seconds of each other go out as one message
+FRONTEND_COALESCE_WINDOW = float(os.getenv("FRONTEND_COALESCE_WINDOW", "0.05"))
+# Send the full whiteboard text every this many versions so a missed patch can't drift forever
+FRONTEND_FULL_EVERY = int(os.getenv("FRONTEND_FULL_EVERY", "20"))
+# whiteboard_patch messages need a frontend that applies them; older ones only handle whiteboard_update
+FRONTEND_WHITEBOARD_PATCHES = os.getenv("FRONTEND_WHITEBOARD_PATCHES", "0") == "1"
+# After a failed publish, the latest state is sent again after this delay, doubling up to the maximum
+FRONTEND_RETRY_DELAY = 0.5
+FRONTEND_RETRY_MAX_DELAY = 10.0
+
+
+def text_patch(old: str, new: str) -> Optional[dict]:
+    """
+    The single edit that turns old into new: replace deleteCount characters at
+    start with text. None if the strings contain characters outside the BMP,
+    where Python and JavaScript string offsets disagree.
+    """
+    if any(ord(c) > 0xFFFF for c in old) or any(ord(c) > 0xFFFF for c in new):
+        return None
+    limit = min(len(old), len(new))
+    prefix = 0
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    return {"start": prefix, "deleteCount": len(old) - prefix - suffix, "text": new[prefix:len(new) - suffix]}
+
+
+class FrontendPublisher:
+    """
+    Per-room outbound queue for data messages to the frontend.
+
+    `send` and `send_whiteboard` only record the newest message for their type
+    and return immediately. A single sender task publishes them: it waits a
+    short window so bursts collapse into one message, and while a publish is
+    in flight newer updates keep replacing the pending one, so a slow data
+    channel sees fewer, larger updates instead of a growing backlog.
+
+    With `patches`, whiteboard text is sent as a `whiteboard_patch` against the
+    last version sent when that is smaller than the full `whiteboard_update`.
+    A message that fails to publish stays queued (unless a newer one replaced
+    it) and is retried with backoff; the whiteboard is then resent in full.
+    """
+
+    def __init__(
+        self,
+        room: rtc.Room,
+        window: float = FRONTEND_COALESCE_WINDOW,
+        full_every: int = FRONTEND_FULL_EVERY,
+        patches: bool = FRONTEND_WHITEBOARD_PATCHES,
+    ):
+        self._room = room
+        self.window = window
+        self.full_every = full_every
+        self.patches = patches
+        self._pending: dict[str, dict] = {}  # message type -> newest content, insertion ordered
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        # last whiteboard text the frontend is known to have
+        self._whiteboard: Optional[str] = None
+        self._version = 0
+        self._force_full = False
+        self.submitted = 0
+        self.published = 0
+        self.bytes_published = 0
+
+    def start(self):
+        self._room.on("participant_connected", self._on_participant_connected)
+        self._task = asyncio.create_task(self._run())
+
+    async def aclose(self):
+        """Flush whatever is pending, then stop the sender."""
+        self._room.off("participant_connected", self._on_participant_connected)
+        self._closed = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+        logger.info(
+            f"Frontend publisher: {self.submitted} updates submitted, {self.published} messages "
+            f"published ({self.bytes_published} bytes)"
+        )
+
+    def send(self, message_type: str, content: dict):
+        """Queue a message; an unsent message of the same type is replaced."""
+        self.submitted += 1
+        self._pending.pop(message_type, None)
+        self._pending[message_type] = content
+        self._wakeup.set()
+
+    def send_whiteboard(self, text: str):
+        self.send("whiteboard_update", {"content": text})
+
+    def _on_participant_connected(self, participant: rtc.RemoteParticipant):
+        # A late joiner has none of the earlier versions to patch against
+        if self._whiteboard is not None and "whiteboard_update" not in self._pending:
+            self._force_full = True
+            self.send_whiteboard(self._whiteboard)
+
+    async def _run(self):
+        retry_delay = FRONTEND_RETRY_DELAY
+        while True:
+            await self._wakeup.wait()
+            if not self._closed and self.window > 0:
+                await asyncio.sleep(self.window)
+            self._wakeup.clear()
+            failed = False
+            while self._pending:
+                message_type = next(iter(self._pending))
+                content = self._pending.pop(message_type)
+                try:
+                    await self._publish(message_type, content)
+                except Exception as e:
+                    logger.error(f"Failed to publish {message_type} to frontend: {e}")
+                    if message_type == "whiteboard_update":
+                        self._force_full = True
+                    # keep the latest state queued; an update submitted meanwhile already replaced it
+                    self._pending.setdefault(message_type, content)
+                    failed = True
+                    break
+            if self._closed:
+                return
+            if failed:
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, FRONTEND_RETRY_MAX_DELAY)
+                self._wakeup.set()
+            else:
+                retry_delay = FRONTEND_RETRY_DELAY
+
+    async def _publish(self, message_type: str, content: dict):
+        if message_type == "whiteboard_update":
+            message_type, message = self._whiteboard_message(content["content"])
+            if message is None:
+                return
+        else:
+            message = {"type": message_type, **content}
+
+        payload = json.dumps(message).encode("utf-8")
+        await self._room.local_participant.publish_data(payload=payload, reliable=True, topic=message_type)
+        self.published += 1
+        self.bytes_published += len(payload)
+
+    def _whiteboard_message(self, text: str) -> tuple[str, Optional[dict]]:
+        if text == self._whiteboard and not self._force_full:
+            return "whiteboard_update", None
+
+        full = {"type": "whiteboard_update", "content": text, "version": self._version + 1}
+        message_type, message = "whiteboard_update", full
+        use_patch = (
+            self.patches
+            and self._whiteboard is not None
+            and not self._force_full
+            and (self._version + 1) % self.full_every != 0
+        )
+        patch = text_patch(self._whiteboard, text) if use_patch else None
+        if patch is not None:
+            candidate = {"type": "whiteboard_patch", "version": self._version + 1, "baseVersion": self._version, **patch}
+            if len(json.dumps(candidate)) < len(json.dumps(full)):
+                message_type, message = "whiteboard_patch", candidate
+
+        # Recorded before publishing: a failed publish sets _force_full so the next update is complete
+        self._whiteboard = text
+        self._version += 1
+        self._force_full = False
+        return message_type, message
@@ -0,0 +1,210 @@
+"""
+Text extraction for uploaded documents.
+
+Kept out of flaskApp.py so the functions can be run in a process pool
+without importing (and re-initialising) the Flask app in every worker.
+
+A PDF's text is written to a sibling .txt file page by page, together with a
+.pages.json file holding the [start, end) byte offsets of every page, so a
+single page can be read back later without re-parsing the PDF.
+
+Low-resolution JPEG previews of every page are rendered with pypdfium2 into a
+folder per document. Without pypdfium2 installed, previews are skipped.
+"""
+import json
+import os
+import shutil
+from typing import Callable, Iterator, Optional
+
+import PyPDF2
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+# Pages handed to a pool worker per task
+PAGES_PER_TASK = 16
+PREVIEW_QUALITY = 70
+
+
+def offsets_path_for(txt_filepath: str) -> str:
+    return txt_filepath.rsplit('.', 1)[0] + ".pages.json"
+
+
+def count_pages(filepath: str) -> int:
+    with open(filepath, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def iter_pdf_pages(filepath: str, start: int = 0, stop: Optional[int] = None) -> Iterator[tuple[int, Optional[str]]]:
+    """Yield (page index, text) for pages [start, stop) as they are parsed. Text is None for pages that fail."""
+    with open(filepath, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+        for i in range(start, stop):
+            try:
+                yield i, reader.pages[i].extract_text() or ""
+            except Exception:
+                yield i, None
+
+
+def _encode_page(text: Optional[str]) -> bytes:
+    return b"" if text is None else (text + "\n").encode("utf-8")
+
+
+def extract_page_range(filepath: str, part_path: str, start: int, stop: int) -> dict:
+    """Pool task: write pages [start, stop) to part_path. Returns per-page byte lengths and the failure count."""
+    lengths = []
+    failed = 0
+    with open(part_path, "wb") as out:
+        for _, text in iter_pdf_pages(filepath, start, stop):
+            failed += text is None
+            data = _encode_page(text)
+            out.write(data)
+            lengths.append(len(data))
+    return {"lengths": lengths, "failed": failed}
+
+
+def extract_pdf(
+    filepath: str,
+    txt_filepath: str,
+    pool=None,
+    progress: Optional[Callable[[int, int, int], None]] = None,
+) -> dict:
+    """
+    Stream a PDF's text into txt_filepath and record per-page offsets.
+    With a pool, page ranges are parsed in parallel and appended in order as they finish.
+    progress(pages_total, pages_done, pages_failed) is called as pages are written.
+    Returns {"pages": total page count, "failed": failed page count}.
+    """
+    pages = count_pages(filepath)
+    ranges = [(s, min(s + PAGES_PER_TASK, pages)) for s in range(0, pages, PAGES_PER_TASK)]
+    offsets = []
+    failed = 0
+    position = 0
+    tmp_path = txt_filepath + ".tmp"
+    if progress:
+        progress(pages, 0, 0)
+
+    with open(tmp_path, "wb") as out:
+        if pool is None or len(ranges) <= 1:
+            for i, text in iter_pdf_pages(filepath):
+                failed += text is None
+                data = _encode_page(text)
+                out.write(data)
+                offsets.append([position, position + len(data)])
+                position += len(data)
+                if progress:
+                    progress(pages, i + 1, failed)
+        else:
+            parts = [f"{tmp_path}.{n}" for n in range(len(ranges))]
+            futures = [
+                pool.submit(extract_page_range, filepath, part, start, stop)
+                for part, (start, stop) in zip(parts, ranges)
+            ]
+            try:
+                for part, (_, stop), future in zip(parts, ranges, futures):
+                    result = future.result()
+                    with open(part, "rb") as part_file:
+                        shutil.copyfileobj(part_file, out)
+                    for length in result["lengths"]:
+                        offsets.append([position, position + length])
+                        position += length
+                    failed += result["failed"]
+                    if progress:
+                        progress(pages, stop, failed)
+            finally:
+                for future in futures:
+                    future.cancel()
+                for part in parts:
+                    if os.path.exists(part):
+                        os.remove(part)
+
+    os.replace(tmp_path, txt_filepath)
+    with open(offsets_path_for(txt_filepath), "w", encoding="utf-8") as f:
+        json.dump(offsets, f)
+    return {"pages": pages, "failed": failed}
+
+
+def load_offsets(txt_filepath: str) -> Optional[list]:
+    try:
+        with open(offsets_path_for(txt_filepath), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def read_page(txt_filepath: str, page_no: int, offsets: Optional[list] = None) -> str:
+    """Read a single page (numbered from 1) of extracted text by seeking to its offset."""
+    offsets = offsets if offsets is not None else load_offsets(txt_filepath)
+    if offsets is None or not 1 <= page_no <= len(offsets):
+        raise IndexError(f"No page {page_no} in {txt_filepath}")
+    start, end = offsets[page_no - 1]
+    with open(txt_filepath, "rb") as f:
+        f.seek(start)
+        return f.read(end - start).decode("utf-8")
+
+
+def iter_text_pages(txt_filepath: str) -> Iterator[str]:
+    """Yield the extracted text page by page; files without offsets are a single page."""
+    offsets = load_offsets(txt_filepath)
+    if offsets is None:
+        with open(txt_filepath, "r", encoding="utf-8") as f:
+            yield f.read()
+        return
+    with open(txt_filepath, "rb") as f:
+        for start, end in offsets:
+            f.seek(start)
+            yield f.read(end - start).decode("utf-8")
+
+
+def previews_available() -> bool:
+    return pypdfium2 is not None
+
+
+def preview_path(folder: str, page_no: int) -> str:
+    return os.path.join(folder, f"{page_no}.jpg")
+
+
+def render_page_range(filepath: str, folder: str, start: int, stop: int, width: int) -> int:
+    """Pool task: render pages [start, stop) as JPEGs `width` pixels wide. Returns how many were rendered."""
+    rendered = 0
+    pdf = pypdfium2.PdfDocument(filepath)
+    try:
+        for i in range(start, min(stop, len(pdf))):
+            path = preview_path(folder, i + 1)
+            page = pdf[i]
+            try:
+                image = page.render(scale=width / page.get_width()).to_pil().convert("RGB")
+                image.save(path + ".tmp", "JPEG", quality=PREVIEW_QUALITY, optimize=True)
+                os.replace(path + ".tmp", path)
+                rendered += 1
+            except Exception:
+                continue
+            finally:
+                page.close()
+    finally:
+        pdf.close()
+    return rendered
+
+
+def render_previews(filepath: str, folder: str, width: int, pool=None) -> int:
+    """Render a preview of every page into folder, in parallel with a pool. Returns how many were rendered."""
+    if pypdfium2 is None:
+        return 0
+    os.makedirs(folder, exist_ok=True)
+    pdf = pypdfium2.PdfDocument(filepath)
+    try:
+        pages = len(pdf)
+    finally:
+        pdf.close()
+    ranges = [(s, min(s + PAGES_PER_TASK, pages)) for s in range(0, pages, PAGES_PER_TASK)]
+    if pool is None or len(ranges) <= 1:
+        return render_page_range(filepath, folder, 0, pages, width)
+    futures = [pool.submit(render_page_range, filepath, folder, start, stop, width) for start, stop in ranges]
+    try:
+        return sum(future.result() for future in futures)
+    finally:
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,627 @@
+"""
+Persistent chunked retrieval index for uploaded documents.
+
+Every document is split into overlapping word chunks (never crossing a page
+boundary) and written to its own segment file on disk. Segments are merged
+into an in-memory inverted index at load time and ranked with BM25, so a
+search only has to send the top few chunks to the model instead of the whole
+corpus. An embedding store can optionally be plugged in; its ranking is fused
+with BM25 using reciprocal rank fusion.
+
+Several processes (gunicorn workers, the debug reloader) may share one index
+folder. Every writer replaces a small generation file after changing a
+segment; each process checks it before searching and reloads the segments
+other processes added, replaced or removed.
+
+The index can also be written as a single read-only snapshot file that other
+processes (the voice agent) memory-map with MappedIndex to run BM25 searches
+in-process, without going through the HTTP API. Documents are keyed by content
+hash, so the document server also publishes the current filenames of every
+hash next to the snapshot (write_filenames); MappedIndex cites those.
+"""
+import bisect
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import uuid
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its of on or "
+    "that the this to was were what when where which who why will with you".split()
+)
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+# Reciprocal rank fusion constant
+RRF_K = 60
+
+# Snapshot layout: header, then the sections below as native-endian arrays (plus two
+# UTF-8 blobs and a JSON doc table). Written and read on the same host.
+SNAPSHOT_MAGIC = b"SIDXSNP1"
+SNAPSHOT_SECTIONS = (
+    "termOffsets",     # Q[n_terms + 1]: byte offsets of each sorted term in `terms`
+    "terms",           # UTF-8 bytes of all terms, concatenated
+    "postingOffsets",  # Q[n_terms + 1]: entry offsets of each term's postings
+    "postings",        # I[2 * n_postings]: (chunk id, term frequency) pairs
+    "chunks",          # I[4 * n_chunks]: (doc index, chunk number, page, length)
+    "textOffsets",     # Q[n_chunks + 1]: byte offsets of each chunk's text in `text`
+    "text",            # UTF-8 bytes of all chunk texts, concatenated
+    "docs",            # JSON list of [doc_id, filename]
+)
+SNAPSHOT_HEADER = struct.Struct("<8sIIQ" + "QQ" * len(SNAPSHOT_SECTIONS))
+# Seconds to wait after a change before rewriting the snapshot, so bursts share one write
+SNAPSHOT_DELAY = 0.5
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase word tokens with stopwords removed."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def chunk_pages(pages: Iterable[str], chunk_words: int = 200, overlap: int = 40) -> list[dict]:
+    """Split page texts into overlapping word windows. Pages are numbered from 1."""
+    step = max(1, chunk_words - overlap)
+    chunks = []
+    for page_no, page_text in enumerate(pages, start=1):
+        words = page_text.split()
+        for start in range(0, len(words), step):
+            window = words[start:start + chunk_words]
+            chunks.append({"page": page_no, "text": " ".join(window)})
+            if start + chunk_words >= len(words):
+                break
+    return chunks
+
+
+@dataclass
+class Hit:
+    doc_id: str
+    filename: str
+    page: int
+    chunk: int
+    text: str
+    score: float
+
+
+class VectorStore:
+    """Interface for an optional embedding store plugged into SearchIndex."""
+
+    def add(self, doc_id: str, texts: list[str]) -> None:
+        raise NotImplementedError
+
+    def remove(self, doc_id: str) -> None:
+        raise NotImplementedError
+
+    def search(self, query: str, k: int) -> list[tuple[str, int, float]]:
+        """Return (doc_id, chunk number, similarity) triples, best first."""
+        raise NotImplementedError
+
+    def reload(self, doc_id: str) -> None:
+        """Pick up a document's vectors written or removed by another process."""
+
+
+class InMemoryVectorStore(VectorStore):
+    """
+    Brute-force cosine similarity over normalized embeddings.
+    Vectors are persisted per document so they are only computed once.
+    """
+
+    def __init__(self, embed: Callable[[list[str]], list[list[float]]], folder: str):
+        self.embed = embed
+        self.folder = folder
+        self._vectors: dict[str, list[list[float]]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        for name in os.listdir(folder):
+            if name.endswith(".json"):
+                with open(os.path.join(folder, name), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._vectors[data["docId"]] = data["vectors"]
+
+    @staticmethod
+    def _normalize(vec: list[float]) -> list[float]:
+        norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+        return [x / norm for x in vec]
+
+    def _path(self, doc_id: str) -> str:
+        return os.path.join(self.folder, _segment_name(doc_id) + ".json")
+
+    def add(self, doc_id, texts):
+        vectors = [self._normalize(v) for v in self.embed(texts)] if texts else []
+        _write_json(self._path(doc_id), {"docId": doc_id, "vectors": vectors})
+        with self._lock:
+            self._vectors[doc_id] = vectors
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._vectors.pop(doc_id, None)
+        try:
+            os.remove(self._path(doc_id))
+        except FileNotFoundError:
+            pass
+
+    def reload(self, doc_id):
+        try:
+            with open(self._path(doc_id), "r", encoding="utf-8") as f:
+                vectors = json.load(f)["vectors"]
+        except (FileNotFoundError, ValueError):
+            vectors = None
+        with self._lock:
+            if vectors is None:
+                self._vectors.pop(doc_id, None)
+            else:
+                self._vectors[doc_id] = vectors
+
+    def search(self, query, k):
+        q = self._normalize(self.embed([query])[0])
+        with self._lock:
+            items = list(self._vectors.items())
+        scored = [
+            (doc_id, n, sum(a * b for a, b in zip(q, vec)))
+            for doc_id, vectors in items
+            for n, vec in enumerate(vectors)
+        ]
+        scored.sort(key=lambda s: s[2], reverse=True)
+        return scored[:k]
+
+
+def _segment_name(doc_id: str) -> str:
+    return hashlib.sha1(doc_id.encode("utf-8")).hexdigest()
+
+
+def _temp_path(path: str) -> str:
+    """A temporary file next to path that no other writer uses."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    os.chmod(tmp, 0o644)  # mkstemp creates 0600; the agent may read the snapshot as another user
+    return tmp
+
+
+def _write_json(path: str, data) -> None:
+    """Write JSON atomically so readers never see a half-written file."""
+    tmp = _temp_path(path)
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def filenames_path_for(snapshot_path: str) -> str:
+    return os.path.splitext(snapshot_path)[0] + ".names.json"
+
+
+def write_filenames(path: str, names: dict[str, list[str]]) -> None:
+    """Publish the filenames each content hash is currently uploaded under."""
+    _write_json(path, names)
+
+
+def _file_stamp(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class SearchIndex:
+    """
+    BM25 inverted index over document chunks, backed by one segment file per document.
+    With a snapshot_path, a MappedIndex snapshot is rewritten shortly after every change.
+    Changes made by other processes sharing the folder are picked up by `refresh`,
+    which searches and membership checks call first.
+    """
+
+    def __init__(self, folder: str, vector_store: Optional[VectorStore] = None, snapshot_path: Optional[str] = None):
+        self.folder = folder
+        self.segment_folder = os.path.join(folder, "segments")
+        self.generation_path = os.path.join(folder, "generation")
+        self.vector_store = vector_store
+        self.snapshot_path = snapshot_path
+        self._snapshot_timer: Optional[threading.Timer] = None
+        self._snapshot_lock = threading.Lock()
+        self._lock = threading.RLock()
+        # chunk id -> (doc_id, chunk number, page, text, length); None once removed
+        self._chunks: list[Optional[tuple]] = []
+        self._docs: dict[str, dict] = {}
+        self._postings: dict[str, dict[int, int]] = {}
+        self._total_length = 0
+        self._live_chunks = 0
+        # segment file name -> (file stamp, doc_id) as loaded
+        self._segments: dict[str, tuple[tuple, str]] = {}
+        self._generation: Optional[tuple] = None
+        os.makedirs(self.segment_folder, exist_ok=True)
+        with self._lock:
+            self._generation = _file_stamp(self.generation_path)
+            self._scan(initial=True)
+        if snapshot_path:
+            self._schedule_snapshot()
+
+    @property
+    def generation(self) -> Optional[tuple]:
+        """Changes whenever any process changes the index."""
+        self.refresh()
+        return self._generation
+
+    def refresh(self) -> bool:
+        """Reload segments changed by other processes since the last check. Returns whether anything was reloaded."""
+        if _file_stamp(self.generation_path) == self._generation:
+            return False
+        with self._lock:
+            stamp = _file_stamp(self.generation_path)
+            if stamp == self._generation:
+                return False
+            # recorded before scanning, so a change made during the scan is picked up next time
+            self._generation = stamp
+            return self._scan()
+
+    def _scan(self, initial: bool = False) -> bool:
+        on_disk = {}
+        for entry in os.scandir(self.segment_folder):
+            if entry.name.endswith(".json"):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                on_disk[entry.name] = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+        changed = False
+        for name, (_, doc_id) in list(self._segments.items()):
+            if name not in on_disk:
+                self._remove_from_memory(doc_id)
+                del self._segments[name]
+                if self.vector_store is not None:
+                    self.vector_store.reload(doc_id)
+                changed = True
+        for name, stamp in on_disk.items():
+            loaded = self._segments.get(name)
+            if loaded is not None and loaded[0] == stamp:
+                continue
+            try:
+                with open(os.path.join(self.segment_folder, name), "r", encoding="utf-8") as f:
+                    segment = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue  # removed or replaced since the directory listing; the next generation covers it
+            self._remove_from_memory(segment["docId"])
+            self._add_segment(segment)
+            self._segments[name] = (stamp, segment["docId"])
+            if self.vector_store is not None and not initial:
+                self.vector_store.reload(segment["docId"])
+            changed = True
+        return changed
+
+    def _bump_generation(self):
+        """Tell other processes sharing the folder that the index changed."""
+        path = self.generation_path
+        tmp = _temp_path(path)
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp, path)
+
+    def _add_segment(self, segment: dict):
+        chunk_ids = []
+        for n, (chunk, terms) in enumerate(zip(segment["chunks"], segment["terms"])):
+            chunk_id = len(self._chunks)
+            length = sum(terms.values())
+            self._chunks.append((segment["docId"], n, chunk["page"], chunk["text"], length))
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[chunk_id] = tf
+            self._total_length += length
+            self._live_chunks += 1
+            chunk_ids.append(chunk_id)
+        self._docs[segment["docId"]] = {"filename": segment["filename"], "chunkIds": chunk_ids}
+
+    def __contains__(self, doc_id: str) -> bool:
+        self.refresh()
+        return doc_id in self._docs
+
+    def add_document(self, doc_id: str, filename: str, pages: Iterable[str]) -> int:
+        """Chunk, index and persist a document, replacing any previous version. Returns the chunk count."""
+        chunks = chunk_pages(pages)
+        segment = {
+            "docId": doc_id,
+            "filename": filename,
+            "chunks": chunks,
+            "terms": [dict(Counter(tokenize(c["text"]))) for c in chunks],
+        }
+        # vectors first, so another process that sees the segment finds them too
+        if self.vector_store is not None:
+            self.vector_store.add(doc_id, [c["text"] for c in chunks])
+        name = _segment_name(doc_id) + ".json"
+        path = os.path.join(self.segment_folder, name)
+        with self._lock:
+            _write_json(path, segment)
+            self._remove_from_memory(doc_id)
+            self._add_segment(segment)
+            self._segments[name] = (_file_stamp(path), doc_id)
+            self._bump_generation()
+        self._schedule_snapshot()
+        return len(chunks)
+
+    def remove_document(self, doc_id: str) -> None:
+        name = _segment_name(doc_id) + ".json"
+        with self._lock:
+            self._remove_from_memory(doc_id)
+            self._segments.pop(name, None)
+            try:
+                os.remove(os.path.join(self.segment_folder, name))
+            except FileNotFoundError:
+                pass
+            self._bump_generation()
+        if self.vector_store is not None:
+            self.vector_store.remove(doc_id)
+        self._schedule_snapshot()
+
+    def _remove_from_memory(self, doc_id: str):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for chunk_id in doc["chunkIds"]:
+            _, _, _, text, length = self._chunks[chunk_id]
+            for term in set(tokenize(text)):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self._postings[term]
+            self._chunks[chunk_id] = None
+            self._total_length -= length
+            self._live_chunks -= 1
+
+    def _bm25(self, query: str, limit: int) -> list[tuple[int, float]]:
+        terms = set(tokenize(query))
+        if not terms or not self._live_chunks:
+            return []
+        avgdl = self._total_length / self._live_chunks
+        scores: dict[int, float] = {}
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (self._live_chunks - df + 0.5) / (df + 0.5))
+            for chunk_id, tf in postings.items():
+                length = self._chunks[chunk_id][4]
+                norm = tf + K1 * (1 - B + B * length / avgdl)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (K1 + 1) / norm
+        return sorted(scores.items(), key=lambda s: s[1], reverse=True)[:limit]
+
+    def search(self, query: str, k: int = 8) -> list[Hit]:
+        """Return the top-k chunks for a query, best first."""
+        self.refresh()
+        # embedding the query is a network call; it must not hold up indexing or other searches
+        vectors = self.vector_store.search(query, k * 4) if self.vector_store is not None else None
+        with self._lock:
+            ranked = self._bm25(query, k * 4)
+            if vectors is not None:
+                # chunks removed since the vector search are skipped by _fuse
+                ranked = self._fuse(ranked, vectors)
+            hits = []
+            for chunk_id, score in ranked[:k]:
+                doc_id, n, page, text, _ = self._chunks[chunk_id]
+                hits.append(Hit(doc_id, self._docs[doc_id]["filename"], page, n, text, score))
+            return hits
+
+    def _fuse(self, bm25: list[tuple[int, float]], vectors: list[tuple[str, int, float]]):
+        fused: dict[int, float] = {}
+        for rank, (chunk_id, _) in enumerate(bm25):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        for rank, (doc_id, n, _) in enumerate(vectors):
+            doc = self._docs.get(doc_id)
+            if doc is None or n >= len(doc["chunkIds"]):
+                continue
+            chunk_id = doc["chunkIds"][n]
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        return sorted(fused.items(), key=lambda s: s[1], reverse=True)
+
+    def _schedule_snapshot(self):
+        if not self.snapshot_path:
+            return
+        with self._snapshot_lock:
+            if self._snapshot_timer is None:
+                self._snapshot_timer = threading.Timer(SNAPSHOT_DELAY, self._flush_snapshot)
+                self._snapshot_timer.daemon = True
+                self._snapshot_timer.start()
+
+    def _flush_snapshot(self):
+        with self._snapshot_lock:
+            self._snapshot_timer = None
+        try:
+            self.write_snapshot(self.snapshot_path)
+        except OSError:
+            logger.exception("Failed to write search index snapshot to %s", self.snapshot_path)
+
+    def write_snapshot(self, path: str) -> None:
+        """Write the BM25 index (live chunks only, renumbered) to one file, atomically."""
+        self.refresh()
+        with self._lock:
+            doc_ids = list(self._docs)
+            doc_index = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+            new_ids = {}
+            chunks = array("I")
+            text_offsets = array("Q", [0])
+            text = bytearray()
+            for chunk_id, chunk in enumerate(self._chunks):
+                if chunk is None:
+                    continue
+                doc_id, n, page, chunk_text, length = chunk
+                new_ids[chunk_id] = len(new_ids)
+                chunks.extend((doc_index[doc_id], n, page, length))
+                text += chunk_text.encode("utf-8")
+                text_offsets.append(len(text))
+
+            term_offsets = array("Q", [0])
+            terms = bytearray()
+            posting_offsets = array("Q", [0])
+            postings = array("I")
+            for term in sorted(self._postings, key=lambda t: t.encode("utf-8")):
+                terms += term.encode("utf-8")
+                term_offsets.append(len(terms))
+                for chunk_id, tf in sorted(self._postings[term].items()):
+                    postings.extend((new_ids[chunk_id], tf))
+                posting_offsets.append(len(postings) // 2)
+
+            docs = json.dumps([[doc_id, self._docs[doc_id]["filename"]] for doc_id in doc_ids]).encode("utf-8")
+            sections = [
+                term_offsets.tobytes(), bytes(terms), posting_offsets.tobytes(), postings.tobytes(),
+                chunks.tobytes(), text_offsets.tobytes(), bytes(text), docs,
+            ]
+            n_chunks, n_terms, total_length = len(new_ids), len(term_offsets) - 1, self._total_length
+
+        layout = []
+        position = SNAPSHOT_HEADER.size
+        for data in sections:
+            position += -position % 8  # keep arrays 8-byte aligned
+            layout += [position, len(data)]
+            position += len(data)
+
+        tmp = _temp_path(path)
+        try:
+            with open(tmp, "wb") as f:
+                f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, n_chunks, n_terms, total_length, *layout))
+                for offset, data in zip(layout[::2], sections):
+                    f.write(b"\0" * (offset - f.tell()))
+                    f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+class MappedIndex:
+    """
+    Read-only BM25 search over a snapshot written by SearchIndex.write_snapshot.
+
+    The file is memory-mapped, so opening it is cheap and only the postings and
+    texts a query touches are read. Snapshots are replaced atomically; each
+    search checks whether the file changed and remaps it if so. Vector ranking
+    is not available here, only BM25.
+
+    Hits are labelled with the filenames their content hash currently has,
+    read from the file write_filenames publishes; content no file refers to
+    any more is left out. Without that file, the filename recorded at index
+    time is used.
+    """
+
+    def __init__(self, path: str, filenames_path: Optional[str] = None):
+        self.path = path
+        self.filenames_path = filenames_path or filenames_path_for(path)
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._view = None
+        self._names_stamp = None
+        self._names: Optional[dict[str, list[str]]] = None
+
+    def _refresh_names(self):
+        stamp = _file_stamp(self.filenames_path)
+        if stamp == self._names_stamp:
+            return
+        try:
+            with open(self.filenames_path, "r", encoding="utf-8") as f:
+                self._names = json.load(f)
+        except FileNotFoundError:
+            self._names = None
+        except ValueError:
+            return  # keep the previous names rather than fail the search
+        self._names_stamp = stamp
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._stamp = self._view = None
+            return
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stamp == self._stamp:
+            return
+        with open(self.path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_chunks, n_terms, total_length, *layout = SNAPSHOT_HEADER.unpack_from(mm)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{self.path} is not a search index snapshot")
+        buf = memoryview(mm)
+        sections = {
+            name: buf[offset:offset + length]
+            for name, offset, length in zip(SNAPSHOT_SECTIONS, layout[::2], layout[1::2])
+        }
+        self._view = {
+            "mmap": mm,
+            "nChunks": n_chunks,
+            "nTerms": n_terms,
+            "avgdl": total_length / n_chunks if n_chunks else 0.0,
+            "termOffsets": sections["termOffsets"].cast("Q"),
+            "terms": sections["terms"],
+            "postingOffsets": sections["postingOffsets"].cast("Q"),
+            "postings": sections["postings"].cast("I"),
+            "chunks": sections["chunks"].cast("I"),
+            "textOffsets": sections["textOffsets"].cast("Q"),
+            "text": sections["text"],
+            "docs": json.loads(bytes(sections["docs"])),
+        }
+        self._stamp = stamp
+
+    @staticmethod
+    def _find_term(view: dict, term: bytes) -> int:
+        offsets, terms = view["termOffsets"], view["terms"]
+        i = bisect.bisect_left(range(view["nTerms"]), term, key=lambda j: terms[offsets[j]:offsets[j + 1]].tobytes())
+        if i < view["nTerms"] and terms[offsets[i]:offsets[i + 1]] == term:
+            return i
+        return -1
+
+    def search(self, query: str, k: int = 5) -> list[Hit]:
+        """Return the top-k chunks for a query, best first. Empty if there is no snapshot yet."""
+        with self._lock:
+            self._refresh()
+            self._refresh_names()
+            view, names = self._view, self._names
+        if view is None or not view["nChunks"]:
+            return []
+
+        n_chunks, avgdl, chunks, postings = view["nChunks"], view["avgdl"], view["chunks"], view["postings"]
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            i = self._find_term(view, term.encode("utf-8"))
+            if i < 0:
+                continue
+            start, end = view["postingOffsets"][i], view["postingOffsets"][i + 1]
+            df = end - start
+            idf = math.log(1 + (n_chunks - df + 0.5) / (df + 0.5))
+            pairs = postings[2 * start:2 * end].tolist()
+            for chunk_id, tf in zip(pairs[::2], pairs[1::2]):
+                length = chunks[4 * chunk_id + 3]
+                norm = tf + K1 * (1 - B + B * length / avgdl)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (K1 + 1) / norm
+
+        hits = []
+        for chunk_id, score in sorted(scores.items(), key=lambda s: s[1], reverse=True):
+            doc, n, page, _ = chunks[4 * chunk_id:4 * chunk_id + 4].tolist()
+            doc_id, filename = view["docs"][doc]
+            if names is not None:
+                if not names.get(doc_id):
+                    continue  # released since the snapshot was written
+                filename = ", ".join(names[doc_id])
+            start, end = view["textOffsets"][chunk_id], view["textOffsets"][chunk_id + 1]
+            hits.append(Hit(doc_id, filename, page, n, view["text"][start:end].tobytes().decode("utf-8"), score))
+            if len(hits) == k:
+                break
+        return hits
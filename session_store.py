@@ -0,0 +1,353 @@
+"""
+Room session snapshots, so a room can continue on another agent worker.
+
+A SessionRecorder writes the session to a SessionStore (SQLite) after every
+turn. A snapshot holds the pinned system prompt, the chat turns without video
+frames, the rolling summary and the notes taken. Only messages that changed
+since the previous write are stored. When a job for the same room starts
+again, for example after the worker was drained or restarted, the agent
+restores the snapshot and carries on instead of greeting the student again.
+Once the session is over (the student left or the room closed), the snapshot
+is deleted; it is kept only when the job stops for another reason, such as a
+drain, restart or crash.
+
+The store is a local file (SESSION_STORE). For rooms to move between
+machines, put it on storage all the workers share. Set SESSION_STORE to an
+empty string to turn snapshots off.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from livekit.agents import llm
+from livekit.agents.llm import ChatMessage
+
+from context_manager import SUMMARY_MESSAGE_ID, ChatContextManager, message_text
+
+logger = logging.getLogger("voice-agent")
+
+SESSION_STORE = os.getenv("SESSION_STORE", "agent_sessions.db")
+# Snapshots not updated for this many seconds are deleted
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+# Changes made within this many seconds of each other are written together
+SESSION_SAVE_WINDOW = 0.2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    room TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    room TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (room, seq)
+);
+CREATE INDEX IF NOT EXISTS ix_sessions_updated_at ON sessions (updated_at);
+"""
+
+
+def message_to_dict(msg: ChatMessage) -> Optional[dict]:
+    """A chat message as JSON-friendly data, without images. None for messages that are only a frame."""
+    data = {"id": msg.id, "role": msg.role, "text": message_text(msg)}
+    if msg.name:
+        data["name"] = msg.name
+    if msg.tool_call_id:
+        data["toolCallId"] = msg.tool_call_id
+        if not isinstance(msg.content, (str, list)) and msg.content is not None:
+            data["text"] = str(msg.content)
+    if msg.tool_calls:
+        data["toolCalls"] = [
+            {"id": call.tool_call_id, "name": call.function_info.name, "arguments": call.raw_arguments}
+            for call in msg.tool_calls
+        ]
+    if not data["text"] and "toolCalls" not in data and "toolCallId" not in data:
+        return None
+    return data
+
+
+def message_from_dict(data: dict, fnc_ctx: Optional[llm.FunctionContext]) -> Optional[ChatMessage]:
+    """Rebuild a chat message. None for tool calls to functions the current FunctionContext doesn't have."""
+    tool_calls = None
+    if "toolCalls" in data:
+        functions = fnc_ctx.ai_functions if fnc_ctx is not None else {}
+        if any(call["name"] not in functions for call in data["toolCalls"]):
+            return None
+        tool_calls = [
+            llm.FunctionCallInfo(
+                tool_call_id=call["id"],
+                function_info=functions[call["name"]],
+                raw_arguments=call["arguments"],
+                arguments=json.loads(call["arguments"] or "{}"),
+            )
+            for call in data["toolCalls"]
+        ]
+    return ChatMessage(
+        role=data["role"],
+        id=data["id"],
+        name=data.get("name"),
+        content=data["text"],
+        tool_calls=tool_calls,
+        tool_call_id=data.get("toolCallId"),
+    )
+
+
+class SessionStore:
+    """SQLite file of room snapshots, shared by all job processes on a worker. Calls block; run them in a thread."""
+
+    def __init__(self, path: str = SESSION_STORE, ttl: float = SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        # WAL lets one job write while others read; a lost last write after a power cut only costs one turn
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def load(self, room: str) -> Optional[dict]:
+        """The room's snapshot: its state plus `messages` as (seq, data) in order. None if there is none."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state FROM sessions WHERE room = ? AND updated_at > ?", (room, time.time() - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            rows = self._db.execute("SELECT seq, data FROM messages WHERE room = ? ORDER BY seq", (room,)).fetchall()
+        snapshot = json.loads(row[0])
+        snapshot["messages"] = [(seq, json.loads(data)) for seq, data in rows]
+        return snapshot
+
+    def save(self, room: str, state: Optional[str], upserts: list[tuple[int, str]], deletes: list[int]):
+        """Apply one incremental update in a single transaction. state=None keeps the stored state."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if state is not None:
+                    self._db.execute(
+                        "INSERT INTO sessions (room, state, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT (room) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                        (room, state, now),
+                    )
+                else:
+                    self._db.execute("UPDATE sessions SET updated_at = ? WHERE room = ?", (now, room))
+                self._db.executemany("DELETE FROM messages WHERE room = ? AND seq = ?", [(room, s) for s in deletes])
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO messages (room, seq, data) VALUES (?, ?, ?)",
+                    [(room, seq, data) for seq, data in upserts],
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def delete(self, room: str):
+        """Remove the room's snapshot."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM messages WHERE room = ?", (room,))
+                self._db.execute("DELETE FROM sessions WHERE room = ?", (room,))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def expire(self) -> int:
+        """Delete snapshots older than the TTL. Returns how many were removed."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "DELETE FROM messages WHERE room IN (SELECT room FROM sessions WHERE updated_at <= ?)", (cutoff,)
+                )
+                removed = self._db.execute("DELETE FROM sessions WHERE updated_at <= ?", (cutoff,)).rowcount
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return removed
+
+
+class SessionRecorder:
+    """
+    Keeps one room's snapshot in a SessionStore up to date.
+
+    `restore` applies a loaded snapshot to the initial chat context. After
+    `attach(assistant)`, every committed turn schedules a write. A single
+    background task does the writes, coalescing changes made in quick
+    succession. Each write only touches messages that were added, changed or
+    evicted since the last one. Set `ended` once the student has left; closing
+    then deletes the snapshot instead of writing it.
+    """
+
+    def __init__(self, store: SessionStore, room: str, context_manager: ChatContextManager):
+        self._store = store
+        self.room = room
+        self._context_manager = context_manager
+        self._assistant = None
+        self.notes: list[str] = []
+        self.whiteboard: Optional[str] = None
+        self._stored: dict[str, tuple[int, str]] = {}  # message id -> (seq, serialized data) as stored
+        self._stored_state: Optional[str] = None
+        self._next_seq = 0
+        self._dirty = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.ended = False
+        self.writes = 0
+
+    def restore(self, snapshot: dict, chat_ctx: llm.ChatContext, fnc_ctx: Optional[llm.FunctionContext]) -> int:
+        """Replace chat_ctx's contents with the snapshot's. Returns how many messages were restored."""
+        pinned = [m for m in chat_ctx.messages if m.role == "system"]
+        if snapshot["system"]:
+            pinned = [ChatMessage.create(text=text, role="system") for text in snapshot["system"]]
+        messages = list(pinned)
+        call_ids = set()
+        for seq, data in snapshot["messages"]:
+            self._stored[data["id"]] = (seq, json.dumps(data))
+            self._next_seq = max(self._next_seq, seq + 1)
+            # results of calls that could not be restored would be rejected by the model
+            if data.get("toolCallId") and data["toolCallId"] not in call_ids:
+                continue
+            msg = message_from_dict(data, fnc_ctx)
+            if msg is not None:
+                call_ids.update(call.tool_call_id for call in msg.tool_calls or [])
+                messages.append(msg)
+        chat_ctx.messages = messages
+
+        self.notes = list(snapshot.get("notes", []))
+        self.whiteboard = snapshot.get("whiteboard")
+        self._context_manager.restore(snapshot.get("summary", {}))
+        self._context_manager.compact(chat_ctx)
+        self._stored_state = self._state(chat_ctx)
+        return len(messages) - len(pinned)
+
+    def attach(self, assistant):
+        self._assistant = assistant
+        for event in ("user_speech_committed", "agent_speech_committed", "agent_speech_interrupted"):
+            assistant.on(event, lambda *_: self.mark_dirty())
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def aclose(self, ended: Optional[bool] = None):
+        """Write any pending change and stop; if the session has ended, delete the snapshot instead."""
+        if ended is not None:
+            self.ended = ended
+        self._closed = True
+        self._dirty.set()
+        if self._task is not None:
+            await self._task
+        if self.ended:
+            try:
+                await asyncio.to_thread(self._store.delete, self.room)
+            except Exception as e:
+                logger.warning(f"Failed to delete session snapshot for room {self.room}: {e}")
+        logger.info(
+            f"Session recorder: {self.writes} snapshot writes for room {self.room}"
+            + (", snapshot deleted as the session ended" if self.ended else "")
+        )
+
+    def mark_dirty(self):
+        self._dirty.set()
+
+    def add_note(self, notes: str):
+        """Record notes sent to the whiteboard, which now shows them."""
+        self.notes.append(notes)
+        self.whiteboard = notes
+        self.mark_dirty()
+
+    def set_whiteboard(self, text: str):
+        self.whiteboard = text
+        self.mark_dirty()
+
+    def _state(self, chat_ctx: llm.ChatContext) -> str:
+        system = []
+        for msg in chat_ctx.messages:
+            if msg.role != "system":
+                break
+            if msg.id != SUMMARY_MESSAGE_ID:
+                system.append(message_text(msg))
+        return json.dumps({
+            "system": system,
+            "summary": self._context_manager.snapshot(),
+            "notes": self.notes,
+            "whiteboard": self.whiteboard,
+        })
+
+    def _changes(self):
+        """
+        What to write: the state if it changed, (seq, data) of new or changed
+        messages, seqs of evicted ones, and what the store holds once written.
+        """
+        chat_ctx = self._assistant.chat_ctx
+        state = self._state(chat_ctx)
+        upserts = []
+        current = {}
+        for msg in chat_ctx.messages:
+            if msg.role == "system":
+                continue
+            data = message_to_dict(msg)
+            if data is None:
+                continue
+            serialized = json.dumps(data)
+            seq, stored = self._stored.get(msg.id, (None, None))
+            if seq is None:
+                seq = self._next_seq
+                self._next_seq += 1
+            if serialized != stored:
+                upserts.append((seq, serialized))
+            current[msg.id] = (seq, serialized)
+        deletes = [seq for msg_id, (seq, _) in self._stored.items() if msg_id not in current]
+        return (None if state == self._stored_state else state), upserts, deletes, (state, current)
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            if not self._closed:
+                await asyncio.sleep(SESSION_SAVE_WINDOW)
+            self._dirty.clear()
+            if self._assistant is not None and not (self._closed and self.ended):
+                try:
+                    # read on the event loop, where the chat context is changed; only the write goes to a thread
+                    state, upserts, deletes, stored = self._changes()
+                    await asyncio.to_thread(self._store.save, self.room, state, upserts, deletes)
+                    self._stored_state, self._stored = stored
+                    self.writes += 1
+                except Exception as e:
+                    # the transaction was rolled back, so the next write diffs against the same stored snapshot
+                    logger.warning(f"Failed to save session snapshot for room {self.room}: {e}")
+            if self._closed:
+                return
+
+
+async def load_session(store: SessionStore, room: str) -> Optional[dict]:
+    """The room's snapshot, if a previous job left one. Expired snapshots are cleared first."""
+    started = time.perf_counter()
+    try:
+        removed = await asyncio.to_thread(store.expire)
+        snapshot = await asyncio.to_thread(store.load, room)
+    except Exception as e:
+        logger.warning(f"Failed to load session snapshot for room {room}: {e}")
+        return None
+    if removed:
+        logger.info(f"Removed {removed} expired session snapshots")
+    if snapshot is not None:
+        logger.info(
+            f"Loaded session snapshot for room {room} ({len(snapshot['messages'])} messages) "
+            f"in {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+    return snapshot
@@ -0,0 +1,374 @@
+"""
+Speculative LLM requests on interim transcripts, enabled with SPECULATIVE_LLM=1.
+
+The pipeline starts a reply only after the final transcript arrives and the
+end of the user's turn is confirmed. SpeculativeSTT watches transcripts on
+their way to the pipeline. Once the words heard so far stop changing, the
+Speculator prepares the turn on a copy of the conversation (frame capture,
+context trimming) and starts the LLM request for that text. The session is
+left untouched until the speculation is used. When the pipeline then asks
+for the reply:
+
+- if its transcript matches and the conversation is still the one the
+  speculation started from, the captured frame is kept, the output buffered
+  so far is handed over and the request keeps streaming;
+- otherwise the speculative request is cancelled.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from livekit.agents import DEFAULT_API_CONNECT_OPTIONS, APIConnectOptions, llm, stt, utils
+
+from agent_metrics import TurnMetrics
+from context_manager import estimate_tokens, message_text
+
+logger = logging.getLogger("voice-agent")
+
+SPECULATIVE_LLM = os.getenv("SPECULATIVE_LLM", "0") == "1"
+# An interim transcript unchanged for this many seconds is treated as stable
+SPECULATIVE_STABLE_DELAY = float(os.getenv("SPECULATIVE_STABLE_DELAY", "0.3"))
+SPECULATIVE_MIN_WORDS = int(os.getenv("SPECULATIVE_MIN_WORDS", "2"))
+
+
+def normalize(text: str) -> str:
+    """Transcript text compared case- and punctuation-insensitively."""
+    return " ".join(re.sub(r"[^\w\s']", " ", text.lower()).split())
+
+
+class _Pending:
+    """A speculation being prepared: the turn is being prepared, the LLM request not started yet."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.key = normalize(text)
+        self.started = time.perf_counter()
+        self.superseded = False
+        self.base: list[str] = []  # ids of the messages the speculation was made on
+        self.commit: Optional[Callable[[Any], None]] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class Speculation:
+    """A speculative LLM request and the chunks it has produced so far."""
+
+    def __init__(self, pending: _Pending, stream: llm.LLMStream):
+        self.pending = pending
+        self.stream = stream
+        self.first_chunk: Optional[float] = None
+        self.completion_chunks = 0
+        self.usage: Optional[llm.CompletionUsage] = None
+        self.error: Optional[Exception] = None
+        self.chunks = utils.aio.Chan[llm.ChatChunk]()
+        self._task = asyncio.create_task(self._buffer())
+
+    async def _buffer(self):
+        try:
+            async for chunk in self.stream:
+                if self.first_chunk is None:
+                    self.first_chunk = time.perf_counter()
+                if chunk.usage is not None:
+                    self.usage = chunk.usage
+                if chunk.choices:
+                    self.completion_chunks += 1
+                self.chunks.send_nowait(chunk)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.chunks.close()
+
+    def wasted_tokens(self) -> int:
+        """Tokens spent on this request, estimated when it was cut off before usage came back."""
+        if self.usage is not None:
+            return self.usage.total_tokens
+        prompt = sum(estimate_tokens(m) for m in self.stream.chat_ctx.messages)
+        return prompt + self.completion_chunks  # about one token per streamed chunk
+
+    async def cancel(self):
+        await utils.aio.gracefully_cancel(self._task)
+        await self.stream.aclose()
+
+
+class ReplayLLMStream(llm.LLMStream):
+    """
+    Hands a speculation's buffered and still-arriving chunks to the pipeline as if it were a new request.
+
+    The speculative request reports its own usage metrics; this stream only
+    records the turn's llm_ttft, counted from the moment the pipeline asked.
+    """
+
+    def __init__(self, llm_: llm.LLM, speculation: Speculation, metrics: TurnMetrics):
+        self._requested = time.perf_counter()
+        super().__init__(
+            llm_,
+            chat_ctx=speculation.stream.chat_ctx,
+            fnc_ctx=speculation.stream.fnc_ctx,
+            conn_options=DEFAULT_API_CONNECT_OPTIONS,
+        )
+        self._speculation = speculation
+        self._metrics = metrics
+
+    @property
+    def function_calls(self) -> list[llm.FunctionCallInfo]:
+        return self._speculation.stream.function_calls
+
+    def execute_functions(self) -> list[llm.CalledFunction]:
+        return self._speculation.stream.execute_functions()
+
+    async def _metrics_monitor_task(self, event_aiter):
+        # drained so the tee doesn't buffer every chunk for it
+        async for _ in event_aiter:
+            pass
+
+    async def _main_task(self):
+        # the request has already been made; there is nothing to retry
+        await self._run()
+
+    async def _run(self):
+        first = True
+        async for chunk in self._speculation.chunks:
+            if first:
+                self._metrics.record("llm_ttft", time.perf_counter() - self._requested)
+                first = False
+            self._event_ch.send_nowait(chunk)
+        if self._speculation.error is not None:
+            raise self._speculation.error
+
+    async def aclose(self) -> None:
+        await super().aclose()
+        await self._speculation.cancel()
+
+
+class Speculator:
+    """
+    Starts replies on stable transcripts and hands them over to the pipeline.
+
+    Feed it speech events through SpeculativeSTT, pass `self.before_llm_cb` to
+    the VoicePipelineAgent and call `attach(assistant)` before starting it.
+    One speculation runs at a time; a changed transcript supersedes it.
+
+    `prepare_turn(chat_ctx)` does what before_llm_cb does to the turn's copy
+    of the context, without touching the session, and returns a function that
+    applies the rest to the assistant once the speculation is used.
+    """
+
+    def __init__(
+        self,
+        before_llm_cb: Callable[..., Awaitable],
+        prepare_turn: Callable[[llm.ChatContext], Awaitable[Callable[[Any], None]]],
+        metrics: TurnMetrics,
+        stable_delay: float = SPECULATIVE_STABLE_DELAY,
+        min_words: int = SPECULATIVE_MIN_WORDS,
+    ):
+        self._before_llm_cb = before_llm_cb
+        self._prepare_turn = prepare_turn
+        self.metrics = metrics
+        self.stable_delay = stable_delay
+        self.min_words = min_words
+        self._assistant = None
+        self._agent_speaking = False
+        self._finals: list[str] = []  # final transcript segments of the current user turn
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._pending: Optional[_Pending] = None
+        self._discards: set[asyncio.Task] = set()
+        self.committed = 0
+        self.cancelled = 0
+        self.saved_seconds = 0.0
+        self.wasted_tokens = 0
+
+    def attach(self, assistant):
+        self._assistant = assistant
+        assistant.on("agent_started_speaking", lambda: setattr(self, "_agent_speaking", True))
+        assistant.on("agent_stopped_speaking", lambda: setattr(self, "_agent_speaking", False))
+        assistant.on("user_speech_committed", self._on_user_speech_committed)
+
+    async def aclose(self):
+        self._cancel_timer()
+        if self._pending is not None:
+            await self._discard(self._pending)
+            self._pending = None
+        if self._discards:
+            await asyncio.gather(*self._discards, return_exceptions=True)
+        logger.info(
+            f"Speculative LLM: {self.committed} committed, {self.cancelled} cancelled, "
+            f"{self.saved_seconds:.2f}s saved, ~{self.wasted_tokens} tokens wasted"
+        )
+
+    def on_speech_event(self, ev: stt.SpeechEvent):
+        text = ev.alternatives[0].text if ev.alternatives else ""
+        if not text:
+            return
+        if ev.type == stt.SpeechEventType.FINAL_TRANSCRIPT:
+            # final segments won't change, so there's no need to wait for them to settle
+            self._finals.append(text)
+            self._cancel_timer()
+            self._speculate(" ".join(self._finals))
+        elif ev.type == stt.SpeechEventType.INTERIM_TRANSCRIPT:
+            self._cancel_timer()
+            candidate = " ".join(self._finals + [text])
+            self._timer = asyncio.get_running_loop().call_later(self.stable_delay, self._speculate, candidate)
+
+    def _on_user_speech_committed(self, msg: llm.ChatMessage):
+        # the pipeline drops the answered question from its transcript the same way
+        rest = " ".join(self._finals)[len(message_text(msg)):].strip()
+        self._finals = [rest] if rest else []
+        # a speculation nobody asked for by now was made for a turn that is over
+        if self._pending is not None:
+            self._discard_later(self._pending)
+            self._pending = None
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _speculate(self, text: str):
+        self._timer = None
+        if self._assistant is None or self._agent_speaking or len(text.split()) < self.min_words:
+            return
+        if self._pending is not None:
+            if self._pending.key == normalize(text):
+                return
+            self._discard_later(self._pending)
+        pending = _Pending(text)
+        pending.task = asyncio.create_task(self._prepare(pending))
+        self._pending = pending
+
+    async def _prepare(self, pending: _Pending) -> Optional[Speculation]:
+        # runs in its own task; the turn is timed by the callback that answers it
+        self.metrics.exclude_current_task()
+        assistant = self._assistant
+        chat_ctx = assistant.chat_ctx.copy()
+        pending.base = [m.id for m in chat_ctx.messages]
+        chat_ctx.append(role="user", text=pending.text)
+        try:
+            pending.commit = await self._prepare_turn(chat_ctx)
+            # preparing may take a moment; don't pay for a request that is already outdated
+            if pending.superseded:
+                return None
+            stream = assistant.llm.chat(chat_ctx=chat_ctx, fnc_ctx=assistant.fnc_ctx)
+        except Exception as e:
+            logger.warning(f"Speculative LLM request failed to start: {e}")
+            return None
+        return Speculation(pending, stream)
+
+    def _discard_later(self, pending: _Pending):
+        task = asyncio.create_task(self._discard(pending))
+        self._discards.add(task)
+        task.add_done_callback(self._discards.discard)
+
+    async def _discard(self, pending: _Pending):
+        # the request may be starting; wait for it so the tokens it used are counted
+        pending.superseded = True
+        speculation = await pending.task
+        wasted = 0
+        if speculation is not None:
+            await speculation.cancel()
+            wasted = speculation.wasted_tokens()
+        self.cancelled += 1
+        self.wasted_tokens += wasted
+        self.metrics.record_speculation("cancelled", 0.0, wasted)
+
+    async def before_llm_cb(self, assistant, chat_ctx: llm.ChatContext):
+        """
+        Replays the speculation if it was made for this turn's transcript and
+        conversation, else runs the real callback.
+        """
+        self._cancel_timer()
+        pending, self._pending = self._pending, None
+        last = chat_ctx.messages[-1] if chat_ctx.messages else None
+        question = message_text(last) if last is not None and last.role == "user" else ""
+
+        if pending is not None:
+            # e.g. an interrupted reply or tool results added since the speculation started
+            same_history = pending.base == [m.id for m in chat_ctx.messages[:-1]]
+            if pending.key == normalize(question) and same_history:
+                speculation = await pending.task
+                if speculation is not None and speculation.error is None:
+                    pending.commit(assistant)
+                    # head start of the request, up to the point its first token arrived
+                    saved = time.perf_counter() - pending.started
+                    if speculation.first_chunk is not None:
+                        saved = min(saved, speculation.first_chunk - pending.started)
+                    self.committed += 1
+                    self.saved_seconds += saved
+                    self.metrics.record_speculation("committed", saved, 0)
+                    return ReplayLLMStream(assistant.llm, speculation, self.metrics)
+
+            await self._discard(pending)
+
+        return await self._before_llm_cb(assistant, chat_ctx)
+
+
+class SpeculativeSTT(stt.STT):
+    """Wraps a streaming STT and shows every speech event to a Speculator on its way to the pipeline."""
+
+    def __init__(self, wrapped: stt.STT, speculator: Speculator):
+        super().__init__(capabilities=wrapped.capabilities)
+        self._wrapped = wrapped
+        self.speculator = speculator
+        self._label = wrapped.label
+
+        @self._wrapped.on("metrics_collected")
+        def _forward_metrics(*args, **kwargs):
+            self.emit("metrics_collected", *args, **kwargs)
+
+    async def _recognize_impl(self, buffer, *, language, conn_options: APIConnectOptions) -> stt.SpeechEvent:
+        return await self._wrapped.recognize(buffer, language=language, conn_options=conn_options)
+
+    async def recognize(self, buffer, *, language=None, conn_options=DEFAULT_API_CONNECT_OPTIONS) -> stt.SpeechEvent:
+        # the wrapped STT reports its own metrics
+        return await self._recognize_impl(buffer, language=language, conn_options=conn_options)
+
+    def stream(self, *, language: Optional[str] = None, conn_options=DEFAULT_API_CONNECT_OPTIONS) -> stt.RecognizeStream:
+        inner = self._wrapped.stream(language=language, conn_options=conn_options)
+        return SpeculativeRecognizeStream(stt=self, inner=inner, conn_options=conn_options)
+
+    async def aclose(self) -> None:
+        await self._wrapped.aclose()
+
+
+class SpeculativeRecognizeStream(stt.RecognizeStream):
+    def __init__(self, *, stt: SpeculativeSTT, inner: stt.RecognizeStream, conn_options: APIConnectOptions):
+        super().__init__(stt=stt, conn_options=conn_options)
+        self._inner = inner
+        self._speculator = stt.speculator
+
+    async def _metrics_monitor_task(self, event_aiter):
+        # the wrapped stream reports its own metrics; drained so the tee doesn't buffer every event for it
+        async for _ in event_aiter:
+            pass
+
+    async def _main_task(self):
+        # the wrapped stream already reconnects on errors
+        await self._run()
+
+    async def _run(self):
+        async def _forward_input():
+            async for frame in self._input_ch:
+                if isinstance(frame, self._FlushSentinel):
+                    self._inner.flush()
+                else:
+                    self._inner.push_frame(frame)
+            self._inner.end_input()
+
+        async def _forward_events():
+            async for ev in self._inner:
+                try:
+                    self._speculator.on_speech_event(ev)
+                except Exception as e:
+                    logger.warning(f"Speculation failed: {e}")
+                self._event_ch.send_nowait(ev)
+
+        tasks = [
+            asyncio.create_task(_forward_input(), name="forward_input"),
+            asyncio.create_task(_forward_events(), name="forward_events"),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await utils.aio.gracefully_cancel(*tasks)
+            await self._inner.aclose()
@@ -0,0 +1,92 @@
+"""
+before_llm_cb attaches a frame again once the last one sent has been trimmed out of the context,
+even if the camera shows the same thing.
+
+Run with `python -m pytest`.
+"""
+import asyncio
+import types
+
+from livekit import rtc
+from livekit.agents import llm
+
+from agent import make_before_llm_cb
+from agent_metrics import TurnMetrics
+from context_manager import ChatContextManager, has_image
+from frame_sampler import FramePreprocessor
+
+
+def solid_frame(color: tuple[int, int, int]) -> rtc.VideoFrame:
+    width, height = 64, 48
+    pixel = bytes(color) + b"\xff"
+    return rtc.VideoFrame(width, height, rtc.VideoBufferType.RGBA, pixel * (width * height))
+
+
+def gradient_frame() -> rtc.VideoFrame:
+    width, height = 64, 48
+    data = bytearray()
+    for y in range(height):
+        for x in range(width):
+            data += bytes((x * 4 % 256, y * 5 % 256, (x * y) % 256, 255))
+    return rtc.VideoFrame(width, height, rtc.VideoBufferType.RGBA, bytes(data))
+
+
+class Turns:
+    """Drives before_llm_cb the way the pipeline does: a per-turn copy of the history plus the new question."""
+
+    def __init__(self, frame: rtc.VideoFrame):
+        self.frame_sampler = types.SimpleNamespace(latest=lambda: frame)
+        self.preprocessor = FramePreprocessor()
+        self.context_manager = ChatContextManager(max_tokens=1500, max_images=2)
+        self.assistant = types.SimpleNamespace(chat_ctx=llm.ChatContext().append(role="system", text="You are a tutor."))
+        self.before_llm_cb = make_before_llm_cb(
+            self.frame_sampler, self.preprocessor, self.context_manager, TurnMetrics("test", path=None)
+        )
+
+    def ask(self, question: str) -> llm.ChatContext:
+        self.assistant.chat_ctx.append(role="user", text=question)
+        chat_ctx = self.assistant.chat_ctx.copy()
+        asyncio.run(self.before_llm_cb(self.assistant, chat_ctx))
+        return chat_ctx
+
+    def answer(self, text: str):
+        self.assistant.chat_ctx.append(role="assistant", text=text)
+
+
+def images(chat_ctx: llm.ChatContext) -> int:
+    return sum(has_image(m) for m in chat_ctx.messages)
+
+
+def test_unchanged_frame_is_skipped_while_the_last_one_is_in_context():
+    turns = Turns(gradient_frame())
+    assert images(turns.ask("What is on the board?")) == 1
+    turns.answer("A diagram.")
+    assert images(turns.ask("And now?")) == 1
+    assert turns.preprocessor.sent == 1
+    assert turns.preprocessor.skipped == 1
+
+
+def test_unchanged_frame_is_sent_again_after_eviction():
+    turns = Turns(gradient_frame())
+    assert images(turns.ask("What is on the board?")) == 1
+    first_frame = next(m.id for m in turns.assistant.chat_ctx.messages if has_image(m))
+    turns.answer("A diagram.")
+    # long turns push the frame out of the token budget
+    for i in range(6):
+        turns.ask(f"Question {i}: " + "explain this in more detail " * 40)
+        turns.answer("Sure. " + "here is a longer explanation " * 40)
+
+    chat_ctx = turns.ask("What is on the board now?")
+    assert images(chat_ctx) == 1
+    assert has_image(chat_ctx.messages[-1])
+    assert first_frame not in {m.id for m in chat_ctx.messages}
+    assert turns.preprocessor.sent > 1
+
+
+def test_changed_frame_is_sent_without_a_reset():
+    turns = Turns(solid_frame((10, 10, 10)))
+    assert images(turns.ask("What is on the board?")) == 1
+    turns.answer("Nothing yet.")
+    turns.frame_sampler.latest = gradient_frame
+    assert has_image(turns.ask("And now?").messages[-1])
+    assert turns.preprocessor.sent > 1
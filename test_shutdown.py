@@ -0,0 +1,87 @@
+"""
+The entrypoint's shutdown callbacks, run the way the job process runs them when a room ends.
+
+Run with `python -m pytest`.
+"""
+import asyncio
+import os
+import types
+
+import pytest
+from livekit import rtc
+from livekit.agents import JobContext, stt
+
+import agent
+from session_store import SessionStore
+from test_speculative import FakeLLM
+from tool_http import ToolHTTP
+from worker_load import WORKER_LOAD_DIR
+
+
+class FakeSTT(stt.STT):
+    def __init__(self):
+        super().__init__(capabilities=stt.STTCapabilities(streaming=True, interim_results=True))
+
+    async def _recognize_impl(self, buffer, *, language=None, conn_options=None) -> stt.SpeechEvent:
+        return stt.SpeechEvent(
+            type=stt.SpeechEventType.FINAL_TRANSCRIPT,
+            alternatives=[stt.SpeechData(language="en", text="hello")],
+        )
+
+
+class FakeJobContext:
+    """The parts of JobContext the entrypoint uses, with its real add_shutdown_callback."""
+
+    add_shutdown_callback = JobContext.add_shutdown_callback
+
+    def __init__(self, openai_client):
+        self._shutdown_callbacks = []
+        self.room = rtc.Room()
+        self.job = types.SimpleNamespace(id="test-job", room=types.SimpleNamespace(name="test-room"))
+        # no "initial_ctx": the entrypoint stops there, after every shutdown callback is registered
+        self.proc = types.SimpleNamespace(
+            userdata={
+                "openai_client": openai_client,
+                "summary_llm": FakeLLM(),
+                "stt": FakeSTT(),
+                "http": ToolHTTP(),
+                "doc_index": None,
+            }
+        )
+
+    async def connect(self, **kwargs):
+        pass
+
+    async def wait_for_participant(self):
+        return types.SimpleNamespace(identity="student")
+
+
+@pytest.mark.parametrize("reason", ["", "room disconnected"])
+def test_shutdown_callbacks_accept_the_reason(reason, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(agent, "SPECULATIVE_LLM", True)
+    monkeypatch.setattr(agent, "SESSION_STORE", "sessions.db")
+    monkeypatch.setattr(agent, "SessionStore", lambda: SessionStore(str(tmp_path / "sessions.db")))
+
+    async def run():
+        warm_up = asyncio.Event()
+
+        async def retrieve(model):
+            warm_up.set()
+            await asyncio.Event().wait()
+
+        openai_client = types.SimpleNamespace(models=types.SimpleNamespace(retrieve=retrieve))
+        ctx = FakeJobContext(openai_client)
+        with pytest.raises(KeyError, match="initial_ctx"):
+            await agent.entrypoint(ctx)
+        await warm_up.wait()
+        load_file = os.path.join(WORKER_LOAD_DIR, "test-job.json")
+
+        # what the job process does once the room ends
+        await asyncio.gather(*(callback(reason) for callback in ctx._shutdown_callbacks))
+
+        assert len(ctx._shutdown_callbacks) == 8
+        assert not os.path.exists(load_file)
+        assert ctx.proc.userdata["http"]._session is None
+
+    asyncio.run(run())
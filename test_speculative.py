@@ -0,0 +1,129 @@
+"""
+Speculative replies are prepared on a copy of the conversation and only change the session once used.
+
+Run with `python -m pytest`.
+"""
+import asyncio
+import types
+
+from livekit import rtc
+from livekit.agents import DEFAULT_API_CONNECT_OPTIONS, llm
+
+from agent import make_before_llm_cb, make_prepare_turn
+from agent_metrics import TurnMetrics
+from context_manager import ChatContextManager, has_image
+from frame_sampler import FramePreprocessor
+from speculative import ReplayLLMStream, Speculator
+
+
+def gradient_frame() -> rtc.VideoFrame:
+    width, height = 64, 48
+    data = bytearray()
+    for y in range(height):
+        for x in range(width):
+            data += bytes((x * 4 % 256, y * 5 % 256, (x * y) % 256, 255))
+    return rtc.VideoFrame(width, height, rtc.VideoBufferType.RGBA, bytes(data))
+
+
+class FakeLLM(llm.LLM):
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+
+    def chat(self, *, chat_ctx, conn_options=DEFAULT_API_CONNECT_OPTIONS, fnc_ctx=None, **kwargs):
+        self.requests += 1
+        return FakeLLMStream(self, chat_ctx=chat_ctx, fnc_ctx=fnc_ctx, conn_options=conn_options)
+
+
+class FakeLLMStream(llm.LLMStream):
+    async def _run(self):
+        for word in ("Sure,", " here", " it is."):
+            self._event_ch.send_nowait(
+                llm.ChatChunk(request_id="fake", choices=[llm.Choice(delta=llm.ChoiceDelta(role="assistant", content=word))])
+            )
+
+
+class Session:
+    """A Speculator wired to the agent's callbacks, with a stand-in for the VoicePipelineAgent."""
+
+    def __init__(self):
+        self.preprocessor = FramePreprocessor()
+        self.metrics = TurnMetrics("test", path=None)
+        frame_sampler = types.SimpleNamespace(latest=gradient_frame)
+        context_manager = ChatContextManager(max_tokens=1500, max_images=2)
+        args = (frame_sampler, self.preprocessor, context_manager, self.metrics)
+        self.speculator = Speculator(make_before_llm_cb(*args), make_prepare_turn(*args), self.metrics)
+        self.handlers = {}
+        self.assistant = types.SimpleNamespace(
+            chat_ctx=llm.ChatContext().append(role="system", text="You are a tutor."),
+            llm=FakeLLM(),
+            fnc_ctx=None,
+            on=lambda event, handler: self.handlers.setdefault(event, []).append(handler),
+        )
+        self.speculator.attach(self.assistant)
+
+    async def speculate(self, text: str):
+        self.speculator._speculate(text)
+        await self.speculator._pending.task
+
+    async def reply(self, question: str):
+        """What the pipeline does: before_llm_cb on a copy of the history plus the question."""
+        chat_ctx = self.assistant.chat_ctx.copy().append(role="user", text=question)
+        return await self.speculator.before_llm_cb(self.assistant, chat_ctx), chat_ctx
+
+
+def images(chat_ctx: llm.ChatContext) -> int:
+    return sum(has_image(m) for m in chat_ctx.messages)
+
+
+def test_speculation_leaves_the_session_alone_until_used():
+    async def run():
+        session = Session()
+        await session.speculate("What is on the board?")
+        assert len(session.assistant.chat_ctx.messages) == 1
+        assert session.preprocessor.sent == 0
+
+        stream, _ = await session.reply("what is on the board")
+        assert isinstance(stream, ReplayLLMStream)
+        assert images(session.assistant.chat_ctx) == 1
+        assert session.preprocessor.sent == 1
+        assert session.speculator.committed == 1
+        await stream.aclose()
+
+    asyncio.run(run())
+
+
+def test_speculation_on_a_different_history_is_discarded():
+    async def run():
+        session = Session()
+        await session.speculate("What is on the board?")
+        # e.g. an interrupted reply committed after the speculation started
+        session.assistant.chat_ctx.append(role="assistant", text="Let me look...")
+
+        stream, chat_ctx = await session.reply("What is on the board?")
+        assert stream is None
+        assert session.speculator.cancelled == 1
+        assert session.assistant.llm.requests == 1
+        # the discarded speculation's frame was never recorded, so the real turn sends it
+        assert has_image(chat_ctx.messages[-1])
+        assert images(session.assistant.chat_ctx) == 1
+        assert session.preprocessor.sent == 1
+
+    asyncio.run(run())
+
+
+def test_committed_question_is_dropped_from_the_transcript():
+    async def run():
+        session = Session()
+        speculator = session.speculator
+        speculator._finals = ["Explain photosynthesis.", "And respiration?"]
+        await session.speculate("Explain photosynthesis.")
+        question = llm.ChatMessage.create(text="Explain photosynthesis.", role="user")
+        for handler in session.handlers["user_speech_committed"]:
+            handler(question)
+        assert speculator._finals == ["And respiration?"]
+        assert speculator._pending is None
+        await speculator.aclose()
+        assert speculator.cancelled == 1
+
+    asyncio.run(run())
@@ -0,0 +1,120 @@
+"""
+ToolHTTP caching against a local stub HTTP server.
+
+Run with `python -m pytest`.
+"""
+import asyncio
+import socket
+
+import pytest
+from aiohttp import web
+
+from tool_http import ToolHTTP, ToolHTTPError
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def with_stub_server(test):
+    """Run test(base_url, hits) against a server that counts the requests each path receives."""
+    hits: dict[str, int] = {}
+
+    async def handler(request: web.Request):
+        hits[request.path] = hits.get(request.path, 0) + 1
+        if request.path == "/missing":
+            return web.Response(status=404, text="not found")
+        return web.Response(text=f"{request.method} {request.path} #{hits[request.path]}")
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    try:
+        await test(f"http://127.0.0.1:{port}", hits)
+    finally:
+        await runner.cleanup()
+
+
+def run(test):
+    asyncio.run(with_stub_server(test))
+
+
+def test_get_is_served_from_cache():
+    async def test(base, hits):
+        http = ToolHTTP()
+        try:
+            first = await http.get(f"{base}/weather", params={"q": "Paris"})
+            second = await http.get(f"{base}/weather", params={"q": "Paris"})
+            other = await http.get(f"{base}/weather", params={"q": "Rome"})
+        finally:
+            await http.aclose()
+        assert first.text() == second.text() == "GET /weather #1"
+        assert other.text() == "GET /weather #2"
+        assert hits["/weather"] == 2
+        assert http.cache.stats()["hits"] == 1
+
+    run(test)
+
+
+def test_post_is_not_cached_by_default():
+    async def test(base, hits):
+        http = ToolHTTP()
+        try:
+            await http.post(f"{base}/notes", json_body={"text": "x"})
+            second = await http.post(f"{base}/notes", json_body={"text": "x"})
+        finally:
+            await http.aclose()
+        assert second.text() == "POST /notes #2"
+        assert hits["/notes"] == 2
+
+    run(test)
+
+
+def test_post_is_cached_when_the_caller_opts_in():
+    async def test(base, hits):
+        http = ToolHTTP()
+        try:
+            await http.post(f"{base}/lookup", json_body={"id": 1}, cache=True)
+            await http.post(f"{base}/lookup", json_body={"id": 1}, cache=True)
+        finally:
+            await http.aclose()
+        assert hits["/lookup"] == 1
+
+    run(test)
+
+
+def test_cache_can_be_bypassed_and_entries_expire():
+    async def test(base, hits):
+        http = ToolHTTP()
+        try:
+            await http.get(f"{base}/fresh")
+            await http.get(f"{base}/fresh", cache=False)
+            await http.get(f"{base}/short", ttl=0.05)
+            await asyncio.sleep(0.1)
+            await http.get(f"{base}/short", ttl=0.05)
+        finally:
+            await http.aclose()
+        assert hits["/fresh"] == 2
+        assert hits["/short"] == 2
+
+    run(test)
+
+
+def test_errors_are_not_cached():
+    async def test(base, hits):
+        http = ToolHTTP()
+        try:
+            for _ in range(2):
+                with pytest.raises(ToolHTTPError) as error:
+                    await http.get(f"{base}/missing")
+                assert error.value.status == 404
+        finally:
+            await http.aclose()
+        assert hits["/missing"] == 2
+
+    run(test)
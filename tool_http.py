@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import aiohttp
+
+from cache import TTLCache
+
+logger = logging.getLogger("voice-agent")
+
+TOOL_HTTP_TIMEOUT = float(os.getenv("TOOL_HTTP_TIMEOUT", "10"))
+TOOL_HTTP_MAX_CONNECTIONS = int(os.getenv("TOOL_HTTP_MAX_CONNECTIONS", "32"))
+TOOL_HTTP_CACHE_SIZE = int(os.getenv("TOOL_HTTP_CACHE_SIZE", "256"))
+TOOL_HTTP_CACHE_TTL = float(os.getenv("TOOL_HTTP_CACHE_TTL", "300"))
+# Only these methods are cached unless a request opts in with cache=True
+CACHEABLE_METHODS = frozenset({"GET", "HEAD"})
+
+
+class ToolHTTPError(Exception):
+    def __init__(self, url: str, status: int, text: str):
+        super().__init__(f"Request to {url} failed with status {status}: {text[:200]}")
+        self.url = url
+        self.status = status
+        self.text = text
+
+
+@dataclass
+class ToolResponse:
+    status: int
+    body: bytes
+
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+class ToolHTTP:
+    """
+    One pooled HTTP session per worker process, shared by every tool call.
+
+    Created in prewarm; the aiohttp session itself is opened on first use so
+    it binds to the job's event loop. Connections are kept alive between
+    calls, each request takes its own timeout, and successful GET and HEAD
+    responses are cached for `ttl` seconds keyed by method, URL, query and
+    JSON body.
+    """
+
+    def __init__(
+        self,
+        timeout: float = TOOL_HTTP_TIMEOUT,
+        max_connections: int = TOOL_HTTP_MAX_CONNECTIONS,
+        cache_size: int = TOOL_HTTP_CACHE_SIZE,
+        cache_ttl: float = TOOL_HTTP_CACHE_TTL,
+    ):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def aclose(self):
+        logger.info(f"Tool HTTP cache: {self.cache.stats()}")
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        params: Optional[dict] = None,
+        json_body: Any = None,
+        timeout: Optional[float] = None,
+        ttl: Optional[float] = None,
+        cache: Optional[bool] = None,
+    ) -> ToolResponse:
+        """
+        Send a request and return the full response. Non-2xx responses raise
+        ToolHTTPError; a timeout raises asyncio.TimeoutError. GET and HEAD are
+        cached by default: pass cache=False for requests whose answer must be
+        fresh, or cache=True for other methods known to be idempotent.
+        """
+        if cache is None:
+            cache = method.upper() in CACHEABLE_METHODS
+        key = None
+        if cache:
+            key = (
+                method.upper(),
+                url,
+                tuple(sorted((params or {}).items())),
+                json.dumps(json_body, sort_keys=True) if json_body is not None else None,
+            )
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        async with self.session.request(
+            method,
+            url,
+            params=params,
+            json=json_body,
+            timeout=aiohttp.ClientTimeout(total=timeout or self.timeout),
+        ) as response:
+            result = ToolResponse(status=response.status, body=await response.read())
+
+        if not 200 <= result.status < 300:
+            raise ToolHTTPError(url, result.status, result.text())
+        if key is not None:
+            self.cache.set(key, result, ttl=ttl)
+        return result
+
+    async def get(self, url: str, **kwargs) -> ToolResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> ToolResponse:
+        return await self.request("POST", url, **kwargs)
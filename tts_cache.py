@@ -0,0 +1,260 @@
+"""
+Audio cache in front of a TTS for phrases the tutor says over and over.
+
+Synthesized phrases are kept as 16-bit PCM in an in-memory LRU and in a
+content-addressed folder on disk, keyed by (voice, normalized text). A hit is
+played straight from the cache without calling the TTS service.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import struct
+from typing import Callable, Iterable, Optional
+
+from livekit import rtc
+from livekit.agents import APIConnectOptions, tts, utils
+
+from cache import TTLCache
+
+logger = logging.getLogger("voice-agent")
+
+TTS_CACHE_FOLDER = os.getenv("TTS_CACHE_FOLDER", "tts_cache")
+TTS_CACHE_SIZE = int(os.getenv("TTS_CACHE_SIZE", "128"))
+TTS_CACHE_MAX_FILES = int(os.getenv("TTS_CACHE_MAX_FILES", "2000"))
+# Longer sentences rarely repeat word for word, so they aren't worth storing
+TTS_CACHE_MAX_CHARS = int(os.getenv("TTS_CACHE_MAX_CHARS", "120"))
+
+# On-disk entry: magic, sample rate, channels, then raw interleaved int16 samples
+PCM_HEADER = struct.Struct("<4sIH")
+PCM_MAGIC = b"PCM1"
+# Cached audio is replayed in frames of this many milliseconds
+FRAME_MS = 50
+
+
+def phrase_key(text: str) -> str:
+    return " ".join(text.split())
+
+
+class PhraseAudio:
+    """Decoded audio for one phrase."""
+
+    def __init__(self, sample_rate: int, num_channels: int, pcm: bytes):
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.pcm = pcm
+
+    @classmethod
+    def from_frames(cls, frames: list[rtc.AudioFrame]) -> "PhraseAudio":
+        return cls(frames[0].sample_rate, frames[0].num_channels, b"".join(bytes(f.data) for f in frames))
+
+    def frames(self) -> Iterable[rtc.AudioFrame]:
+        bytes_per_frame = self.sample_rate * FRAME_MS // 1000 * self.num_channels * 2
+        for start in range(0, len(self.pcm), bytes_per_frame):
+            data = self.pcm[start:start + bytes_per_frame]
+            yield rtc.AudioFrame(
+                data=data,
+                sample_rate=self.sample_rate,
+                num_channels=self.num_channels,
+                samples_per_channel=len(data) // (2 * self.num_channels),
+            )
+
+    def to_bytes(self) -> bytes:
+        return PCM_HEADER.pack(PCM_MAGIC, self.sample_rate, self.num_channels) + self.pcm
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PhraseAudio":
+        magic, sample_rate, num_channels = PCM_HEADER.unpack_from(data)
+        if magic != PCM_MAGIC:
+            raise ValueError("not a cached phrase")
+        return cls(sample_rate, num_channels, data[PCM_HEADER.size:])
+
+
+class CachedTTS(tts.TTS):
+    """
+    Wraps a TTS with a phrase cache.
+
+    `voice` identifies everything that changes how text sounds (model, voice,
+    speed), so entries made with another voice are never played back. Short
+    phrases that miss are synthesized by the wrapped TTS and stored once they
+    have been fully received; longer text passes through untouched.
+    """
+
+    def __init__(
+        self,
+        wrapped: tts.TTS,
+        voice: str,
+        folder: Optional[str] = TTS_CACHE_FOLDER,
+        maxsize: int = TTS_CACHE_SIZE,
+        max_chars: int = TTS_CACHE_MAX_CHARS,
+    ):
+        super().__init__(
+            capabilities=wrapped.capabilities,
+            sample_rate=wrapped.sample_rate,
+            num_channels=wrapped.num_channels,
+        )
+        self._wrapped = wrapped
+        self.voice = voice
+        self.folder = folder
+        self.max_chars = max_chars
+        self._memory = TTLCache(maxsize=maxsize)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        @self._wrapped.on("metrics_collected")
+        def _forward_metrics(*args, **kwargs):
+            self.emit("metrics_collected", *args, **kwargs)
+
+    @property
+    def wrapped(self) -> tts.TTS:
+        return self._wrapped
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.voice}\n{phrase_key(text)}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key + ".pcm")
+
+    def lookup(self, text: str) -> Optional[PhraseAudio]:
+        """Cached audio for text from memory, then disk. Disk hits are promoted to memory."""
+        key = self._key(text)
+        audio = self._memory.get(key)
+        if audio is not None or not self.folder:
+            return audio
+        try:
+            with open(self._path(key), "rb") as f:
+                audio = PhraseAudio.from_bytes(f.read())
+        except (OSError, ValueError, struct.error):
+            return None
+        os.utime(self._path(key))  # recently used entries survive pruning
+        self.disk_hits += 1
+        self._memory.set(key, audio)
+        return audio
+
+    def store(self, text: str, audio: PhraseAudio):
+        key = self._key(text)
+        self._memory.set(key, audio)
+        if not self.folder:
+            return
+        tmp = self._path(key) + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(audio.to_bytes())
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            logger.warning(f"Could not write TTS cache entry: {e}")
+
+    def preload(self, phrases: Iterable[str], make_tts: Callable[[], tts.TTS]):
+        """Load phrases into memory, synthesizing the ones not on disk yet (see presynthesize)."""
+        self.prune()
+        missing = [text for text in phrases if self.lookup(text) is None]
+        for text, frames in presynthesize(make_tts, missing).items():
+            self.store(text, PhraseAudio.from_frames(frames))
+
+    def prune(self, max_files: int = TTS_CACHE_MAX_FILES):
+        """Delete the least recently used disk entries beyond max_files."""
+        if not self.folder:
+            return
+        entries = [e for e in os.scandir(self.folder) if e.name.endswith(".pcm")]
+        if len(entries) <= max_files:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - max_files]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def synthesize(self, text: str, *, conn_options: Optional[APIConnectOptions] = None) -> tts.ChunkedStream:
+        if len(text) > self.max_chars or not text.strip():
+            return self._wrapped.synthesize(text, conn_options=conn_options)
+        audio = self.lookup(text)
+        if audio is not None:
+            self.hits += 1
+            return CachedChunkedStream(tts=self, input_text=text, audio=audio, conn_options=conn_options)
+        self.misses += 1
+        return RecordingChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+    def stream(self, *, conn_options: Optional[APIConnectOptions] = None) -> tts.SynthesizeStream:
+        return self._wrapped.stream(conn_options=conn_options)
+
+    async def aclose(self) -> None:
+        logger.info(
+            f"TTS phrase cache: {self.hits} hits ({self.disk_hits} loaded from disk), {self.misses} misses"
+        )
+        await self._wrapped.aclose()
+
+
+class CachedChunkedStream(tts.ChunkedStream):
+    def __init__(
+        self,
+        *,
+        tts: CachedTTS,
+        input_text: str,
+        audio: PhraseAudio,
+        conn_options: Optional[APIConnectOptions] = None,
+    ):
+        super().__init__(tts=tts, input_text=input_text, conn_options=conn_options)
+        self._audio = audio
+
+    async def _run(self):
+        emitter = tts.SynthesizedAudioEmitter(event_ch=self._event_ch, request_id=utils.shortuuid())
+        for frame in self._audio.frames():
+            emitter.push(frame)
+        emitter.flush()
+
+
+class RecordingChunkedStream(tts.ChunkedStream):
+    """Forwards the wrapped TTS's audio as it arrives and caches it once complete."""
+
+    def __init__(self, *, tts: CachedTTS, input_text: str, conn_options: Optional[APIConnectOptions] = None):
+        super().__init__(tts=tts, input_text=input_text, conn_options=conn_options)
+        self._cache = tts
+
+    async def _metrics_monitor_task(self, event_aiter):
+        pass  # the wrapped stream reports its own metrics
+
+    async def _main_task(self):
+        # the wrapped stream already retries; retrying here would replay audio already sent
+        await self._run()
+
+    async def _run(self):
+        frames = []
+        async with self._cache.wrapped.synthesize(self.input_text, conn_options=self._conn_options) as inner:
+            async for ev in inner:
+                frames.append(ev.frame)
+                self._event_ch.send_nowait(ev)
+        if frames:
+            audio = PhraseAudio.from_frames(frames)
+            await asyncio.to_thread(self._cache.store, self.input_text, audio)
+
+
+def presynthesize(make_tts: Callable[[], tts.TTS], phrases: Iterable[str]) -> dict[str, list[rtc.AudioFrame]]:
+    """
+    Synthesize phrases to decoded frames outside any job, e.g. in prewarm.
+
+    Runs on a temporary event loop with a TTS instance built just for it, so
+    no connections bound to that loop leak into the job's TTS. Phrases that
+    fail are left out and will be synthesized live.
+    """
+    phrases = list(phrases)
+    if not phrases:
+        return {}
+
+    async def run():
+        synth = make_tts()
+        results = {}
+        try:
+            for text in phrases:
+                try:
+                    results[text] = [ev.frame async for ev in synth.synthesize(text)]
+                except Exception as e:
+                    logger.warning(f"Could not pre-synthesize {text!r}: {e}")
+        finally:
+            await synth.aclose()
+        return results
+
+    return asyncio.run(run())
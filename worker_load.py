@@ -0,0 +1,242 @@
+"""
+Load reporting and job admission for the agent worker.
+
+Each job runs in its own process, so the worker can't see how busy its rooms
+are. Every job process writes a small stats file (JobLoad) with the CPU its
+frame preprocessing uses and its in-flight LLM requests. The worker's
+`load_fnc` combines those with its session count and machine CPU. Its
+`request_fnc` declines rooms once the worker is at WORKER_MAX_SESSIONS or
+over the load threshold, so LiveKit offers them to another worker.
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from livekit.agents import JobRequest, Worker, llm, utils
+
+logger = logging.getLogger("voice-agent")
+
+WORKER_LOAD_DIR = os.getenv("WORKER_LOAD_DIR", os.path.join(tempfile.gettempdir(), "voice-agent-load"))
+WORKER_MAX_SESSIONS = int(os.getenv("WORKER_MAX_SESSIONS", "8"))
+# In-flight LLM requests across all rooms that count as a full worker
+WORKER_MAX_LLM_REQUESTS = int(os.getenv("WORKER_MAX_LLM_REQUESTS", "16"))
+# Share of the machine's CPUs that frame preprocessing may use before the worker counts as full
+WORKER_FRAME_CPU_BUDGET = float(os.getenv("WORKER_FRAME_CPU_BUDGET", "0.5"))
+# Reported to LiveKit: at or above this load the worker is marked full and declines rooms
+WORKER_LOAD_THRESHOLD = float(os.getenv("WORKER_LOAD_THRESHOLD", "0.75"))
+
+# Seconds between stats file writes; files not updated for JOB_STATS_STALE seconds belong to dead jobs
+JOB_STATS_INTERVAL = 2.0
+JOB_STATS_STALE = 15.0
+# Accepted jobs take a moment to show up in the worker's active jobs; count them until then
+ACCEPT_GRACE = 10.0
+
+
+class JobLoad:
+    """
+    Stats of one job, written to `<folder>/<job_id>.json` every JOB_STATS_INTERVAL.
+
+    Frame CPU comes from the FramePreprocessor's `cpu_seconds`, averaged over
+    the last few intervals. LLM requests are counted by TrackedLLM. With
+    folder=None nothing is written.
+    """
+
+    def __init__(self, job_id: str, frame_preprocessor=None, folder: Optional[str] = WORKER_LOAD_DIR):
+        self.job_id = job_id
+        self.folder = folder
+        self.frame_preprocessor = frame_preprocessor
+        self.llm_in_flight = 0
+        self._frame_cpu = utils.MovingAverage(5)
+        self._last_cpu_seconds = 0.0
+        self._last_sample = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.folder, f"{self.job_id}.json")
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def aclose(self):
+        if self._task is not None:
+            await utils.aio.gracefully_cancel(self._task)
+        if self.folder:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def llm_started(self):
+        self.llm_in_flight += 1
+
+    def llm_finished(self):
+        self.llm_in_flight = max(0, self.llm_in_flight - 1)
+
+    def sample(self) -> dict:
+        now = time.monotonic()
+        cpu_seconds = self.frame_preprocessor.cpu_seconds if self.frame_preprocessor is not None else 0.0
+        elapsed = now - self._last_sample
+        if elapsed > 0:
+            self._frame_cpu.add_sample((cpu_seconds - self._last_cpu_seconds) / elapsed)
+        self._last_cpu_seconds, self._last_sample = cpu_seconds, now
+        return {
+            "jobId": self.job_id,
+            "pid": os.getpid(),
+            "frameCpu": round(self._frame_cpu.get_avg(), 4),  # in CPU cores
+            "llmInFlight": self.llm_in_flight,
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(JOB_STATS_INTERVAL)
+            self._write(self.sample())
+
+    def _write(self, stats: dict):
+        if not self.folder:
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(stats, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write job load stats: {e}")
+
+
+class TrackedLLM(llm.LLM):
+    """Wraps an LLM and counts its in-flight requests on a JobLoad. A request ends when its stream reports metrics."""
+
+    def __init__(self, wrapped: llm.LLM, job_load: JobLoad):
+        super().__init__(capabilities=wrapped.capabilities)
+        self._wrapped = wrapped
+        self._job_load = job_load
+        self._label = wrapped.label
+
+        @self._wrapped.on("metrics_collected")
+        def _on_metrics(metrics):
+            self._job_load.llm_finished()
+            self.emit("metrics_collected", metrics)
+
+    def chat(self, **kwargs) -> llm.LLMStream:
+        stream = self._wrapped.chat(**kwargs)
+        self._job_load.llm_started()
+        return stream
+
+    async def aclose(self) -> None:
+        await self._wrapped.aclose()
+
+
+class WorkerLoad:
+    """The worker's view of its load, refreshed by load_fnc and consulted by request_fnc."""
+
+    def __init__(
+        self,
+        folder: str = WORKER_LOAD_DIR,
+        max_sessions: int = WORKER_MAX_SESSIONS,
+        max_llm_requests: int = WORKER_MAX_LLM_REQUESTS,
+        frame_cpu_budget: float = WORKER_FRAME_CPU_BUDGET,
+        threshold: float = WORKER_LOAD_THRESHOLD,
+    ):
+        self.folder = folder
+        self.max_sessions = max_sessions
+        self.max_llm_requests = max_llm_requests
+        self.frame_cpu_budget = frame_cpu_budget
+        self.threshold = threshold
+        self.load = 0.0
+        self.sessions = 0
+        self.components: dict[str, float] = {}
+        self._accepted: list[float] = []  # accept times of jobs not yet seen as active
+        self._cpu_monitor = utils.hw.get_cpu_monitor()
+        self._lock = threading.Lock()
+
+    def update(self, job_ids: set[str]) -> float:
+        """Recompute the load from the active jobs' stats files. Blocks for about half a second sampling CPU."""
+        cpu = self._cpu_monitor.cpu_percent(interval=0.5)
+        stats = self._read_stats(job_ids)
+        frame_cpu = sum(s.get("frameCpu", 0.0) for s in stats)
+        llm_requests = sum(s.get("llmInFlight", 0) for s in stats)
+        components = {
+            "sessions": len(job_ids) / self.max_sessions,
+            "cpu": cpu,
+            "frameCpu": frame_cpu / (self._cpu_monitor.cpu_count() * self.frame_cpu_budget),
+            "llmRequests": llm_requests / self.max_llm_requests,
+        }
+        with self._lock:
+            # jobs that are now active no longer need to be counted as just accepted
+            started = max(0, len(job_ids) - self.sessions)
+            self._accepted = self._accepted[started:]
+            self.sessions = len(job_ids)
+            self.components = components
+            self.load = min(1.0, max(components.values()))
+            return self.load
+
+    def admit(self) -> Optional[str]:
+        """Reserve a session for a new job, or return why the job should be declined."""
+        with self._lock:
+            now = time.monotonic()
+            self._accepted = [t for t in self._accepted if now - t < ACCEPT_GRACE]
+            if self.sessions + len(self._accepted) >= self.max_sessions:
+                return f"at the limit of {self.max_sessions} sessions"
+            if self.load >= self.threshold:
+                busiest = max(self.components, key=self.components.get)
+                return f"load {self.load:.2f} is over {self.threshold} ({busiest})"
+            self._accepted.append(now)
+            return None
+
+    def _read_stats(self, job_ids: set[str]) -> list[dict]:
+        stats = []
+        try:
+            entries = list(os.scandir(self.folder))
+        except FileNotFoundError:
+            return stats
+        now = time.time()
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                fresh = now - entry.stat().st_mtime < JOB_STATS_STALE
+                if entry.name[:-len(".json")] in job_ids:
+                    if fresh:
+                        with open(entry.path, encoding="utf-8") as f:
+                            stats.append(json.load(f))
+                elif not fresh:
+                    os.remove(entry.path)  # left behind by a job that died
+            except (OSError, ValueError):
+                continue
+        return stats
+
+
+_worker_load: Optional[WorkerLoad] = None
+
+
+def get_worker_load() -> WorkerLoad:
+    global _worker_load
+    if _worker_load is None:
+        _worker_load = WorkerLoad()
+    return _worker_load
+
+
+def load_fnc(worker: Worker) -> float:
+    """WorkerOptions.load_fnc: the highest of the session, CPU, frame CPU and LLM request loads, from 0 to 1."""
+    worker_load = get_worker_load()
+    load = worker_load.update({job.job.id for job in worker.active_jobs})
+    logger.debug(f"Worker load {load:.2f}: {worker_load.components}")
+    return load
+
+
+async def request_fnc(request: JobRequest):
+    """WorkerOptions.request_fnc: decline rooms this worker has no room for, so they go elsewhere."""
+    reason = get_worker_load().admit()
+    if reason is not None:
+        logger.info(f"Declining room {request.room.name}: {reason}")
+        await request.reject()
+        return
+    await request.accept()